@@ -27,6 +27,9 @@ app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 限制上传文件大小为50MB
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['STORAGE_FOLDER'] = 'storage'  # 添加存储文件夹配置
+app.config['JOB_FOLDER'] = 'jobs'  # 异步转换任务的存储文件夹
+# 启动时是否在后台预热Docling模型，避免首个请求承担模型加载耗时
+app.config['DOCLING_WARMUP'] = os.environ.get('DOCLING_WARMUP', 'true').lower() in ['true', '1', 't', 'y', 'yes']
 
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -86,11 +89,35 @@ swagger_template = {
 # 初始化Swagger
 swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
+# 每个请求开始时清空转换元数据（如缓存命中情况）
+from app.utils import conversion_context
+app.before_request(conversion_context.reset)
+# 记录每个请求的耗时、响应大小和进行中请求数
+from app.utils import instrumentation
+instrumentation.init_app(app)
+# 每个请求结束时删除本次请求暂存的上传文件
+from app.utils import upload_storage
+app.teardown_request(upload_storage.cleanup_request_uploads)
+
 # 导入路由模块
-from app.routes import basic_routes, api_routes, docling_routes, web_routes
+from app.routes import basic_routes, api_routes, docling_routes, web_routes, job_routes, artifact_routes
 
 # 注册蓝图
 app.register_blueprint(basic_routes.bp)
 app.register_blueprint(api_routes.bp, url_prefix='/api')
 app.register_blueprint(docling_routes.bp)
-app.register_blueprint(web_routes.bp) 
\ No newline at end of file
+app.register_blueprint(web_routes.bp)
+app.register_blueprint(job_routes.bp, url_prefix='/api')
+app.register_blueprint(artifact_routes.bp, url_prefix='/api')
+
+# 批量转换进程（forkserver/spawn启动）导入转换函数时也会导入本包，只有服务进程启动任务队列和预热
+import multiprocessing
+if multiprocessing.parent_process() is None:
+    # 启动异步转换任务队列，并恢复worker重启前未完成的任务
+    from app.utils.job_queue import job_queue
+    job_queue.start(app.config['JOB_FOLDER'])
+
+    # 预热Docling转换器池（每个gunicorn worker导入应用时各执行一次）
+    if app.config['DOCLING_WARMUP']:
+        from app.utils.docling_pool import docling_pool
+        docling_pool.warmup_async()
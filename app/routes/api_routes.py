@@ -1,7 +1,7 @@
 """
 API路由模块，包含基本文档转换的API接口
 """
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, url_for
 import os
 import traceback
 import time
@@ -17,10 +17,22 @@ from app.utils.converters import (
     convert_pdf, 
     convert_txt, 
     convert_md,
-    convert_to_markdown
+    convert_to_markdown,
+    write_xlsx_text,
+    iter_text_parts,
+    iter_markdown_parts
 )
 from app.utils.url_converter import URLConverter
-from app.utils.common import cleanup_temp_file
+from app.utils.upload_storage import stage_upload
+from app.utils import conversion_context
+from app.utils.selection import parse_selection, SelectionError
+from app.utils.streaming import stream_conversion, STREAM_MODES
+from app.utils.engine_registry import engine_registry
+from app.utils.batch_converter import BatchConverter, BATCH_TARGET_FORMATS
+from app.utils.job_queue import job_queue, JobQueueFull, JOB_BATCH_FORMAT
+from app.utils.docling_pool import docling_pool
+from app.utils.document_cache import document_cache
+from app.utils.admission import docling_admission
 
 # 创建API蓝图
 bp = Blueprint('api', __name__)
@@ -47,29 +59,46 @@ def api_convert():
     
     logger.info(f"API调用：接收到文件: {filename}, 类型: {file_ext}")
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # 流式响应模式：ndjson或raw，未指定时返回完整JSON
+    stream_mode = request.form.get('stream', '').lower()
+    if stream_mode and stream_mode not in STREAM_MODES:
+        return jsonify({'error': f"不支持的流式模式: {stream_mode}，支持的模式为：{'、'.join(STREAM_MODES)}"}), 400
+    
+    # 转换范围：PDF页码、幻灯片序号或工作表，未选中的部分不解析也不进行OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext)
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用：文件大小: {file_size / 1024:.2f} KB")
         
+        if stream_mode:
+            logger.info(f"API调用：以{stream_mode}模式流式转换文件: {filename}")
+            try:
+                parts = iter_text_parts(file_path, **selection)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            # 暂存的上传文件在响应发送完毕后删除
+            return stream_conversion(parts, stream_mode, filename, file_size, start_time)
+        
         # 根据文件类型调用相应的转换函数
         if file_ext in ['.doc', '.docx']:
             logger.info(f"API调用：开始转换Word文档: {filename}")
             text = convert_docx(file_path)
         elif file_ext in ['.xls', '.xlsx']:
             logger.info(f"API调用：开始转换Excel文件: {filename}")
-            text = convert_xlsx(file_path)
+            text = convert_xlsx(file_path, **selection)
         elif file_ext in ['.ppt', '.pptx']:
             logger.info(f"API调用：开始转换PowerPoint文件: {filename}")
-            text = convert_pptx(file_path)
+            text = convert_pptx(file_path, **selection)
         elif file_ext == '.pdf':
             logger.info(f"API调用：开始转换PDF文件: {filename}")
-            text = convert_pdf(file_path)
+            text = convert_pdf(file_path, **selection)
         elif file_ext == '.txt':
             logger.info(f"API调用：开始转换文本文件: {filename}")
             text = convert_txt(file_path)
@@ -83,32 +112,31 @@ def api_convert():
             error_msg = f"不支持的文件类型: {file_ext}"
             logger.warning(f"API调用：{error_msg}")
             
-            # 删除临时文件
-            cleanup_temp_file(file_path, "API调用：")
-            
             return jsonify({'error': error_msg}), 400
         
         processing_time = time.time() - start_time
         logger.info(f"API调用：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用：")
-        
         # 返回API响应
         return jsonify({
             'text': text,
             'filename': filename,
             'file_size': file_size,
-            'processing_time': round(processing_time, 2)
+            'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'pdf_pages': conversion_context.get('pdf_pages'),
+            'xlsx': conversion_context.get('xlsx'),
+            'image_ocr': conversion_context.get('image_ocr'),
+            'selection': selection or None
         })
+    except SelectionError as e:
+        logger.warning(f"API调用：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -136,48 +164,63 @@ def api_convert_md():
     
     logger.info(f"API调用(转MD)：接收到文件: {filename}, 类型: {file_ext}")
     
+    # 流式响应模式：ndjson或raw，未指定时返回完整JSON
+    stream_mode = request.form.get('stream', '').lower()
+    if stream_mode and stream_mode not in STREAM_MODES:
+        return jsonify({'error': f"不支持的流式模式: {stream_mode}，支持的模式为：{'、'.join(STREAM_MODES)}"}), 400
+    
     # 检查文件扩展名
     supported_extensions = ['.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.pdf', '.txt', '.md', '.mp3', '.wav']
     if file_ext not in supported_extensions:
         logger.warning(f"API调用(转MD)：不支持的文件格式: {file_ext}")
         return jsonify({'error': f'不支持的文件格式: {file_ext}'}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # 转换范围：PDF页码、幻灯片序号或工作表，未选中的部分不解析也不进行OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(转MD)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext)
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(转MD)：文件大小: {file_size / 1024:.2f} KB")
         
+        if stream_mode:
+            logger.info(f"API调用(转MD)：以{stream_mode}模式流式转换文件: {filename}")
+            # 暂存的上传文件在响应发送完毕后删除
+            return stream_conversion(
+                iter_markdown_parts(file_path, **selection), stream_mode, filename, file_size, start_time,
+                raw_mimetype='text/markdown'
+            )
+        
         # 使用MarkItDown转换为Markdown
         logger.info(f"API调用(转MD)：开始将文件转换为Markdown: {filename}")
-        markdown_text = convert_to_markdown(file_path)
+        markdown_text = convert_to_markdown(file_path, **selection)
         
         processing_time = time.time() - start_time
         logger.info(f"API调用(转MD)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(转MD)：")
-        
         # 返回API响应
         return jsonify({
             'text': markdown_text,
             'filename': filename,
             'file_size': file_size,
             'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'selection': selection or None,
             'converter': 'docling'
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(转MD)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(转MD)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(转MD)：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -220,29 +263,37 @@ def api_convert_file():
     
     logger.info(f"API调用(保存文本)：接收到文件: {filename}, 类型: {file_ext}")
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # 转换范围：PDF页码、幻灯片序号或工作表，未选中的部分不解析也不进行OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(保存文本)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext)
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(保存文本)：文件大小: {file_size / 1024:.2f} KB")
         
+        output_filename = os.path.splitext(filename)[0] + '.txt'
+        output_path = os.path.join(output_dir, output_filename)
+        
         # 根据文件类型调用相应的转换函数
         if file_ext in ['.doc', '.docx']:
             logger.info(f"API调用(保存文本)：开始转换Word文档: {filename}")
             text = convert_docx(file_path)
         elif file_ext in ['.xls', '.xlsx']:
             logger.info(f"API调用(保存文本)：开始转换Excel文件: {filename}")
-            text = convert_xlsx(file_path)
+            # 表格可能有数十万行，逐行流式写入输出文件，不在内存中拼接完整文本
+            write_xlsx_text(file_path, output_path, **selection)
+            text = None
         elif file_ext in ['.ppt', '.pptx']:
             logger.info(f"API调用(保存文本)：开始转换PowerPoint文件: {filename}")
-            text = convert_pptx(file_path)
+            text = convert_pptx(file_path, **selection)
         elif file_ext == '.pdf':
             logger.info(f"API调用(保存文本)：开始转换PDF文件: {filename}")
-            text = convert_pdf(file_path)
+            text = convert_pdf(file_path, **selection)
         elif file_ext == '.txt':
             logger.info(f"API调用(保存文本)：开始读取文本文件: {filename}")
             text = convert_txt(file_path)
@@ -256,41 +307,38 @@ def api_convert_file():
             error_msg = f"不支持的文件类型: {file_ext}"
             logger.warning(f"API调用(保存文本)：{error_msg}")
             
-            # 删除临时文件
-            cleanup_temp_file(file_path, "API调用(保存文本)：")
-            
             return jsonify({'error': error_msg}), 400
         
         # 保存转换后的文本到输出目录
-        output_filename = os.path.splitext(filename)[0] + '.txt'
-        output_path = os.path.join(output_dir, output_filename)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+        if text is not None:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(text)
         
         logger.info(f"API调用(保存文本)：文本已保存到: {output_path}")
         
         processing_time = time.time() - start_time
         logger.info(f"API调用(保存文本)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(保存文本)：")
-        
         # 返回API响应
         return jsonify({
             'output_path': output_path,
             'filename': filename,
             'file_size': file_size,
-            'processing_time': round(processing_time, 2)
+            'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'pdf_pages': conversion_context.get('pdf_pages'),
+            'xlsx': conversion_context.get('xlsx'),
+            'image_ocr': conversion_context.get('image_ocr'),
+            'selection': selection or None
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(保存文本)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(保存文本)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(保存文本)：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -339,19 +387,22 @@ def api_convert_md_file():
         logger.warning(f"API调用(保存MD)：不支持的文件格式: {file_ext}")
         return jsonify({'error': f'不支持的文件格式: {file_ext}'}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # 转换范围：PDF页码、幻灯片序号或工作表，未选中的部分不解析也不进行OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(保存MD)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext)
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(保存MD)：文件大小: {file_size / 1024:.2f} KB")
         
         # 使用MarkItDown转换为Markdown
         logger.info(f"API调用(保存MD)：开始将文件转换为Markdown: {filename}")
-        markdown_text = convert_to_markdown(file_path)
+        markdown_text = convert_to_markdown(file_path, **selection)
         
         # 保存转换后的Markdown到输出目录
         output_filename = os.path.splitext(filename)[0] + '.md'
@@ -365,24 +416,23 @@ def api_convert_md_file():
         processing_time = time.time() - start_time
         logger.info(f"API调用(保存MD)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(保存MD)：")
-        
         # 返回API响应
         return jsonify({
             'output_path': output_path,
             'filename': filename,
             'file_size': file_size,
-            'processing_time': round(processing_time, 2)
+            'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'selection': selection or None
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(保存MD)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(保存MD)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(保存MD)：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -525,4 +575,98 @@ def api_convert_url_to_md_file():
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
-        }), 500 
\ No newline at end of file
+        }), 500
+
+
+# API：批量转换文件并保存到指定目录
+@bp.route('/batch/convert', methods=['POST'])
+@swag_from('../../swagger_docs/batch_convert.yml')
+def api_batch_convert():
+    files = [f for f in request.files.getlist('files') if f.filename]
+    archive = request.files.get('archive')
+    if archive is not None and not archive.filename:
+        archive = None
+
+    if not files and archive is None:
+        logger.warning("API调用(批量转换)：没有文件上传")
+        return jsonify({'error': '没有文件上传，请通过files上传多个文件或通过archive上传zip压缩包'}), 400
+
+    if 'output_dir' not in request.form:
+        logger.warning("API调用(批量转换)：未指定输出目录")
+        return jsonify({'error': '未指定输出目录'}), 400
+
+    output_dir = request.form['output_dir']
+    target_format = request.form.get('format', 'md').lower()
+    if target_format not in BATCH_TARGET_FORMATS:
+        return jsonify({'error': f"不支持的目标格式: {target_format}，支持的格式为：{'、'.join(BATCH_TARGET_FORMATS)}"}), 400
+
+    try:
+        concurrency = int(request.form['concurrency']) if request.form.get('concurrency') else None
+    except ValueError:
+        return jsonify({'error': 'concurrency必须为整数'}), 400
+
+    # 批量转换耗时可能超过请求超时时间，暂存文件后作为异步任务提交，客户端轮询任务状态或清单文件
+    try:
+        job_id = job_queue.reserve()
+    except JobQueueFull as e:
+        logger.warning(f"API调用(批量转换)：{str(e)}")
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+
+    batch = BatchConverter(job_queue.job_dir(job_id), output_dir, target_format, concurrency, batch_id=job_id)
+    try:
+        for file in files:
+            batch.add_upload(file)
+        if archive is not None:
+            batch.add_archive(archive)
+        batch.save()
+    except ValueError as e:
+        job_queue.discard(job_id)
+        logger.warning(f"API调用(批量转换)：{str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        job_queue.discard(job_id)
+        logger.error(f"API调用(批量转换)：保存上传文件失败: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': str(e),
+            'details': traceback.format_exc()
+        }), 500
+
+    logger.info(f"API调用(批量转换)：接收到 {batch.file_count} 个待转换文件，输出目录: {output_dir}")
+
+    try:
+        filename = archive.filename if archive is not None else f"{batch.file_count} 个文件"
+        job = job_queue.enqueue(job_id, JOB_BATCH_FORMAT, filename, batch.staging_dir, output_dir=output_dir)
+        return jsonify({
+            'batch_id': batch.batch_id,
+            'job_id': job['id'],
+            'status': job['status'],
+            'total': batch.file_count,
+            'output_dir': output_dir,
+            'manifest_path': batch.manifest_path,
+            'status_url': url_for('jobs.api_get_job', job_id=job['id']),
+            'result_url': url_for('jobs.api_get_job_result', job_id=job['id'])
+        }), 202
+    except JobQueueFull as e:
+        logger.warning(f"API调用(批量转换)：{str(e)}")
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"API调用(批量转换)：提交任务失败: {error_msg}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': error_msg,
+            'details': traceback.format_exc()
+        }), 500
+
+# API：查看当前worker进程中转换引擎的初始化情况
+@bp.route('/engines', methods=['GET'])
+@swag_from('../../swagger_docs/engines.yml')
+def api_engines():
+    return jsonify({
+        'pid': os.getpid(),
+        'engines': engine_registry.stats(),
+        'docling_pool': docling_pool.stats(),
+        'document_cache': document_cache.stats(),
+        'docling_admission': docling_admission.stats()
+    })
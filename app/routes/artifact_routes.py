@@ -0,0 +1,64 @@
+"""
+Docling中间结果路由模块，提供查看和删除已保存的DoclingDocument中间结果的API接口
+"""
+from flask import Blueprint, request, jsonify
+import traceback
+from flasgger import swag_from
+
+from app import logger
+from app.utils.artifact_store import artifact_store
+
+# 创建Docling中间结果蓝图
+bp = Blueprint('artifacts', __name__)
+
+# API：列出Docling中间结果
+@bp.route('/artifacts', methods=['GET'])
+@swag_from('../../swagger_docs/list_artifacts.yml')
+def api_list_artifacts():
+    content_hash = request.args.get('content_hash', '').strip().lower() or None
+    try:
+        artifacts = artifact_store.list(content_hash)
+        return jsonify({
+            'artifacts': artifacts,
+            'count': len(artifacts),
+            'store': artifact_store.stats()
+        })
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"API调用(中间结果)：列出中间结果失败: {error_msg}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': error_msg,
+            'details': traceback.format_exc()
+        }), 500
+
+# API：删除指定内容哈希的全部Docling中间结果
+@bp.route('/artifacts', methods=['DELETE'])
+@swag_from('../../swagger_docs/delete_artifacts.yml')
+def api_delete_artifacts():
+    content_hash = request.args.get('content_hash', '').strip().lower()
+    if not content_hash:
+        return jsonify({'error': '未指定content_hash'}), 400
+    try:
+        deleted = [artifact['id'] for artifact in artifact_store.list(content_hash) if artifact_store.delete(artifact['id'])]
+        logger.info(f"API调用(中间结果)：删除内容 {content_hash} 的 {len(deleted)} 个中间结果")
+        return jsonify({'content_hash': content_hash, 'deleted': deleted, 'count': len(deleted)})
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"API调用(中间结果)：删除中间结果失败: {error_msg}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': error_msg,
+            'details': traceback.format_exc()
+        }), 500
+
+# API：删除单个Docling中间结果
+@bp.route('/artifacts/<artifact_id>', methods=['DELETE'])
+@swag_from('../../swagger_docs/delete_artifact.yml')
+def api_delete_artifact(artifact_id):
+    if not artifact_store.is_valid_id(artifact_id):
+        return jsonify({'error': f'无效的中间结果ID: {artifact_id}'}), 400
+    if not artifact_store.delete(artifact_id):
+        return jsonify({'error': f'中间结果不存在: {artifact_id}'}), 404
+    logger.info(f"API调用(中间结果)：已删除中间结果: {artifact_id}")
+    return jsonify({'id': artifact_id, 'deleted': True})
@@ -1,9 +1,11 @@
 """
 基础路由模块，包含网站基本页面的路由
 """
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, Response
+from flasgger import swag_from
 import os
 from app import logger
+from app.utils import instrumentation
 
 # 创建蓝图
 bp = Blueprint('basic', __name__)
@@ -36,4 +38,10 @@ def api_docs():
 def about_page():
     """关于页面路由"""
     logger.info("访问关于页面")
-    return render_template('about.html') 
\ No newline at end of file
+    return render_template('about.html')
+
+@bp.route('/metrics')
+@swag_from('../../swagger_docs/metrics.yml')
+def metrics():
+    """Prometheus指标路由，汇总所有worker进程的指标"""
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -3,20 +3,33 @@ Docling API路由模块，包含Docling相关的文档转换API接口
 """
 from flask import Blueprint, render_template, request, jsonify
 import os
+import shutil
 import traceback
 import time
-import re
 from datetime import datetime
 from flasgger import swag_from
 
 from app import logger, app
-from app.utils.converter_factory import converter_factory
-from app.utils.common import cleanup_temp_file
+from app.utils.converter_factory import converter_factory, DOCLING_OUTPUT_FORMATS, DOCLING_TABLE_FORMATS
+from app.utils.upload_storage import stage_upload
+from app.utils import conversion_context
+from app.utils.selection import parse_selection, SelectionError
 from app.utils.converters import convert_to_markdown
+from app.utils.admission import AdmissionRejected
+from app.utils.result_cache import content_hash
+from app.utils import image_export
 
 # 创建Docling API蓝图
 bp = Blueprint('docling', __name__)
 
+def admission_rejected_response(e):
+    """
+    Docling准入控制拒绝时的响应：所有worker合计同时进行的Docling推理数量受限（名额只在实际推理时占用），
+    等待队列已满时返回429，等待超时时返回503，响应均带Retry-After
+    """
+    logger.warning(f"Docling准入控制拒绝请求 {request.path}: {str(e)}")
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), e.status_code, {'Retry-After': str(e.retry_after)}
+
 # Docling转换为Markdown
 @bp.route('/convert-to-md-docling', methods=['POST'])
 def convert_md_docling_route():
@@ -47,14 +60,11 @@ def convert_md_docling_route():
         logger.warning(f"Docling不支持的文件格式: {file_ext}")
         return jsonify({'error': f'Docling不支持的文件格式: {file_ext}'}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        file.save(file_path)
-        logger.info(f"文件保存成功(Docling转MD): {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"文件大小(Docling转MD): {file_size / 1024:.2f} KB")
         
         # 使用Docling转换为Markdown
@@ -65,20 +75,16 @@ def convert_md_docling_route():
         text_length = len(markdown_text)
         logger.info(f"文件使用Docling转换为Markdown成功, 文本长度: {text_length} 字符")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "Docling转MD：")
-        
-        return jsonify({'text': markdown_text})
+        return jsonify({'text': markdown_text, 'cache': conversion_context.get('cache')})
 
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         # 详细记录异常信息
         error_msg = str(e)
         logger.error(f"Docling转换为Markdown失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path, "Docling转MD：")
-        
         return jsonify({
             'error': f'Docling转换为Markdown失败: {error_msg}', 
             'details': traceback.format_exc()
@@ -118,42 +124,46 @@ def api_convert_md_docling():
         logger.warning(f"API调用(Docling)：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # PDF页码范围，Docling只对选中的页面进行版面分析和OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(Docling)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext, allowed={'pages'})
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(Docling)：文件大小: {file_size / 1024:.2f} KB")
         
         # 使用Docling转换为Markdown
         logger.info(f"API调用(Docling)：开始转换文件: {filename}")
-        markdown_text = docling_converter.convert_to_markdown(file_path)
+        markdown_text = docling_converter.convert_to_markdown(file_path, **selection)
         
         processing_time = time.time() - start_time
         logger.info(f"API调用(Docling)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling)：")
-        
         # 返回API响应
         return jsonify({
             'text': markdown_text,
             'filename': filename,
             'file_size': file_size,
             'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'selection': selection or None,
             'converter': 'docling'
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(Docling)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(Docling)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling)：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -193,41 +203,139 @@ def api_convert_html_docling():
         logger.warning(f"API调用(Docling HTML)：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # PDF页码范围，Docling只对选中的页面进行版面分析和OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(Docling HTML)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext, allowed={'pages'})
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(Docling HTML)：文件大小: {file_size / 1024:.2f} KB")
         
         # 使用Docling转换为HTML
         logger.info(f"API调用(Docling HTML)：开始转换文件: {filename}")
-        html_content = docling_converter.convert_to_html(file_path)
+        html_content = docling_converter.convert_to_html(file_path, **selection)
         
         processing_time = time.time() - start_time
         logger.info(f"API调用(Docling HTML)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling HTML)：")
-        
         # 返回API响应
         return jsonify({
             'html': html_content,
             'filename': filename,
             'file_size': file_size,
             'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'selection': selection or None,
             'converter': 'docling'
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(Docling HTML)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(Docling HTML)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling HTML)：")
+        return jsonify({
+            'error': error_msg,
+            'details': traceback.format_exc()
+        }), 500
+
+# API：使用Docling一次转换导出多种格式
+@bp.route('/api/convert-multi-docling', methods=['POST'])
+@swag_from('../../swagger_docs/convert_multi_docling.yml')
+def api_convert_multi_docling():
+    start_time = time.time()
+    
+    if 'file' not in request.files:
+        logger.warning("API调用(Docling多格式)：没有文件上传")
+        return jsonify({'error': '没有文件上传'}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        logger.warning("API调用(Docling多格式)：未选择文件")
+        return jsonify({'error': '未选择文件'}), 400
+    
+    # 获取输出格式，默认导出Markdown、HTML、JSON和表格，按固定顺序排列以共用结果缓存
+    requested_formats = {fmt.strip() for fmt in request.form.get('formats', 'md,html,json,tables').lower().split(',') if fmt.strip()}
+    unknown_formats = requested_formats - set(DOCLING_OUTPUT_FORMATS)
+    if unknown_formats or not requested_formats:
+        return jsonify({'error': f"不支持的输出格式: {'、'.join(sorted(unknown_formats)) or '空'}，支持的格式为：{'、'.join(DOCLING_OUTPUT_FORMATS)}"}), 400
+    formats = [fmt for fmt in DOCLING_OUTPUT_FORMATS if fmt in requested_formats]
+    
+    # 表格的导出格式，默认全部导出
+    table_formats = request.form.get('export_formats', 'md,csv,html').lower().split(',')
+    table_formats = [fmt for fmt in DOCLING_TABLE_FORMATS if fmt in {f.strip() for f in table_formats}]
+    if 'tables' in formats and not table_formats:
+        return jsonify({'error': f"未指定有效的表格导出格式，支持的格式为：{'、'.join(DOCLING_TABLE_FORMATS)}"}), 400
+    
+    # 获取文件扩展名
+    filename = file.filename
+    file_ext = os.path.splitext(filename)[1].lower()
+    
+    logger.info(f"API调用(Docling多格式)：接收到文件: {filename}, 类型: {file_ext}, 输出格式: {formats}")
+    
+    # 获取docling转换器
+    docling_converter = converter_factory.get_converter('docling')
+    if not hasattr(docling_converter, 'is_available') or not docling_converter.is_available:
+        logger.error("API调用(Docling多格式)：Docling转换器不可用")
+        return jsonify({'error': 'Docling转换器不可用，请确认已安装docling库'}), 500
+    
+    # 检查文件扩展名是否支持
+    if not docling_converter.is_format_supported(file_ext):
+        error_msg = f"Docling不支持的文件类型: {file_ext}"
+        logger.warning(f"API调用(Docling多格式)：{error_msg}")
+        return jsonify({'error': error_msg}), 400
+    
+    # PDF页码范围，Docling只对选中的页面进行版面分析和OCR
+    try:
+        selection = parse_selection(request.form, file_ext, allowed={'pages'})
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
+        logger.info(f"API调用(Docling多格式)：文件大小: {file_size / 1024:.2f} KB")
+        
+        # 只解析一次，从同一个文档导出全部格式
+        logger.info(f"API调用(Docling多格式)：开始转换文件: {filename}")
+        outputs = docling_converter.convert_to_formats(file_path, formats, table_formats, **selection)
+        
+        processing_time = time.time() - start_time
+        logger.info(f"API调用(Docling多格式)：文件转换完成，耗时: {processing_time:.2f}秒")
+        
+        # 返回API响应
+        return jsonify({
+            'outputs': outputs,
+            'formats': formats,
+            'filename': filename,
+            'file_size': file_size,
+            'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'document_cache': conversion_context.get('document_cache'),
+            'selection': selection or None,
+            'converter': 'docling'
+        })
+    except SelectionError as e:
+        logger.warning(f"API调用(Docling多格式)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"API调用(Docling多格式)：转换失败: {error_msg}")
+        logger.error(traceback.format_exc())
         
         return jsonify({
             'error': error_msg,
@@ -283,19 +391,22 @@ def api_convert_md_file_docling():
         logger.warning(f"API调用(Docling保存)：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # PDF页码范围，Docling只对选中的页面进行版面分析和OCR
     try:
-        file.save(file_path)
-        logger.info(f"API调用(Docling保存)：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        selection = parse_selection(request.form, file_ext, allowed={'pages'})
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(Docling保存)：文件大小: {file_size / 1024:.2f} KB")
         
         # 使用Docling转换为Markdown
         logger.info(f"API调用(Docling保存)：开始转换文件: {filename}")
-        markdown_text = docling_converter.convert_to_markdown(file_path)
+        markdown_text = docling_converter.convert_to_markdown(file_path, **selection)
         
         # 保存转换后的Markdown到输出目录
         output_filename = os.path.splitext(filename)[0] + '.md'
@@ -309,25 +420,26 @@ def api_convert_md_file_docling():
         processing_time = time.time() - start_time
         logger.info(f"API调用(Docling保存)：文件转换完成，耗时: {processing_time:.2f}秒")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling保存)：")
-        
         # 返回API响应
         return jsonify({
             'output_path': output_path,
             'filename': filename,
             'file_size': file_size,
             'processing_time': round(processing_time, 2),
+            'cache': conversion_context.get('cache'),
+            'selection': selection or None,
             'converter': 'docling'
         })
+    except SelectionError as e:
+        logger.warning(f"API调用(Docling保存)：转换范围无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         error_msg = str(e)
         logger.error(f"API调用(Docling保存)：转换失败: {error_msg}")
         logger.error(traceback.format_exc())
         
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path, "API调用(Docling保存)：")
-        
         return jsonify({
             'error': error_msg,
             'details': traceback.format_exc()
@@ -371,186 +483,94 @@ def convert_to_md_images_file_docling():
         logger.warning(f"Docling图片导出{execution_id}：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    # 创建保存图片的静态目录
-    static_img_dir = os.path.join('app', 'static', 'images', 'exported', execution_id)
-    static_img_url_path = f"{host_url}/static/images/exported/{execution_id}"
+    try:
+        image_options = image_export.parse_image_options(request.form)
+    except ValueError as e:
+        logger.warning(f"Docling图片导出{execution_id}：{str(e)}")
+        return jsonify({'error': str(e)}), 400
     
     try:
-        file.save(file_path)
-        logger.info(f"Docling图片导出{execution_id}：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"Docling图片导出{execution_id}：文件大小: {file_size / 1024:.2f} KB")
         
-        # 创建静态图片目录
-        if not os.path.exists(static_img_dir):
-            os.makedirs(static_img_dir, exist_ok=True)
-            logger.info(f"Docling图片导出{execution_id}：创建静态图片目录: {static_img_dir}")
+        # 静态图片目录以文件内容和导出选项的哈希命名，相同的请求直接复用已导出的图片
+        export_id = image_export.export_key(content_hash(file_path), image_options)
+        static_root = os.path.join('app', 'static', 'images', 'exported')
+        static_img_dir = os.path.join(static_root, export_id)
+        static_img_url_path = f"{host_url}/static/images/exported/{export_id}"
+        
+        manifest = image_export.load_manifest(static_img_dir)
+        if manifest is not None:
+            with open(os.path.join(static_img_dir, manifest['md_file']), 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+            # 保存的Markdown中是导出时的访问地址，替换为当前请求的主机地址
+            if manifest['url_path'] != static_img_url_path:
+                markdown_text = markdown_text.replace(manifest['url_path'], static_img_url_path)
+            
+            processing_time = time.time() - start_time
+            logger.info(f"Docling图片导出{execution_id}：复用已导出的结果 {export_id}，耗时: {processing_time:.2f}秒")
+            return jsonify({
+                'text': markdown_text,
+                'processing_time': round(processing_time, 2),
+                'converter': 'docling',
+                'page_count': manifest['page_count'],
+                'table_count': manifest['table_count'],
+                'picture_count': manifest['picture_count'],
+                'export_id': export_id,
+                'image_options': image_options,
+                'cache': 'hit'
+            })
+        
+        # 先导出到临时目录，完成后整体重命名，其他请求不会读取到导出了一半的目录
+        os.makedirs(static_root, exist_ok=True)
+        temp_dir = image_export.staging_dir(static_img_dir)
         
         # 使用Docling处理文件
         try:
-            from docling.document_converter import DocumentConverter
-            from docling.datamodel.pipeline_options import PdfPipelineOptions
-            from docling.datamodel.base_models import InputFormat, FigureElement
-            from docling.document_converter import PdfFormatOption
-            from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
-            
-            # 设置Docling选项，启用图片导出
-            IMAGE_RESOLUTION_SCALE = 2.0
-            pipeline_options = PdfPipelineOptions()
-            pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
-            pipeline_options.generate_page_images = True
-            pipeline_options.generate_picture_images = True
-            
-            # 创建通用格式选项
-            format_options = {}
-            
-            # 根据文件类型添加适当的格式选项
-            if file_ext.lower() in ['.pdf']:
-                format_options[InputFormat.PDF] = PdfFormatOption(pipeline_options=pipeline_options)
-            # 对于其他格式，不设置特定选项，使用Docling默认设置
-            
-            doc_converter = DocumentConverter(format_options=format_options)
-            
             logger.info(f"Docling图片导出{execution_id}：开始转换文件并导出图片")
-            doc_converter = DocumentConverter(
-                format_options={
-                    InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-                }
-            )
-            
-            logger.info(f"Docling图片导出{execution_id}：开始转换文件并导出图片")
-            
-            # 转换文件
-            conv_res = doc_converter.convert(file_path)
-            doc_filename = conv_res.input.file.stem
-            
-            # 保存Markdown文件
-            md_filename_full = os.path.join(static_img_dir, f"{doc_filename}.md")
-            
-            # 先使用独立引用模式保存原始的markdown
-            conv_res.document.save_as_markdown(md_filename_full, image_mode=ImageRefMode.REFERENCED)
-            logger.info(f"Docling图片导出{execution_id}：Markdown已保存到: {md_filename_full}")
             
-            # 计数器
-            page_counter = 0
-            table_counter = 0
-            picture_counter = 0
+            # 转换文件并将Markdown和图片导出到临时目录
+            export_result = docling_converter.export_images(file_path, temp_dir, base_filename, image_options)
+            md_filename_full = export_result['md_path']
             
-            # 保存页面图片
-            page_image_paths = []
-            page_image_urls = []
-            for page_no, page in conv_res.document.pages.items():
-                page_no = page.page_no
-                page_image_filename = f"{doc_filename}-page-{page_no}.png"
-                page_image_path = os.path.join(static_img_dir, page_image_filename)
-                page_image_url = f"{static_img_url_path}/{page_image_filename}"
-                
-                try:
-                    if hasattr(page, 'image') and page.image is not None and hasattr(page.image, 'pil_image') and page.image.pil_image is not None:
-                        with open(page_image_path, 'wb') as fp:
-                            page.image.pil_image.save(fp, format="PNG")
-                        page_image_paths.append(page_image_path)
-                        page_image_urls.append(page_image_url)
-                        page_counter += 1
-                        logger.info(f"Docling图片导出{execution_id}：页面图片已保存: {page_image_path}")
-                    else:
-                        logger.warning(f"Docling图片导出{execution_id}：页面 {page_no} 没有可用的图片")
-                except Exception as e:
-                    logger.warning(f"Docling图片导出{execution_id}：保存页面 {page_no} 图片时出错: {str(e)}")
+            # 计算各图片对应的访问URL
+            def to_static_url(path):
+                return f"{static_img_url_path}/{os.path.basename(path)}"
             
-            # 保存图片和表格
-            table_image_paths = []
-            table_image_urls = []
-            picture_image_paths = []
-            picture_image_urls = []
-            
-            for element, _level in conv_res.document.iterate_items():
-                if isinstance(element, TableItem):
-                    try:
-                        image = element.get_image(conv_res.document)
-                        if image is not None:
-                            table_counter += 1  # 只有当成功获取图片时才增加计数
-                            table_image_filename = f"{doc_filename}-table-{table_counter}.png"
-                            table_image_path = os.path.join(static_img_dir, table_image_filename)
-                            table_image_url = f"{static_img_url_path}/{table_image_filename}"
-                            
-                            with open(table_image_path, 'wb') as fp:
-                                image.save(fp, "PNG")
-                            table_image_paths.append(table_image_path)
-                            table_image_urls.append(table_image_url)
-                            logger.info(f"Docling图片导出{execution_id}：表格图片已保存: {table_image_path}")
-                        else:
-                            logger.warning(f"Docling图片导出{execution_id}：无法获取表格图片，图片为None")
-                    except Exception as e:
-                        logger.warning(f"Docling图片导出{execution_id}：处理表格图片时出错: {str(e)}")
-                
-                if isinstance(element, PictureItem):
-                    try:
-                        image = element.get_image(conv_res.document)
-                        if image is not None:
-                            picture_counter += 1  # 只有当成功获取图片时才增加计数
-                            picture_image_filename = f"{doc_filename}-picture-{picture_counter}.png"
-                            picture_image_path = os.path.join(static_img_dir, picture_image_filename)
-                            picture_image_url = f"{static_img_url_path}/{picture_image_filename}"
-                            
-                            with open(picture_image_path, 'wb') as fp:
-                                image.save(fp, "PNG")
-                            picture_image_paths.append(picture_image_path)
-                            picture_image_urls.append(picture_image_url)
-                            logger.info(f"Docling图片导出{execution_id}：图片已保存: {picture_image_path}")
-                        else:
-                            logger.warning(f"Docling图片导出{execution_id}：无法获取图片，图片为None")
-                    except Exception as e:
-                        logger.warning(f"Docling图片导出{execution_id}：处理图片时出错: {str(e)}")
+            table_image_paths = export_result['table_images']
+            picture_image_paths = export_result['picture_images']
+            picture_image_urls = [to_static_url(path) for path in picture_image_paths]
+            page_counter = export_result['page_count']
+            table_counter = len(table_image_paths)
+            picture_counter = len(picture_image_paths)
             
             # 读取原始Markdown内容
             with open(md_filename_full, 'r', encoding='utf-8') as f:
                 markdown_text = f.read()
             
-            # 将相对路径替换为完整URL路径
-            # 提取artifacts文件夹名
-            artifacts_dir = f"{doc_filename}_artifacts"
-            
-            # 替换 ![Image](artifacts_dir/imagename.png) 模式的图片路径
-            pattern = r'!\[([^\]]*)\]\((' + re.escape(artifacts_dir) + r'[^)]+)\)'
-            replacement = r'![\1](' + static_img_url_path + r'/\2)'
-            
-            markdown_text = re.sub(pattern, replacement, markdown_text)
-
-            # 修复带有 backslashes 的 Windows 风格路径
-            def replace_with_forward_slash(match):
-                path = match.group(1)
-                return '![Image](' + path.replace('\\', '/') + ')'
-            
-            # 匹配图片链接中的路径并替换反斜杠
-            markdown_text = re.sub(r'!\[Image\]\(([^)]+)\)', replace_with_forward_slash, markdown_text)
-            
-            # 替换页面图片路径
-            for i, path in enumerate(page_image_paths):
-                markdown_text = markdown_text.replace(path, page_image_urls[i])
-            
-            # 替换表格图片路径
-            for i, path in enumerate(table_image_paths):
-                markdown_text = markdown_text.replace(path, table_image_urls[i])
-            
-            # 替换普通图片路径
-            for i, path in enumerate(picture_image_paths):
-                markdown_text = markdown_text.replace(path, picture_image_urls[i])
+            # Markdown中的图片元素引用的是同目录下的文件名，替换为静态目录的访问地址
+            for path, url in zip(picture_image_paths, picture_image_urls):
+                markdown_text = markdown_text.replace(f"]({os.path.basename(path)})", f"]({url})")
             
             # 保存修改后的Markdown内容
             with open(md_filename_full, 'w', encoding='utf-8') as f:
                 f.write(markdown_text)
             
-            processing_time = time.time() - start_time
-            logger.info(f"Docling图片导出{execution_id}：处理完成，耗时: {processing_time:.2f}秒")
+            image_export.publish(temp_dir, static_img_dir, {
+                'md_file': os.path.basename(md_filename_full),
+                'url_path': static_img_url_path,
+                'page_count': page_counter,
+                'table_count': table_counter,
+                'picture_count': picture_counter,
+                'image_options': image_options,
+                'created_at': time.time()
+            })
             
-            # 删除临时文件
-            cleanup_temp_file(file_path, f"Docling图片导出{execution_id}：")
+            processing_time = time.time() - start_time
+            logger.info(f"Docling图片导出{execution_id}：处理完成，导出目录: {static_img_dir}，耗时: {processing_time:.2f}秒")
             
             # 返回处理结果
             return jsonify({
@@ -559,19 +579,25 @@ def convert_to_md_images_file_docling():
                 'converter': 'docling',
                 'page_count': page_counter,
                 'table_count': table_counter,
-                'picture_count': picture_counter
+                'picture_count': picture_counter,
+                'export_id': export_id,
+                'image_options': image_options,
+                'cache': 'miss'
             })
             
+        except AdmissionRejected as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return admission_rejected_response(e)
         except ImportError as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
             error_msg = f"Docling库导入错误: {str(e)}"
             logger.error(f"Docling图片导出{execution_id}：{error_msg}")
-            cleanup_temp_file(file_path, f"Docling图片导出{execution_id}：")
             return jsonify({'error': error_msg}), 500
         except Exception as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
             error_msg = f"Docling处理失败: {str(e)}"
             logger.error(f"Docling图片导出{execution_id}：{error_msg}")
             logger.error(traceback.format_exc())
-            cleanup_temp_file(file_path, f"Docling图片导出{execution_id}：")
             return jsonify({'error': error_msg, 'details': traceback.format_exc()}), 500
     
     except Exception as e:
@@ -579,9 +605,6 @@ def convert_to_md_images_file_docling():
         logger.error(f"Docling图片导出{execution_id}：{error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, f"Docling图片导出{execution_id}：")
-        
         return jsonify({'error': error_msg, 'details': traceback.format_exc()}), 500 
 @app.route('/api/convert-to-md-images-file-docling', methods=['POST'])
 @swag_from('../../swagger_docs/convert_to_md_images_file_docling.yml')
@@ -625,14 +648,17 @@ def api_convert_to_md_images_file_docling():
         logger.warning(f"API调用(Docling图片导出){execution_id}：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        file.save(file_path)
-        logger.info(f"API调用(Docling图片导出){execution_id}：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        image_options = image_export.parse_image_options(request.form)
+    except ValueError as e:
+        logger.warning(f"API调用(Docling图片导出){execution_id}：{str(e)}")
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(Docling图片导出){execution_id}：文件大小: {file_size / 1024:.2f} KB")
         
         # 检查输出目录是否存在，不存在则创建
@@ -643,112 +669,22 @@ def api_convert_to_md_images_file_docling():
             except Exception as e:
                 error_msg = f"无法创建输出目录: {str(e)}"
                 logger.error(f"API调用(Docling图片导出){execution_id}：{error_msg}")
-                
-                # 删除临时文件
-                try:
-                    os.remove(file_path)
-                    logger.info(f"API调用(Docling图片导出){execution_id}：临时文件已删除: {file_path}")
-                except Exception as del_e:
-                    logger.warning(f"API调用(Docling图片导出){execution_id}：无法删除临时文件: {file_path}, 原因: {str(del_e)}")
-                
                 return jsonify({'error': error_msg}), 500
         
         # 使用Docling处理文件
         try:
-            from docling.document_converter import DocumentConverter
-            from docling.datamodel.pipeline_options import PdfPipelineOptions
-            from docling.datamodel.base_models import InputFormat, FigureElement
-            from docling.document_converter import PdfFormatOption
-            from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
-            
-            # 设置Docling选项，启用图片导出
-            IMAGE_RESOLUTION_SCALE = 2.0
-            pipeline_options = PdfPipelineOptions()
-            pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
-            pipeline_options.generate_page_images = True
-            pipeline_options.generate_picture_images = True
-            
-            # 创建通用格式选项
-            format_options = {}
-            
-            # 根据文件类型添加适当的格式选项
-            if file_ext.lower() in ['.pdf']:
-                format_options[InputFormat.PDF] = PdfFormatOption(pipeline_options=pipeline_options)
-            # 对于其他格式，不设置特定选项，使用Docling默认设置
-            
-            doc_converter = DocumentConverter(format_options=format_options)
-            
-            logger.info(f"API调用(Docling图片导出){execution_id}：开始转换文件并导出图片")
-            doc_converter = DocumentConverter(
-                format_options={
-                    InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-                }
-            )
-            
             logger.info(f"API调用(Docling图片导出){execution_id}：开始转换文件并导出图片")
             
-            # 转换文件
-            conv_res = doc_converter.convert(file_path)
-            doc_filename = conv_res.input.file.stem
-            
-            # 保存Markdown文件
-            md_filename = os.path.join(output_dir, f"{doc_filename}.md")
-            conv_res.document.save_as_markdown(md_filename, image_mode=ImageRefMode.REFERENCED)
+            # 转换文件并将Markdown和图片导出到输出目录
+            export_result = docling_converter.export_images(file_path, output_dir, base_filename, image_options)
+            md_filename = export_result['md_path']
+            page_image_paths = export_result['page_images']
+            table_image_paths = export_result['table_images']
+            picture_image_paths = export_result['picture_images']
+            table_counter = len(table_image_paths)
+            picture_counter = len(picture_image_paths)
             logger.info(f"API调用(Docling图片导出){execution_id}：Markdown已保存到: {md_filename}")
             
-            # 保存页面图片
-            page_image_paths = []
-            for page_no, page in conv_res.document.pages.items():
-                page_no = page.page_no
-                page_image_filename = os.path.join(output_dir, f"{doc_filename}-page-{page_no}.png")
-                try:
-                    if hasattr(page, 'image') and page.image is not None and hasattr(page.image, 'pil_image') and page.image.pil_image is not None:
-                        with open(page_image_filename, 'wb') as fp:
-                            page.image.pil_image.save(fp, format="PNG")
-                        page_image_paths.append(page_image_filename)
-                        logger.info(f"API调用(Docling图片导出){execution_id}：页面图片已保存: {page_image_filename}")
-                    else:
-                        logger.warning(f"API调用(Docling图片导出){execution_id}：页面 {page_no} 没有可用的图片")
-                except Exception as e:
-                    logger.warning(f"API调用(Docling图片导出){execution_id}：保存页面 {page_no} 图片时出错: {str(e)}")
-            
-            # 保存图片和表格
-            table_counter = 0  # 实际成功提取的表格数量
-            picture_counter = 0  # 实际成功提取的图片数量
-            table_image_paths = []
-            picture_image_paths = []
-            
-            for element, _level in conv_res.document.iterate_items():
-                if isinstance(element, TableItem):
-                    try:
-                        image = element.get_image(conv_res.document)
-                        if image is not None:
-                            table_counter += 1  # 只有当成功获取图片时才增加计数
-                            element_image_filename = os.path.join(output_dir, f"{doc_filename}-table-{table_counter}.png")
-                            with open(element_image_filename, 'wb') as fp:
-                                image.save(fp, "PNG")
-                            table_image_paths.append(element_image_filename)
-                            logger.info(f"API调用(Docling图片导出){execution_id}：表格图片已保存: {element_image_filename}")
-                        else:
-                            logger.warning(f"API调用(Docling图片导出){execution_id}：无法获取表格图片，图片为None")
-                    except Exception as e:
-                        logger.warning(f"API调用(Docling图片导出){execution_id}：处理表格图片时出错: {str(e)}")
-                
-                if isinstance(element, PictureItem):
-                    try:
-                        image = element.get_image(conv_res.document)
-                        if image is not None:
-                            picture_counter += 1  # 只有当成功获取图片时才增加计数
-                            element_image_filename = os.path.join(output_dir, f"{doc_filename}-picture-{picture_counter}.png")
-                            with open(element_image_filename, 'wb') as fp:
-                                image.save(fp, "PNG")
-                            picture_image_paths.append(element_image_filename)
-                            logger.info(f"API调用(Docling图片导出){execution_id}：图片已保存: {element_image_filename}")
-                        else:
-                            logger.warning(f"API调用(Docling图片导出){execution_id}：无法获取图片，图片为None")
-                    except Exception as e:
-                        logger.warning(f"API调用(Docling图片导出){execution_id}：处理图片时出错: {str(e)}")
-            
             # 读取Markdown内容
             with open(md_filename, 'r', encoding='utf-8') as f:
                 markdown_text = f.read()
@@ -763,14 +699,17 @@ def api_convert_to_md_images_file_docling():
                 'file_size': file_size,
                 'processing_time': round(processing_time, 2),
                 'converter': 'docling',
-                'page_count': len(page_image_paths),
+                'page_count': export_result['page_count'],
                 'table_count': table_counter,
                 'picture_count': picture_counter,
                 'page_images': page_image_paths,
                 'table_images': table_image_paths,
-                'picture_images': picture_image_paths
+                'picture_images': picture_image_paths,
+                'image_options': image_options
             })
             
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
         except ImportError as e:
             error_msg = f"Docling库导入错误: {str(e)}"
             logger.error(f"API调用(Docling图片导出){execution_id}：{error_msg}")
@@ -786,24 +725,7 @@ def api_convert_to_md_images_file_docling():
         logger.error(f"API调用(Docling图片导出){execution_id}：{error_msg}")
         logger.error(traceback.format_exc())
         
-        # 删除临时文件
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"API调用(Docling图片导出){execution_id}：临时文件已删除: {file_path}")
-            except Exception as del_e:
-                logger.warning(f"API调用(Docling图片导出){execution_id}：无法删除临时文件: {file_path}, 原因: {str(del_e)}")
-        
         return jsonify({'error': error_msg, 'details': traceback.format_exc()}), 500
-    
-    finally:
-        # 删除临时文件
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"API调用(Docling图片导出){execution_id}：临时文件已删除: {file_path}")
-            except Exception as del_e:
-                logger.warning(f"API调用(Docling图片导出){execution_id}：无法删除临时文件: {file_path}, 原因: {str(del_e)}")
 
 # 使用Doling 导出表格
 @bp.route('/api/export-tables-docling', methods=['POST'])
@@ -857,14 +779,11 @@ def api_export_tables_docling():
         logger.warning(f"API调用(Docling表格导出){execution_id}：{error_msg}")
         return jsonify({'error': error_msg}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        file.save(file_path)
-        logger.info(f"API调用(Docling表格导出){execution_id}：文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"API调用(Docling表格导出){execution_id}：文件大小: {file_size / 1024:.2f} KB")
         
         # 检查输出目录是否存在，不存在则创建
@@ -875,27 +794,16 @@ def api_export_tables_docling():
             except Exception as e:
                 error_msg = f"无法创建输出目录: {str(e)}"
                 logger.error(f"API调用(Docling表格导出){execution_id}：{error_msg}")
-                cleanup_temp_file(file_path, f"API调用(Docling表格导出){execution_id}：")
                 return jsonify({'error': error_msg}), 500
         
         # 使用Docling处理文件
         try:
-            import pandas as pd
-            from docling.document_converter import DocumentConverter
-            
             logger.info(f"API调用(Docling表格导出){execution_id}：开始转换文件并导出表格")
             
-            # 创建文档转换器
-            doc_converter = DocumentConverter()
-            
-            # 转换文件
-            conv_res = doc_converter.convert(file_path)
-            doc_filename = conv_res.input.file.stem
+            # 转换文件并导出表格
+            table_outputs = docling_converter.export_tables(file_path, output_dir, export_formats, base_filename)
             
-            # 保存表格
-            table_outputs = []
-            
-            if not conv_res.document.tables:
+            if not table_outputs:
                 logger.warning(f"API调用(Docling表格导出){execution_id}：文档中未检测到表格")
                 return jsonify({
                     'warning': '文档中未检测到表格',
@@ -906,49 +814,6 @@ def api_export_tables_docling():
                     'tables': []
                 })
             
-            for table_ix, table in enumerate(conv_res.document.tables):
-                table_outputs_item = {'index': table_ix + 1}
-                
-                # 导出表格到DataFrame
-                try:
-                    table_df = table.export_to_dataframe()
-                    logger.info(f"API调用(Docling表格导出){execution_id}：成功提取表格 {table_ix + 1}")
-                    
-                    # 保存为CSV
-                    if 'csv' in export_formats:
-                        csv_filename = f"{doc_filename}-table-{table_ix+1}.csv"
-                        csv_path = os.path.join(output_dir, csv_filename)
-                        table_df.to_csv(csv_path, index=False, encoding='utf-8')
-                        logger.info(f"API调用(Docling表格导出){execution_id}：表格已保存为CSV: {csv_path}")
-                        table_outputs_item['csv_path'] = csv_path
-                    
-                    # 保存为Markdown
-                    if 'md' in export_formats:
-                        md_filename = f"{doc_filename}-table-{table_ix+1}.md"
-                        md_path = os.path.join(output_dir, md_filename)
-                        with open(md_path, 'w', encoding='utf-8') as f:
-                            f.write(table_df.to_markdown(index=False))
-                        logger.info(f"API调用(Docling表格导出){execution_id}：表格已保存为Markdown: {md_path}")
-                        table_outputs_item['md_path'] = md_path
-                    
-                    # 保存为HTML
-                    if 'html' in export_formats:
-                        html_filename = f"{doc_filename}-table-{table_ix+1}.html"
-                        html_path = os.path.join(output_dir, html_filename)
-                        with open(html_path, 'w', encoding='utf-8') as f:
-                            f.write(table.export_to_html(doc=conv_res.document))
-                        logger.info(f"API调用(Docling表格导出){execution_id}：表格已保存为HTML: {html_path}")
-                        table_outputs_item['html_path'] = html_path
-                    
-                    # 添加到输出列表
-                    table_outputs.append(table_outputs_item)
-                    
-                except Exception as table_error:
-                    error_msg = f"处理表格 {table_ix + 1} 时出错: {str(table_error)}"
-                    logger.error(f"API调用(Docling表格导出){execution_id}：{error_msg}")
-                    logger.error(traceback.format_exc())
-                    # 继续处理其他表格，不中断
-            
             processing_time = time.time() - start_time
             logger.info(f"API调用(Docling表格导出){execution_id}：处理完成，耗时: {processing_time:.2f}秒")
             
@@ -962,29 +827,24 @@ def api_export_tables_docling():
                 'tables': table_outputs
             })
             
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
         except ImportError as e:
             error_msg = f"Docling库导入错误: {str(e)}"
             logger.error(f"API调用(Docling表格导出){execution_id}：{error_msg}")
             logger.error(traceback.format_exc())
-            cleanup_temp_file(file_path, f"API调用(Docling表格导出){execution_id}：")
             return jsonify({'error': error_msg}), 500
         except Exception as e:
             error_msg = f"Docling处理失败: {str(e)}"
             logger.error(f"API调用(Docling表格导出){execution_id}：{error_msg}")
             logger.error(traceback.format_exc())
-            cleanup_temp_file(file_path, f"API调用(Docling表格导出){execution_id}：")
             return jsonify({'error': error_msg, 'details': traceback.format_exc()}), 500
     
     except Exception as e:
         error_msg = f"处理文件时出错: {str(e)}"
         logger.error(f"API调用(Docling表格导出){execution_id}：{error_msg}")
         logger.error(traceback.format_exc())
-        cleanup_temp_file(file_path, f"API调用(Docling表格导出){execution_id}：")
         return jsonify({'error': error_msg, 'details': traceback.format_exc()}), 500
-    
-    finally:
-        # 删除临时文件
-        cleanup_temp_file(file_path, f"API调用(Docling表格导出){execution_id}：")
 
 # 使用Docling 将在线文档转换为Markdown
 @bp.route('/api/convert-online-docling', methods=['POST'])
@@ -1075,9 +935,12 @@ def api_convert_online_docling():
                 'text': markdown_text,
                 'url': url,
                 'processing_time': round(processing_time, 2),
+                'cache': conversion_context.get('cache'),
                 'converter': 'docling'
             })
             
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
         except requests.exceptions.RequestException as e:
             error_msg = f"下载文件失败: {str(e)}"
             logger.error(f"API调用(Docling在线文档){execution_id}：{error_msg}")
@@ -1218,9 +1081,12 @@ def api_convert_online_docling_save():
                 'url': url,
                 'filename': output_filename,
                 'processing_time': round(processing_time, 2),
+                'cache': conversion_context.get('cache'),
                 'converter': 'docling'
             })
             
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
         except requests.exceptions.RequestException as e:
             error_msg = f"下载文件失败: {str(e)}"
             logger.error(f"API调用(Docling在线文档保存){execution_id}：{error_msg}")
@@ -0,0 +1,123 @@
+"""
+异步任务路由模块，提供提交转换任务和查询任务状态、结果的API接口
+"""
+from flask import Blueprint, request, jsonify, url_for
+import os
+import traceback
+from flasgger import swag_from
+
+from app import logger
+from app.utils.job_queue import job_queue, JobQueueFull, JOB_TARGET_FORMATS, STATUS_SUCCEEDED, STATUS_FAILED
+from app.utils.selection import parse_selection, SelectionError
+
+# 各目标格式支持的转换范围参数，Docling只支持PDF页码范围
+JOB_SELECTORS = {
+    'text': {'pages', 'slides', 'sheets'},
+    'md': {'pages', 'slides', 'sheets'},
+    'html': {'pages'}
+}
+
+# 创建异步任务蓝图
+bp = Blueprint('jobs', __name__)
+
+def _job_response(job):
+    """将任务记录转换为API响应结构"""
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'target_format': job['target_format'],
+        'filename': job['filename'],
+        'error': job['error'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'status_url': url_for('jobs.api_get_job', job_id=job['id']),
+        'result_url': url_for('jobs.api_get_job_result', job_id=job['id'])
+    }
+
+# API：提交异步转换任务
+@bp.route('/jobs', methods=['POST'])
+@swag_from('../../swagger_docs/create_job.yml')
+def api_create_job():
+    if 'file' not in request.files:
+        logger.warning("API调用(异步任务)：没有文件上传")
+        return jsonify({'error': '没有文件上传'}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        logger.warning("API调用(异步任务)：未选择文件")
+        return jsonify({'error': '未选择文件'}), 400
+
+    target_format = request.form.get('format', 'md').lower()
+    if target_format not in JOB_TARGET_FORMATS:
+        logger.warning(f"API调用(异步任务)：不支持的目标格式: {target_format}")
+        return jsonify({'error': f"不支持的目标格式: {target_format}，支持的格式为：{'、'.join(JOB_TARGET_FORMATS)}"}), 400
+
+    options = {}
+    if target_format == 'tables':
+        export_formats = request.form.get('export_formats', 'md,csv,html').lower().split(',')
+        options['export_formats'] = [fmt.strip() for fmt in export_formats if fmt.strip() in {'md', 'csv', 'html'}]
+        if not options['export_formats']:
+            return jsonify({'error': '未指定有效的导出格式，支持的格式为：md、csv、html'}), 400
+
+    # 转换范围：PDF页码、幻灯片序号或工作表，未选中的部分不解析也不进行OCR
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    try:
+        selection = parse_selection(request.form, file_ext, allowed=JOB_SELECTORS.get(target_format, set()))
+    except SelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    if selection:
+        options['selection'] = selection
+
+    try:
+        job = job_queue.submit(file, file.filename, target_format, options)
+        return jsonify(_job_response(job)), 202
+    except JobQueueFull as e:
+        logger.warning(f"API调用(异步任务)：{str(e)}")
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"API调用(异步任务)：提交任务失败: {error_msg}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': error_msg,
+            'details': traceback.format_exc()
+        }), 500
+
+# API：查询任务状态
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@swag_from('../../swagger_docs/get_job.yml')
+def api_get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+
+    return jsonify(_job_response(job))
+
+# API：获取任务结果
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+@swag_from('../../swagger_docs/get_job_result.yml')
+def api_get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+
+    if job['status'] == STATUS_FAILED:
+        return jsonify({'job_id': job_id, 'status': job['status'], 'error': job['error']}), 500
+
+    if job['status'] != STATUS_SUCCEEDED:
+        # 任务尚未完成，提示客户端稍后再查询
+        return jsonify(_job_response(job)), 202, {'Retry-After': '5'}
+
+    result = job_queue.load_result(job)
+    if result is None:
+        return jsonify({'error': f'任务结果不存在: {job_id}'}), 404
+
+    result.update({
+        'job_id': job_id,
+        'status': job['status'],
+        'filename': job['filename']
+    })
+    return jsonify(result)
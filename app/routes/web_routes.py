@@ -2,6 +2,7 @@
 Web表单处理路由，处理网页上的表单提交
 """
 from flask import Blueprint, request, jsonify, current_app
+import io
 import os
 import traceback
 import time
@@ -21,8 +22,9 @@ from app.utils.converters import (
     convert_to_markdown
 )
 from app.utils.converter_factory import converter_factory
-from app.utils.common import cleanup_temp_file
-from app.utils.md_processor import process_markdown_file, process_markdown_text, parse_markdown_to_qa, save_as_json, save_as_csv
+from app.utils.upload_storage import stage_upload
+from app.utils import conversion_context
+from app.utils.md_processor import export_qa_pairs, MarkdownChunker, QA_EXPORT_FORMATS
 
 # 创建Web表单处理蓝图
 bp = Blueprint('web', __name__)
@@ -46,14 +48,11 @@ def convert():
     
     logger.info(f"接收到文件: {filename}, 类型: {file_ext}")
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        file.save(file_path)
-        logger.info(f"文件保存成功: {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"文件大小: {file_size / 1024:.2f} KB")
         
         # 根据文件类型调用相应的转换函数
@@ -80,26 +79,19 @@ def convert():
             text = "音频文件支持Markdown格式导出，请使用转MD功能"
         else:
             logger.warning(f"不支持的文件格式: {file_ext}")
-            cleanup_temp_file(file_path)  # 删除不支持的文件
             return jsonify({'error': f'不支持的文件格式: {file_ext}'}), 400
         
         # 记录转换结果
         text_length = len(text)
         logger.info(f"文件转换成功, 文本长度: {text_length} 字符")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path)
-        
-        return jsonify({'text': text})
+        return jsonify({'text': text, 'cache': conversion_context.get('cache')})
 
     except Exception as e:
         # 详细记录异常信息
         error_msg = str(e)
         logger.error(f"转换失败: {error_msg}")
         logger.error(traceback.format_exc())
-        
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path)
             
         return jsonify({
             'error': f'转换失败: {error_msg}', 
@@ -131,14 +123,11 @@ def convert_md_route():
         logger.warning(f"不支持的文件格式: {file_ext}")
         return jsonify({'error': f'不支持的文件格式: {file_ext}'}), 400
     
-    # 保存上传的文件
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        file.save(file_path)
-        logger.info(f"文件保存成功(转MD): {file_path}")
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
+        # 保存上传的文件，请求结束时自动删除
+        upload = stage_upload(file, app.config['UPLOAD_FOLDER'])
+        file_path = upload.path
+        file_size = upload.size
         logger.info(f"文件大小(转MD): {file_size / 1024:.2f} KB")
         
         # 使用MarkItDown转换为Markdown
@@ -149,19 +138,13 @@ def convert_md_route():
         text_length = len(markdown_text)
         logger.info(f"文件转换为Markdown成功, 文本长度: {text_length} 字符")
         
-        # 删除临时文件
-        cleanup_temp_file(file_path, "转MD：")
-        
-        return jsonify({'text': markdown_text})
+        return jsonify({'text': markdown_text, 'cache': conversion_context.get('cache')})
 
     except Exception as e:
         # 详细记录异常信息
         error_msg = str(e)
         logger.error(f"转换为Markdown失败: {error_msg}")
         logger.error(traceback.format_exc())
-        
-        # 出错时删除临时文件
-        cleanup_temp_file(file_path, "转MD：")
             
         return jsonify({
             'error': f'转换为Markdown失败: {error_msg}', 
@@ -185,14 +168,28 @@ def preprocess_for_storage():
         # 设置输出目录，如果未提供则使用默认目录
         output_dir = request.form.get('output_dir', current_app.config.get('STORAGE_FOLDER', 'storage'))
         
-        # 获取输出格式
+        # 获取输出格式，both表示同时输出json和csv，也可以用逗号分隔多个格式
         output_format = request.form.get('format', 'both').lower()
-        if output_format not in ['json', 'csv', 'both']:
+        formats = ['json', 'csv'] if output_format == 'both' else [f.strip() for f in output_format.split(',') if f.strip()]
+        if not formats or any(f not in QA_EXPORT_FORMATS for f in formats):
             logger.warning(f"不支持的输出格式: {output_format}")
-            return jsonify({'error': '输出格式必须是json、csv或both'}), 400
-        
-        # 确保输出目录存在
-        os.makedirs(output_dir, exist_ok=True)
+            return jsonify({'error': '输出格式必须是json、jsonl、csv或both，多个格式用逗号分隔'}), 400
+        
+        # 获取分块选项，none表示只按标题切分
+        chunk_unit = request.form.get('chunk', 'none').lower()
+        chunker = None
+        if chunk_unit != 'none':
+            try:
+                chunk_size = request.form.get('chunk_size')
+                chunk_overlap = request.form.get('chunk_overlap')
+                chunker = MarkdownChunker(
+                    max_size=int(chunk_size) if chunk_size else None,
+                    overlap=int(chunk_overlap) if chunk_overlap else None,
+                    unit=chunk_unit
+                )
+            except ValueError as e:
+                logger.warning(f"无效的分块参数: {str(e)}")
+                return jsonify({'error': f'无效的分块参数: {str(e)}'}), 400
         
         # 处理文件上传方式
         if 'file' in request.files and request.files['file'].filename:
@@ -204,57 +201,32 @@ def preprocess_for_storage():
                 logger.warning(f"不支持的文件格式: {filename}")
                 return jsonify({'error': '仅支持Markdown(.md)文件格式'}), 400
             
-            # 保存上传的文件
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            logger.info(f"文件保存成功: {file_path}")
-            
             # 设置输出文件名（不含扩展名）
             output_filename = request.form.get('filename', os.path.splitext(filename)[0])
             
-            # 读取Markdown文件
-            with open(file_path, 'r', encoding='utf-8') as f:
-                markdown_text = f.read()
-            
-            # 解析Markdown为问答对
-            qa_pairs = parse_markdown_to_qa(markdown_text)
-            
-            # 删除临时文件
-            cleanup_temp_file(file_path)
+            # 直接从上传流中逐行读取Markdown，边解析边写入，无需写入临时文件；
+            # 不转换换行符，使分块偏移与上传的文件一致
+            markdown = io.TextIOWrapper(file.stream, encoding='utf-8', newline='')
             
         # 处理文本内容方式
         else:
-            text = request.form.get('text', '')
-            if not text:
+            markdown = request.form.get('text', '')
+            if not markdown:
                 logger.warning("提供的Markdown文本内容为空")
                 return jsonify({'error': 'Markdown文本内容不能为空'}), 400
             
             # 设置输出文件名（不含扩展名）
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             output_filename = request.form.get('filename', f"markdown_{timestamp}")
-            
-            # 解析Markdown为问答对
-            qa_pairs = parse_markdown_to_qa(text)
-        
-        # 根据输出格式保存文件
-        result = {}
-        
-        # 生成输出文件路径
-        json_path = os.path.join(output_dir, f"{output_filename}.json")
-        csv_path = os.path.join(output_dir, f"{output_filename}.csv")
-        
-        # 保存为JSON
-        if output_format in ['json', 'both']:
-            save_as_json(qa_pairs, json_path)
-            result['json_path'] = json_path
         
-        # 保存为CSV
-        if output_format in ['csv', 'both']:
-            save_as_csv(qa_pairs, csv_path)
-            result['csv_path'] = csv_path
+        # 解析问答对（或分块）并写入所选格式的文件
+        outputs, qa_count = export_qa_pairs(markdown, output_dir, output_filename, formats, chunker=chunker)
         
+        result = {f"{export_format}_path": path for export_format, path in outputs.items()}
         # 添加问答对数量到结果
-        result['qa_count'] = len(qa_pairs)
+        result['qa_count'] = qa_count
+        if chunker is not None:
+            result['chunk'] = {'unit': chunker.unit, 'size': chunker.max_size, 'overlap': chunker.overlap}
         
         # 返回成功结果
         return jsonify(result)
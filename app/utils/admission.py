@@ -0,0 +1,236 @@
+"""
+准入控制模块
+Docling转换和批量转换进程占用大量CPU和内存，多个gunicorn worker同时处理时会耗尽资源。
+用共享目录中的文件锁实现跨worker进程的信号量：限制同时进行的转换数量，
+等待队列有长度上限，队列已满时立即拒绝（429），等待超时时拒绝（503），响应均带Retry-After
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.utils import instrumentation
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用Docling准入控制
+DOCLING_ADMISSION_ENABLED = os.environ.get('DOCLING_ADMISSION_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 所有worker进程合计同时进行的Docling转换数量上限
+DOCLING_MAX_CONCURRENT = int(os.environ.get('DOCLING_MAX_CONCURRENT', '2'))
+# 所有worker进程合计等待中的请求数量上限，超出时立即返回429
+DOCLING_QUEUE_SIZE = int(os.environ.get('DOCLING_QUEUE_SIZE', '4'))
+# 请求最长等待时间（秒），超时返回503
+DOCLING_QUEUE_TIMEOUT = float(os.environ.get('DOCLING_QUEUE_TIMEOUT', '60'))
+# 拒绝响应中建议客户端重试的间隔（秒）
+DOCLING_RETRY_AFTER = int(os.environ.get('DOCLING_RETRY_AFTER', '30'))
+# 锁文件目录，所有worker进程必须使用同一目录
+ADMISSION_DIR = os.environ.get('ADMISSION_DIR', os.environ.get('DOCLING_ADMISSION_DIR', os.path.join('cache', 'admission')))
+
+# 等待空闲名额时的轮询间隔（秒）
+POLL_INTERVAL = 0.1
+
+# 当前是否在后台任务中执行，后台任务已在任务队列中排队，占用名额时不受等待队列长度和等待时间限制
+_background = contextvars.ContextVar('admission_background', default=False)
+
+
+@contextmanager
+def background():
+    """在其中执行的slot()一直等待空闲名额，不会因等待队列已满或超时被拒绝"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class AdmissionRejected(Exception):
+    """请求未获准进行转换"""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    基于文件锁的跨进程准入控制器
+
+    每个运行名额和等待名额对应一个锁文件，持有flock排他锁即占用该名额。
+    flock锁属于打开的文件描述，同一进程的不同线程分别打开锁文件时同样互斥；
+    进程异常退出时内核自动释放锁，不会遗留被占用的名额。
+    不同名称的控制器使用不同的锁文件，名额互不影响
+    """
+
+    def __init__(self, name, max_concurrent=DOCLING_MAX_CONCURRENT, queue_size=DOCLING_QUEUE_SIZE,
+                 timeout=DOCLING_QUEUE_TIMEOUT, retry_after=DOCLING_RETRY_AFTER,
+                 lock_dir=ADMISSION_DIR, enabled=DOCLING_ADMISSION_ENABLED):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.lock_dir = lock_dir
+        self.enabled = enabled
+        if enabled and fcntl is None:
+            logger.warning(f"当前平台不支持fcntl文件锁，{name}准入控制不可用")
+            self.enabled = False
+        self._lock = threading.Lock()
+        self._held = set()  # 本进程持有锁的文件描述符
+        self._counts = {'running': 0, 'waiting': 0}  # 本进程中正在进行和等待中的转换数量
+        # fork出的子进程继承了锁文件的描述符，必须关闭，否则子进程退出前父进程释放的名额仍被占用
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        for fd in self._held:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._lock = threading.Lock()
+        self._held = set()
+        self._counts = {'running': 0, 'waiting': 0}
+
+    def _try_lock(self, kind, count):
+        """尝试占用一个名额，成功时返回持有锁的文件描述符，全部被占用时返回None"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for i in range(count):
+            fd = os.open(os.path.join(self.lock_dir, f'{self.name}-{kind}-{i}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            with self._lock:
+                self._held.add(fd)
+            return fd
+        return None
+
+    def _unlock(self, fd):
+        with self._lock:
+            self._held.discard(fd)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _track(self, state, delta):
+        with self._lock:
+            self._counts[state] += delta
+        if instrumentation.METRICS_ENABLED:
+            instrumentation.registry.inc(instrumentation.METRIC_PREFIX + f'admission_{state}', {'pool': self.name}, delta)
+
+    def _record(self, result, waited):
+        if instrumentation.METRICS_ENABLED:
+            instrumentation.registry.observe(instrumentation.METRIC_PREFIX + 'admission_wait_seconds',
+                                             {'pool': self.name, 'result': result}, waited)
+            instrumentation.registry.inc(instrumentation.METRIC_PREFIX + 'admission_total', {'pool': self.name, 'result': result})
+
+    def _acquire(self, timeout, bounded):
+        """占用一个运行名额，返回(文件描述符, 等待秒数)"""
+        start = time.monotonic()
+        fd = self._try_lock('slot', self.max_concurrent)
+        if fd is not None:
+            return fd, 0.0
+
+        queue_fd = None
+        if bounded:
+            queue_fd = self._try_lock('queue', self.queue_size)
+            if queue_fd is None:
+                self._record('queue_full', 0.0)
+                raise AdmissionRejected(
+                    f"{self.name}转换繁忙：{self.max_concurrent} 个转换正在进行，等待队列（{self.queue_size}）已满，请稍后重试",
+                    429, self.retry_after
+                )
+
+        self._track('waiting', 1)
+        try:
+            while True:
+                time.sleep(POLL_INTERVAL)
+                fd = self._try_lock('slot', self.max_concurrent)
+                waited = time.monotonic() - start
+                if fd is not None:
+                    return fd, waited
+                if timeout is not None and waited >= timeout:
+                    self._record('timeout', waited)
+                    raise AdmissionRejected(
+                        f"{self.name}转换繁忙：等待 {waited:.0f} 秒仍无空闲名额，请稍后重试",
+                        503, self.retry_after
+                    )
+        finally:
+            self._track('waiting', -1)
+            if queue_fd is not None:
+                self._unlock(queue_fd)
+
+    def acquire(self, timeout=None, bounded=True):
+        """
+        占用一个转换名额，返回用于release的令牌
+
+        Args:
+            timeout: 最长等待秒数，默认使用DOCLING_QUEUE_TIMEOUT；bounded为False时默认一直等待
+            bounded: 是否受等待队列长度限制，后台任务已经在任务队列中排队，使用False
+
+        Raises:
+            AdmissionRejected: 等待队列已满（status_code为429）或等待超时（status_code为503）
+        """
+        if not self.enabled:
+            return None
+
+        if timeout is None and bounded:
+            timeout = self.timeout
+        fd, waited = self._acquire(timeout, bounded)
+        self._admitted(waited)
+        return fd
+
+    def try_acquire(self):
+        """不等待地尝试占用一个转换名额，成功时返回令牌（未启用时为None），没有空闲名额时返回False"""
+        if not self.enabled:
+            return None
+        fd = self._try_lock('slot', self.max_concurrent)
+        if fd is None:
+            return False
+        self._admitted(0.0)
+        return fd
+
+    def _admitted(self, waited):
+        self._record('admitted', waited)
+        if waited:
+            logger.info(f"{self.name}转换等待 {waited:.2f} 秒后获得名额 (pid={os.getpid()})")
+        self._track('running', 1)
+
+    def release(self, token):
+        """释放acquire或try_acquire占用的名额"""
+        if token is None or token is False:
+            return
+        self._track('running', -1)
+        self._unlock(token)
+
+    @contextmanager
+    def slot(self, timeout=None, bounded=None):
+        """占用一个转换名额，退出时释放，参数和异常同acquire；bounded默认在background()中为False"""
+        if bounded is None:
+            bounded = not _background.get()
+        token = self.acquire(timeout, bounded)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stats(self):
+        """准入控制配置和本进程中正在进行、等待中的转换数量"""
+        with self._lock:
+            counts = dict(self._counts)
+        return dict(counts, name=self.name, enabled=self.enabled, max_concurrent=self.max_concurrent,
+                    queue_size=self.queue_size, timeout=self.timeout)
+
+# 创建全局Docling准入控制器实例（所有worker进程通过锁文件共享名额）
+docling_admission = AdmissionControl('docling')
@@ -0,0 +1,202 @@
+"""
+Docling中间结果存储模块
+Docling最耗时的是版面分析和表格识别，导出Markdown、HTML、JSON本身很快。
+将解析得到的DoclingDocument序列化后压缩保存在有大小上限的磁盘目录中，
+以内容哈希和管线选项为键，重新导出其他格式、重新分块或重新提取表格时直接加载，无需再次推理。
+多个worker进程和异步任务进程共享同一目录
+"""
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import logging
+import pathlib
+import functools
+import traceback
+
+from app.utils import instrumentation
+from app.utils.result_cache import DiskLRUCache
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用Docling中间结果存储
+ARTIFACT_STORE_ENABLED = os.environ.get('ARTIFACT_STORE_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 存储目录
+ARTIFACT_STORE_DIR = os.environ.get('ARTIFACT_STORE_DIR', os.path.join('cache', 'artifacts'))
+# 存储目录的容量上限（字节），默认2GB
+ARTIFACT_STORE_MAX_BYTES = int(os.environ.get('ARTIFACT_STORE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# 存储格式版本，序列化结构变化时递增以废弃旧的中间结果
+ARTIFACT_FORMAT_VERSION = 1
+
+# 中间结果的键为SHA-256十六进制字符串
+ARTIFACT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# gzip压缩级别，DoclingDocument的JSON重复度高，中等级别即可获得较好的压缩率
+ARTIFACT_COMPRESS_LEVEL = 6
+
+
+@functools.lru_cache(maxsize=1)
+def docling_version():
+    """已安装的docling版本，模型和序列化结构随版本变化，计入中间结果的键"""
+    try:
+        from importlib.metadata import version
+        return version('docling')
+    except Exception:
+        return None
+
+
+class StoredConversionResult:
+    """
+    从中间结果加载的转换结果，提供与Docling ConversionResult相同的document和input.file属性，
+    可直接交给导出代码使用
+    """
+
+    class _Input:
+        def __init__(self, file_path):
+            self.file = pathlib.Path(file_path)
+
+    def __init__(self, document, file_path, metadata):
+        self.document = document
+        self.input = self._Input(file_path)
+        self.metadata = metadata
+
+
+class DoclingArtifactStore:
+    """
+    DoclingDocument中间结果存储
+
+    每个条目是一个gzip压缩文件：第一行为元数据JSON，其余为DoclingDocument的JSON，
+    列出条目时只需解压第一行
+    """
+
+    def __init__(self, store_dir=ARTIFACT_STORE_DIR, max_bytes=ARTIFACT_STORE_MAX_BYTES, enabled=ARTIFACT_STORE_ENABLED):
+        self.enabled = enabled
+        self._store = DiskLRUCache(store_dir, max_bytes, suffix='.json.gz')
+
+    @staticmethod
+    def make_key(content_hash, do_ocr=True, pages=None):
+        """根据内容哈希、管线选项、页码范围和docling版本生成中间结果的键"""
+        key_source = json.dumps({
+            'version': ARTIFACT_FORMAT_VERSION,
+            'content': content_hash,
+            'do_ocr': bool(do_ocr),
+            'pages': pages or None,
+            'docling': docling_version()
+        }, sort_keys=True)
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def load(self, key, file_path):
+        """
+        加载中间结果
+
+        Args:
+            key: 中间结果的键
+            file_path: 当前请求的文件路径，作为结果的input.file
+
+        Returns:
+            StoredConversionResult: 加载的转换结果，不存在或无法加载时返回None
+        """
+        if not self.enabled:
+            return None
+        try:
+            data = self._store.get(key)
+            if data is None:
+                instrumentation.record_cache('docling', 'artifact', 'miss')
+                return None
+
+            from docling_core.types.doc import DoclingDocument
+
+            with instrumentation.stage('artifact_load', converter='docling'):
+                metadata_line, _, document_json = gzip.decompress(data).partition(b'\n')
+                document = DoclingDocument.model_validate_json(document_json)
+            instrumentation.record_cache('docling', 'artifact', 'hit')
+            return StoredConversionResult(document, file_path, json.loads(metadata_line))
+        except Exception as e:
+            # 损坏或与当前docling不兼容的中间结果直接删除，重新解析
+            logger.warning(f"加载Docling中间结果失败，删除该条目: {str(e)}")
+            logger.debug(traceback.format_exc())
+            self._store.delete(key)
+            return None
+
+    def save(self, key, document, content_hash, filename=None, do_ocr=True, pages=None):
+        """保存DoclingDocument，写入失败时只记录警告"""
+        if not self.enabled:
+            return
+        try:
+            with instrumentation.stage('artifact_save', converter='docling'):
+                metadata = {
+                    'id': key,
+                    'content_hash': content_hash,
+                    'filename': filename,
+                    'options': {'do_ocr': bool(do_ocr), 'pages': pages or None},
+                    'docling_version': docling_version(),
+                    'pages': len(getattr(document, 'pages', None) or {}),
+                    'tables': len(getattr(document, 'tables', None) or []),
+                    'created_at': time.time()
+                }
+                payload = json.dumps(metadata, ensure_ascii=False).encode('utf-8') + b'\n' + \
+                    json.dumps(document.export_to_dict(), ensure_ascii=False).encode('utf-8')
+                self._store.put(key, gzip.compress(payload, compresslevel=ARTIFACT_COMPRESS_LEVEL))
+            logger.info(f"Docling中间结果已保存: {key}，原始大小 {len(payload) / 1024:.1f} KB")
+        except Exception as e:
+            logger.warning(f"保存Docling中间结果失败: {str(e)}")
+            logger.debug(traceback.format_exc())
+
+    def _read_metadata(self, key):
+        f = self._store.open(key)
+        if f is None:
+            return None
+        with f, gzip.GzipFile(fileobj=f) as stream:
+            return json.loads(stream.readline())
+
+    def list(self, content_hash=None):
+        """
+        列出中间结果，按最近使用时间从新到旧排列
+
+        Args:
+            content_hash: 只列出该内容哈希的中间结果
+
+        Returns:
+            list: 每项包含id、content_hash、filename、options、pages、tables、size、created_at、last_used_at
+        """
+        artifacts = []
+        for key, size, last_used in self._store.entries():
+            try:
+                metadata = self._read_metadata(key)
+            except Exception as e:
+                logger.warning(f"读取Docling中间结果元数据失败: {key}，{str(e)}")
+                continue
+            if metadata is None or (content_hash and metadata.get('content_hash') != content_hash):
+                continue
+            metadata.update({'id': key, 'size': size, 'last_used_at': last_used})
+            artifacts.append(metadata)
+        artifacts.sort(key=lambda item: item['last_used_at'], reverse=True)
+        return artifacts
+
+    @staticmethod
+    def is_valid_id(key):
+        """检查中间结果ID的格式，防止通过ID访问存储目录之外的文件"""
+        return bool(ARTIFACT_ID_PATTERN.match(key or ''))
+
+    def delete(self, key):
+        """删除中间结果，返回是否存在"""
+        if not self.is_valid_id(key):
+            return False
+        return self._store.delete(key)
+
+    def stats(self):
+        """存储状态：条目数和占用空间"""
+        entries = self._store.entries()
+        return {
+            'enabled': self.enabled,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self._store.max_bytes
+        }
+
+# 创建全局Docling中间结果存储实例
+artifact_store = DoclingArtifactStore()
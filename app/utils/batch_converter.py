@@ -0,0 +1,350 @@
+"""
+批量转换模块
+将一批上传文件（或zip压缩包中的文件）暂存后作为异步任务提交，
+在任务中分发到有界的进程池并行转换，结果写入输出目录，
+输出目录中的manifest.json记录进度以及每个文件的耗时和错误信息
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import zipfile
+import logging
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from app.utils import conversion_context, instrumentation
+from app.utils.admission import AdmissionControl
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个批量请求最多使用的转换进程数，避免单个批量任务占满CPU影响交互式请求
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '2'))
+# 所有worker进程的全部批量任务合计同时进行转换的进程数上限
+BATCH_MAX_PROCESSES = int(os.environ.get('BATCH_MAX_PROCESSES', str(BATCH_MAX_WORKERS)))
+# 每个批量请求最多包含的文件数量
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', '1000'))
+# zip压缩包解压后的总大小上限（字节），默认2GB
+BATCH_MAX_ARCHIVE_BYTES = int(os.environ.get('BATCH_MAX_ARCHIVE_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# 支持的目标格式及输出文件扩展名
+BATCH_TARGET_FORMATS = {'text': '.txt', 'md': '.md'}
+# 支持的输入文件格式
+BATCH_SUPPORTED_EXTENSIONS = ['.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.pdf', '.txt', '.md', '.mp3', '.wav']
+
+# 暂存目录中记录输入文件和批量选项的文件，任务在worker重启后据此恢复
+BATCH_STATE_FILENAME = 'batch.json'
+# 处理过程中更新manifest.json的最短间隔（秒）
+MANIFEST_UPDATE_INTERVAL = 2.0
+
+# 批量转换状态
+BATCH_QUEUED = 'queued'
+BATCH_RUNNING = 'running'
+BATCH_COMPLETED = 'completed'
+
+# 批量转换进程的跨进程准入控制：转换进程只在占用名额后才会被派发文件，
+# 多个worker中同时运行的多个批量任务合计不超过BATCH_MAX_PROCESSES个进程在转换
+batch_admission = AdmissionControl('batch', max_concurrent=BATCH_MAX_PROCESSES, queue_size=0, enabled=True)
+
+
+def _mp_context():
+    """
+    转换进程的启动方式
+
+    gunicorn worker中已有任务队列、Docling预热等线程，fork时可能继承被其他线程持有的锁而死锁，
+    因此使用forkserver（从单线程的服务进程fork），不支持时使用spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _init_worker():
+    """转换进程初始化：并行度由进程数提供，原生库（OpenMP、MKL）在每个进程内只使用单线程"""
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ.setdefault(name, '1')
+    conversion_context.reset()
+    logger.info(f"批量转换进程已启动 (pid={os.getpid()})")
+
+
+def convert_file(file_path, target_format, output_path):
+    """
+    在转换进程中转换单个文件并写入输出文件
+
+    与同步接口和异步任务相同：md格式使用内置转换器的convert_to_markdown，
+    text格式使用默认转换器（MarkItDown）
+
+    Returns:
+        dict: 该文件在清单中的记录（不含文件名）
+    """
+    start_time = time.time()
+    conversion_context.reset()
+    try:
+        with instrumentation.scope('batch'):
+            if target_format == 'md':
+                from app.utils.converters import convert_to_markdown
+                converter_name = 'legacy'
+                text = convert_to_markdown(file_path)
+            else:
+                from app.utils.converter_factory import converter_factory
+                converter = converter_factory.get_default_converter()
+                converter_name = converter.name
+                text = converter.convert_to_text(file_path)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        return {
+            'status': 'succeeded',
+            'output_path': output_path,
+            'converter': converter_name,
+            'chars': len(text),
+            'cache': conversion_context.get('cache'),
+            'processing_time': round(time.time() - start_time, 2)
+        }
+    except Exception as e:
+        logger.error(f"批量转换：文件转换失败: {file_path}，原因: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {
+            'status': 'failed',
+            'error': str(e),
+            'processing_time': round(time.time() - start_time, 2)
+        }
+    finally:
+        # 转换进程退出时不会执行atexit，每个文件完成后写入指标快照
+        instrumentation.flush(force=True)
+
+
+def _safe_relative_path(name):
+    """规范化上传文件名或压缩包成员路径，拒绝绝对路径和跳出目录的路径"""
+    name = name.replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return os.path.join(*parts)
+
+
+class BatchConverter:
+    """批量转换：暂存输入文件、分发到进程池并汇总清单"""
+
+    def __init__(self, staging_root, output_dir, target_format, concurrency=None, batch_id=None):
+        if target_format not in BATCH_TARGET_FORMATS:
+            raise ValueError(f"不支持的目标格式: {target_format}，支持的格式为：{'、'.join(BATCH_TARGET_FORMATS)}")
+
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.staging_dir = os.path.join(staging_root, f'batch_{self.batch_id}')
+        self.output_dir = output_dir
+        self.target_format = target_format
+        self.concurrency = max(1, min(concurrency or BATCH_MAX_WORKERS, BATCH_MAX_WORKERS))
+        self._inputs = []    # (相对路径, 暂存文件路径)
+        self._rejected = []  # 未进入转换的文件记录
+
+    def _reserve(self, relative_path):
+        """为输入文件分配暂存路径，重名时追加序号"""
+        base, ext = os.path.splitext(relative_path)
+        candidate = relative_path
+        index = 1
+        used = {path for path, _ in self._inputs}
+        while candidate in used:
+            candidate = f"{base}_{index}{ext}"
+            index += 1
+        return candidate, os.path.join(self.staging_dir, candidate)
+
+    def _accept(self, name):
+        """检查文件名和数量限制，返回可用的相对路径，不可用时记录原因并返回None"""
+        relative_path = _safe_relative_path(name)
+        if relative_path is None:
+            self._rejected.append({'filename': name, 'status': 'skipped', 'error': '非法的文件路径'})
+            return None
+
+        file_ext = os.path.splitext(relative_path)[1].lower()
+        if file_ext not in BATCH_SUPPORTED_EXTENSIONS:
+            self._rejected.append({'filename': name, 'status': 'skipped', 'error': f'不支持的文件格式: {file_ext}'})
+            return None
+
+        if len(self._inputs) >= BATCH_MAX_FILES:
+            self._rejected.append({'filename': name, 'status': 'skipped', 'error': f'超过单批最多 {BATCH_MAX_FILES} 个文件的限制'})
+            return None
+        return relative_path
+
+    def add_upload(self, file_storage):
+        """暂存一个上传文件"""
+        relative_path = self._accept(os.path.basename(file_storage.filename.replace('\\', '/')))
+        if relative_path is None:
+            return
+        relative_path, staged_path = self._reserve(relative_path)
+        os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+        with instrumentation.stage('upload_save'):
+            file_storage.save(staged_path)
+        self._inputs.append((relative_path, staged_path))
+
+    def add_archive(self, file_storage):
+        """暂存zip压缩包中的所有文件，保留压缩包内的目录结构"""
+        archive_path = os.path.join(self.staging_dir, f'archive_{uuid.uuid4().hex}.zip')
+        os.makedirs(self.staging_dir, exist_ok=True)
+        with instrumentation.stage('upload_save'):
+            file_storage.save(archive_path)
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                total_size = sum(info.file_size for info in members)
+                if total_size > BATCH_MAX_ARCHIVE_BYTES:
+                    raise ValueError(f"压缩包解压后大小超过上限: {total_size} 字节")
+
+                for info in members:
+                    relative_path = self._accept(info.filename)
+                    if relative_path is None:
+                        continue
+                    relative_path, staged_path = self._reserve(relative_path)
+                    os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+                    with archive.open(info) as src, open(staged_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    self._inputs.append((relative_path, staged_path))
+        except zipfile.BadZipFile:
+            raise ValueError(f"无效的zip压缩包: {file_storage.filename}")
+        finally:
+            os.remove(archive_path)
+
+    @property
+    def file_count(self):
+        return len(self._inputs)
+
+    def _output_path(self, relative_path):
+        return os.path.join(self.output_dir, os.path.splitext(relative_path)[0] + BATCH_TARGET_FORMATS[self.target_format])
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.output_dir, 'manifest.json')
+
+    def save(self):
+        """
+        将输入文件列表和批量选项写入暂存目录，并在输出目录写入排队状态的清单，
+        之后由异步任务调用load恢复并执行
+        """
+        os.makedirs(self.staging_dir, exist_ok=True)
+        state = {
+            'batch_id': self.batch_id,
+            'output_dir': self.output_dir,
+            'target_format': self.target_format,
+            'concurrency': self.concurrency,
+            'inputs': self._inputs,
+            'rejected': self._rejected
+        }
+        with open(os.path.join(self.staging_dir, BATCH_STATE_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        self._write_manifest(BATCH_QUEUED, {}, None)
+
+    @classmethod
+    def load(cls, staging_dir):
+        """从暂存目录恢复批量转换"""
+        with open(os.path.join(staging_dir, BATCH_STATE_FILENAME), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        batch = cls(os.path.dirname(staging_dir), state['output_dir'], state['target_format'],
+                    state['concurrency'], state['batch_id'])
+        batch.staging_dir = staging_dir
+        batch._inputs = [tuple(item) for item in state['inputs']]
+        batch._rejected = state['rejected']
+        return batch
+
+    def _write_manifest(self, status, results, start_time):
+        """原子地写入清单，未完成的文件状态为pending"""
+        files = [
+            dict({'filename': relative_path}, **results.get(relative_path, {'status': 'pending'}))
+            for relative_path, _ in self._inputs
+        ]
+        files.extend(self._rejected)
+        manifest = {
+            'batch_id': self.batch_id,
+            'status': status,
+            'format': self.target_format,
+            'output_dir': self.output_dir,
+            'concurrency': self.concurrency,
+            'total': len(files),
+            'completed': len(results),
+            'succeeded': sum(1 for entry in files if entry['status'] == 'succeeded'),
+            'failed': sum(1 for entry in files if entry['status'] == 'failed'),
+            'skipped': len(self._rejected),
+            'processing_time': round(time.time() - start_time, 2) if start_time else None,
+            'files': files
+        }
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        manifest['manifest_path'] = self.manifest_path
+        return manifest
+
+    def _next_slot(self, block):
+        """
+        占用一个批量转换名额，block为False时没有空闲名额立即返回False
+
+        批量任务在后台执行，只等待不拒绝
+        """
+        if block:
+            return batch_admission.acquire(bounded=False)
+        return batch_admission.try_acquire()
+
+    def run(self):
+        """
+        执行批量转换，处理过程中定期更新输出目录中的manifest.json
+
+        Returns:
+            dict: 批量转换清单
+        """
+        start_time = time.time()
+        results = {}
+        pending = {}  # future -> (相对路径, 批量转换名额)
+        self._write_manifest(BATCH_RUNNING, results, start_time)
+
+        logger.info(f"批量转换 {self.batch_id} 开始：{len(self._inputs)} 个文件，目标格式: {self.target_format}，并发进程数: {self.concurrency}")
+        try:
+            if self._inputs:
+                with ProcessPoolExecutor(max_workers=self.concurrency, mp_context=_mp_context(),
+                                         initializer=_init_worker) as executor:
+                    queue = list(self._inputs)
+                    queue.reverse()
+                    last_update = time.monotonic()
+                    # 同一时间最多提交与进程数相同的任务，且每个任务都要先占用一个跨进程的批量转换名额；
+                    # 没有正在转换的文件时等待名额，否则只尝试获取，转换完成或定期轮询时再次尝试
+                    while queue or pending:
+                        while queue and len(pending) < self.concurrency:
+                            token = self._next_slot(block=not pending)
+                            if token is False:
+                                break
+                            relative_path, staged_path = queue.pop()
+                            try:
+                                future = executor.submit(convert_file, staged_path, self.target_format, self._output_path(relative_path))
+                            except Exception:
+                                batch_admission.release(token)
+                                raise
+                            pending[future] = (relative_path, token)
+                        done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            relative_path, token = pending.pop(future)
+                            batch_admission.release(token)
+                            try:
+                                results[relative_path] = future.result()
+                            except Exception as e:
+                                # 转换进程异常退出等情况
+                                results[relative_path] = {'status': 'failed', 'error': str(e)}
+                        if done and time.monotonic() - last_update >= MANIFEST_UPDATE_INTERVAL:
+                            self._write_manifest(BATCH_RUNNING, results, start_time)
+                            last_update = time.monotonic()
+        finally:
+            for _, token in pending.values():
+                batch_admission.release(token)
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+        manifest = self._write_manifest(BATCH_COMPLETED, results, start_time)
+        logger.info(f"批量转换 {self.batch_id} 完成：成功 {manifest['succeeded']}，失败 {manifest['failed']}，"
+                    f"跳过 {manifest['skipped']}，耗时: {manifest['processing_time']:.2f}秒")
+        return manifest
+
+    def discard(self):
+        """放弃本次批量转换，删除暂存文件"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
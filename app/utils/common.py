@@ -152,25 +152,18 @@ def extract_images_from_document(file_path, output_dir, base_filename):
     except Exception as e:
         raise Exception(f"提取图片过程中出错: {str(e)}")
 
-def cleanup_temp_file(file_path, context=""):
-    """
-    清理临时文件，带有重试机制
-    
-    @param {str} file_path - 要删除的文件路径
-    @param {str} context - 上下文信息，用于日志
-    """
-    if os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-            logger.info(f"{context}临时文件已删除: {file_path}")
-        except Exception as e:
-            logger.warning(f"{context}无法删除临时文件: {file_path}, 原因: {str(e)}")
-            # 尝试强制关闭文件句柄后再删除
-            try:
-                import gc
-                gc.collect()  # 触发垃圾回收，释放未关闭的文件句柄
-                os.remove(file_path)
-                logger.info(f"{context}临时文件已删除(第二次尝试): {file_path}")
-            except Exception as e2:
-                logger.error(f"{context}无法删除临时文件(第二次尝试): {file_path}, 原因: {str(e2)}")
-                # 不再尝试删除，避免阻塞程序 
\ No newline at end of file
+
+def is_process_alive(pid):
+    """检查进程是否仍在运行"""
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # 进程存在但无权限，或平台不支持信号0
+        return True
+    return True
@@ -0,0 +1,39 @@
+"""
+转换上下文模块
+记录单次请求（或单个后台任务）内转换过程产生的元数据，例如缓存命中情况，
+供路由在响应中返回
+"""
+import contextvars
+
+# 当前上下文的转换元数据
+_metadata = contextvars.ContextVar('conversion_metadata', default=None)
+
+
+def reset():
+    """开始新的请求或任务时清空元数据"""
+    _metadata.set({})
+
+
+def record(key, value):
+    """记录一项转换元数据"""
+    metadata = _metadata.get()
+    if metadata is None:
+        metadata = {}
+        _metadata.set(metadata)
+    metadata[key] = value
+
+
+def update(values):
+    """批量记录转换元数据"""
+    for key, value in (values or {}).items():
+        record(key, value)
+
+
+def get(key, default=None):
+    """获取一项转换元数据"""
+    return (_metadata.get() or {}).get(key, default)
+
+
+def snapshot():
+    """获取当前全部转换元数据的副本"""
+    return dict(_metadata.get() or {})
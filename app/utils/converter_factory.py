@@ -3,14 +3,34 @@
 提供不同文档格式转换的抽象工厂
 """
 import os
+import sys
 import time
 import logging
 import traceback
 from abc import ABC, abstractmethod
+from importlib.util import find_spec
+
+from app.utils import conversion_context, instrumentation
+from app.utils.result_cache import cached_conversion, content_hash
+from app.utils.document_cache import document_cache
+from app.utils.artifact_store import artifact_store
+from app.utils.engine_registry import get_markitdown
+from app.utils.selection import PageSelector, SelectionError, selection_for
+from app.utils.admission import docling_admission, AdmissionRejected
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# Docling多格式转换支持的输出格式
+DOCLING_OUTPUT_FORMATS = ['md', 'text', 'html', 'json', 'tables']
+# 表格导出支持的格式
+DOCLING_TABLE_FORMATS = ['md', 'csv', 'html']
+
+def _ocr_cache_key():
+    """文本转换结果依赖OCR是否可用及OCR相关配置，需计入缓存键"""
+    from app.utils.converters import _ocr_cache_key as converters_ocr_cache_key
+    return converters_ocr_cache_key()
+
 class BaseConverter(ABC):
     """转换器基类，定义了转换器的通用接口"""
     
@@ -46,17 +66,7 @@ class BaseConverter(ABC):
         return file_ext.lower() in self.supported_input_formats
 
 class MarkItDownConverter(BaseConverter):
-    """使用MarkItDown库的转换器"""
-    
-    def __init__(self):
-        self._has_markitdown = False
-        try:
-            from markitdown import MarkItDown
-            self._has_markitdown = True
-            self._markitdown = MarkItDown(enable_plugins=False)
-            logger.info("成功初始化MarkItDown转换器")
-        except ImportError:
-            logger.warning("无法导入MarkItDown库，将使用替代方法")
+    """使用MarkItDown库的转换器，MarkItDown实例由引擎注册表在第一次转换时创建并在进程内共享"""
     
     @property
     def name(self):
@@ -74,24 +84,27 @@ class MarkItDownConverter(BaseConverter):
             '.md', '.mp3', '.wav', '.xml'
         ]
     
-    def convert_to_text(self, file_path):
-        """使用现有的转换函数进行文本转换"""
+    @cached_conversion('markitdown', 'text', method=True, extra_key=_ocr_cache_key)
+    @instrumentation.timed('parse', converter='markitdown')
+    def convert_to_text(self, file_path, pages=None, slides=None, sheets=None):
+        """使用现有的转换函数进行文本转换，pages、slides、sheets分别只对PDF、PowerPoint和Excel生效"""
         from app.utils.converters import (
             convert_docx, convert_xlsx, convert_pptx,
             convert_pdf, convert_txt, convert_md, convert_xml
         )
         
         file_ext = os.path.splitext(file_path)[1].lower()
+        selection = selection_for(file_path, pages=pages, slides=slides, sheets=sheets)
         
         # 根据文件类型调用相应的转换函数
         if file_ext in ['.doc', '.docx']:
             return convert_docx(file_path)
         elif file_ext in ['.xls', '.xlsx']:
-            return convert_xlsx(file_path)
+            return convert_xlsx(file_path, **selection)
         elif file_ext in ['.ppt', '.pptx']:
-            return convert_pptx(file_path)
+            return convert_pptx(file_path, **selection)
         elif file_ext == '.pdf':
-            return convert_pdf(file_path)
+            return convert_pdf(file_path, **selection)
         elif file_ext == '.txt':
             return convert_txt(file_path)
         elif file_ext == '.md':
@@ -105,8 +118,10 @@ class MarkItDownConverter(BaseConverter):
             logger.error(error_msg)
             raise ValueError(error_msg)
     
-    def convert_to_markdown(self, file_path):
-        """使用MarkItDown将文件转换为Markdown格式"""
+    @cached_conversion('markitdown', 'md', method=True)
+    @instrumentation.timed('parse', converter='markitdown')
+    def convert_to_markdown(self, file_path, pages=None, slides=None, sheets=None):
+        """使用MarkItDown将文件转换为Markdown格式，指定了转换范围时使用只转换选中部分的替代方法"""
         try:
             logger.info(f"使用MarkItDown开始处理文件: {file_path}")
             
@@ -116,9 +131,15 @@ class MarkItDownConverter(BaseConverter):
                 logger.error(error_msg)
                 raise FileNotFoundError(error_msg)
             
-            if self._has_markitdown:
+            selection = selection_for(file_path, pages=pages, slides=slides, sheets=sheets)
+            if selection:
+                from app.utils.converters import convert_to_markdown
+                return convert_to_markdown(file_path, **selection)
+            
+            markitdown = get_markitdown()
+            if markitdown is not None:
                 # 转换文件
-                result = self._markitdown.convert(file_path)
+                result = markitdown.convert(file_path)
                 
                 # 获取Markdown内容
                 markdown_content = result.text_content
@@ -129,6 +150,8 @@ class MarkItDownConverter(BaseConverter):
                 logger.warning("MarkItDown库不可用，使用替代方法")
                 from app.utils.converters import convert_to_markdown
                 return convert_to_markdown(file_path)
+        except SelectionError:
+            raise
         except Exception as e:
             error_msg = f"MarkItDown转换失败: {str(e)}"
             logger.error(error_msg)
@@ -139,33 +162,15 @@ class DoclingConverter(BaseConverter):
     """使用Docling库的转换器"""
     
     def __init__(self):
-        self._has_docling = False
-        self._docling = None
+        # 只检查Docling是否已安装，docling和torch在第一次转换时才导入，不计入工作进程启动耗时；
+        # 推理设备和线程数由转换器池根据DOCLING_DEVICE、DOCLING_NUM_THREADS等配置设置
+        self._has_docling = find_spec('docling') is not None
         
-        try:
-            import docling
-            self._has_docling = True
-            self._docling = docling
+        if self._has_docling:
             logger.info("成功初始化Docling转换器")
-            
-            # 检查是否有CUDA支持
-            self._has_cuda = self._check_cuda_support()
-            if self._has_cuda:
-                logger.info("Docling检测到CUDA支持，将使用GPU加速")
-            else:
-                logger.info("Docling未检测到CUDA支持，将使用CPU模式")
-                
-        except ImportError:
+        else:
             logger.warning("无法导入Docling库，此转换器将不可用")
     
-    def _check_cuda_support(self):
-        """检查系统是否支持CUDA"""
-        try:
-            import torch
-            return torch.cuda.is_available()
-        except ImportError:
-            return False
-    
     @property
     def name(self):
         return "Docling"
@@ -188,8 +193,190 @@ class DoclingConverter(BaseConverter):
             '.tiff', '.bmp', '.md', '.xml'
         ]
     
-    def convert_to_text(self, file_path):
-        """使用Docling将文件转换为纯文本格式"""
+    def convert_document(self, file_path, generate_images=False, do_ocr=True, pages=None, page_images=True):
+        """
+        使用转换器池中预初始化的DocumentConverter转换文件
+        
+        Args:
+            file_path: 文件路径
+            generate_images: 是否生成页面图片和图片元素
+            do_ocr: 是否启用OCR
+            pages: PDF页码范围（如 "3-10"），Docling只支持单个连续范围，范围外的页面不进行版面分析和OCR
+            page_images: generate_images为True时是否保留整页图片，不需要时结果中只包含表格和图片元素的图片
+            
+        Returns:
+            ConversionResult: Docling转换结果，相同内容和选项的结果在解析结果缓存中短时间保留，
+                调用方只能读取，不能修改其中的DoclingDocument
+            
+        Raises:
+            SelectionError: 页码范围不是单个连续范围
+            AdmissionRejected: Docling转换繁忙（等待队列已满或等待超时）
+        """
+        from app.utils.docling_pool import docling_pool
+        
+        kwargs = {}
+        page_spec = None
+        if selection_for(file_path, pages=pages):
+            selector = PageSelector(pages)
+            if not selector.is_contiguous:
+                raise SelectionError(f"Docling只支持单个连续的页码范围，例如 3-10，收到: {selector}")
+            kwargs['page_range'] = (selector.first, selector.last or sys.maxsize)
+            page_spec = str(selector)
+            logger.info(f"Docling只转换选中的页面: {selector}")
+            conversion_context.record('selection', {'pages': page_spec})
+        
+        # 同一内容最近解析过时直接复用，生成了图片的解析结果也可用于不需要图片（或不需要整页图片）的导出
+        file_hash = cache_key = artifact_key = None
+        if document_cache.enabled or artifact_store.enabled:
+            try:
+                file_hash = content_hash(file_path)
+            except OSError:
+                # 文件无法读取时交给Docling自行报错
+                file_hash = None
+        
+        if file_hash is not None and document_cache.enabled:
+            cache_key = document_cache.make_key(file_hash, generate_images, do_ocr, page_spec, page_images)
+            keys = [cache_key]
+            if not generate_images or not page_images:
+                keys.append(document_cache.make_key(file_hash, True, do_ocr, page_spec, True))
+            if not generate_images:
+                keys.append(document_cache.make_key(file_hash, True, do_ocr, page_spec, False))
+            result = document_cache.get(*keys)
+            if result is not None:
+                logger.info(f"Docling解析结果缓存命中: {file_path}")
+                conversion_context.record('document_cache', 'hit')
+                return result
+        
+        # 磁盘上的中间结果不包含页面图片，只用于不需要生成图片的导出
+        if file_hash is not None and artifact_store.enabled and not generate_images:
+            artifact_key = artifact_store.make_key(file_hash, do_ocr, page_spec)
+            result = artifact_store.load(artifact_key, file_path)
+            if result is not None:
+                logger.info(f"加载Docling中间结果，跳过版面分析: {artifact_key}")
+                conversion_context.record('artifact', artifact_key)
+                if cache_key is not None:
+                    document_cache.put(cache_key, result)
+                    conversion_context.record('document_cache', 'miss')
+                return result
+        
+        # 只在实际推理时占用Docling转换名额，上传、参数校验和缓存命中都不占用
+        with docling_admission.slot():
+            with docling_pool.converter(generate_images=generate_images, do_ocr=do_ocr, page_images=page_images) as converter:
+                with instrumentation.stage('docling_inference', converter='docling'):
+                    result = converter.convert(file_path, **kwargs)
+        
+        if cache_key is not None:
+            document_cache.put(cache_key, result)
+            conversion_context.record('document_cache', 'miss')
+        if artifact_key is not None:
+            artifact_store.save(artifact_key, result.document, file_hash, os.path.basename(file_path), do_ocr, page_spec)
+            conversion_context.record('artifact', artifact_key)
+        return result
+    
+    @staticmethod
+    def _markdown_to_text(md_content):
+        """移除标题和列表标记，将Markdown转换为纯文本"""
+        text_lines = []
+        for line in md_content.split('\n'):
+            # 移除标题标记 # 
+            if line.startswith('#'):
+                text_lines.append(line.lstrip('#').strip())
+                continue
+            
+            # 移除列表标记 - *
+            if line.startswith('-') or line.startswith('*'):
+                text_lines.append(line[1:].strip())
+                continue
+            
+            # 保留其他行
+            text_lines.append(line)
+        return '\n'.join(text_lines)
+    
+    @staticmethod
+    def _export_html(document):
+        """将DoclingDocument导出为HTML，确保内容是有效的UTF-8字符串"""
+        try:
+            with instrumentation.stage('serialization', converter='docling'):
+                html_content = document.export_to_html()
+            
+            # 检查编码，尝试解决UTF-8编码问题
+            if isinstance(html_content, bytes):
+                html_content = html_content.decode('utf-8', errors='replace')
+            elif isinstance(html_content, str):
+                # 确保是有效的UTF-8字符串
+                html_content = html_content.encode('utf-8', errors='replace').decode('utf-8')
+        except UnicodeDecodeError as ude:
+            logger.error(f"HTML内容编码错误: {str(ude)}")
+            # 使用replace模式处理编码错误
+            html_content = document.export_to_html().decode('utf-8', errors='replace')
+        return html_content
+    
+    @staticmethod
+    def _export_json(document):
+        """将DoclingDocument导出为可序列化的字典，编码出错时返回替代内容"""
+        # 处理可能出现的编码问题
+        try:
+            import json
+            
+            with instrumentation.stage('serialization', converter='docling'):
+                # 先转为字典
+                json_dict = document.to_dict()
+                
+                # 通过json序列化和反序列化来检查和修复编码问题
+                json_str = json.dumps(json_dict, ensure_ascii=False)
+                json_content = json.loads(json_str)
+            
+            # 如果仍存在问题，进行更彻底的编码处理
+            if not json_content:
+                logger.warning("JSON内容为空，尝试使用替代方法")
+                # 使用markdown导出作为备选
+                markdown_content = document.export_to_markdown()
+                json_content = {
+                    "content": markdown_content,
+                    "warning": "由于编码问题，内容已转换为Markdown格式"
+                }
+            
+        except Exception as json_error:
+            logger.error(f"JSON编码处理错误: {str(json_error)}")
+            # 创建一个基本的JSON结构作为备选
+            json_content = {
+                "error": "无法正确解析JSON结构",
+                "error_message": str(json_error),
+                "fallback_content": str(document)[:1000] + "..."  # 截取部分内容
+            }
+        return json_content
+    
+    @staticmethod
+    def _export_table_contents(document, export_formats):
+        """
+        将DoclingDocument中的表格导出为指定格式的字符串
+        
+        Returns:
+            list: 每个表格的导出内容，包含index及各格式的内容
+        """
+        tables = []
+        with instrumentation.stage('serialization', converter='docling'):
+            for table_ix, table in enumerate(document.tables):
+                item = {'index': table_ix + 1}
+                try:
+                    if 'md' in export_formats or 'csv' in export_formats:
+                        table_df = table.export_to_dataframe()
+                        if 'md' in export_formats:
+                            item['md'] = table_df.to_markdown(index=False)
+                        if 'csv' in export_formats:
+                            item['csv'] = table_df.to_csv(index=False)
+                    if 'html' in export_formats:
+                        item['html'] = table.export_to_html(doc=document)
+                    tables.append(item)
+                except Exception as table_error:
+                    # 继续处理其他表格，不中断
+                    logger.error(f"处理表格 {table_ix + 1} 时出错: {str(table_error)}")
+                    logger.error(traceback.format_exc())
+        return tables
+    
+    @cached_conversion('docling', 'text', method=True)
+    def convert_to_text(self, file_path, pages=None):
+        """使用Docling将文件转换为纯文本格式，pages指定时只转换PDF中选中的页面"""
         try:
             if not self._has_docling:
                 raise ImportError("Docling库不可用")
@@ -197,42 +384,29 @@ class DoclingConverter(BaseConverter):
             logger.info(f"使用Docling开始将文件转换为文本: {file_path}")
             
             # 使用Docling的转换器（先转为Markdown再转为纯文本）
-            md_content = self.convert_to_markdown(file_path)
+            md_content = self.convert_to_markdown(file_path, **selection_for(file_path, pages=pages))
             
             # 移除Markdown格式，获取纯文本
-            lines = md_content.split('\n')
-            text_lines = []
-            
-            for line in lines:
-                # 移除标题标记 # 
-                if line.startswith('#'):
-                    text_lines.append(line.lstrip('#').strip())
-                    continue
-                
-                # 移除列表标记 - *
-                if line.startswith('-') or line.startswith('*'):
-                    text_lines.append(line[1:].strip())
-                    continue
-                
-                # 保留其他行
-                text_lines.append(line)
-            
-            text_content = '\n'.join(text_lines)
+            text_content = self._markdown_to_text(md_content)
             logger.info(f"Docling文本转换完成，生成了 {len(text_content)} 个字符")
             return text_content
             
+        except (SelectionError, AdmissionRejected):
+            raise
         except Exception as e:
             error_msg = f"Docling文本转换失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             raise Exception(error_msg)
     
-    def convert_to_markdown(self, file_path):
+    @cached_conversion('docling', 'md', method=True)
+    def convert_to_markdown(self, file_path, pages=None):
         """
         将指定文件转换为Markdown格式
         
         Args:
             file_path: 文件路径
+            pages: PDF页码范围，只支持单个连续范围，默认转换全部页面
             
         Returns:
             str: Markdown格式的文本内容
@@ -242,29 +416,31 @@ class DoclingConverter(BaseConverter):
             logger.info(f"使用Docling开始将文件转换为Markdown: {file_path}")
             
             try:
-                from docling.document_converter import DocumentConverter
-                converter = DocumentConverter()
                 # 修正API调用方法，Docling没有convert_file_to_md方法
-                result = converter.convert(file_path)
+                result = self.convert_document(file_path, pages=pages)
                 # 使用正确的方法获取Markdown文本
-                markdown_text = result.document.export_to_markdown()
+                with instrumentation.stage('serialization', converter='docling'):
+                    markdown_text = result.document.export_to_markdown()
             except ImportError as e:
                 logger.warning(f"Docling模块导入失败: {str(e)}，尝试使用备用转换方法")
                 # 使用MarkItDown作为备用转换器
                 backup_converter = MarkItDownConverter()
-                markdown_text = backup_converter.convert_to_markdown(file_path)
+                markdown_text = backup_converter.convert_to_markdown(file_path, **selection_for(file_path, pages=pages))
                 
             end_time = time.time()
             logger.info(f"Docling完成将文件转换为Markdown，耗时: {end_time - start_time:.2f}秒")
             return markdown_text
+        except (SelectionError, AdmissionRejected):
+            raise
         except Exception as e:
             error_msg = f"Docling转换失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             raise Exception(error_msg)
     
-    def convert_to_html(self, file_path):
-        """使用Docling将文件转换为HTML格式"""
+    @cached_conversion('docling', 'html', method=True)
+    def convert_to_html(self, file_path, pages=None):
+        """使用Docling将文件转换为HTML格式，pages指定时只转换PDF中选中的页面"""
         try:
             if not self._has_docling:
                 raise ImportError("Docling库不可用")
@@ -287,38 +463,24 @@ class DoclingConverter(BaseConverter):
             # 使用Docling处理文件
             file_name = os.path.basename(file_path)
             
-            # 将文件转换为HTML
-            device = "cuda" if self._has_cuda else "cpu"
-            
             # 使用Docling API调用
-            from docling.document_converter import DocumentConverter
-            converter = DocumentConverter()
-            result = converter.convert(file_path)
+            result = self.convert_document(file_path, pages=pages)
             
             # 使用编码处理，确保HTML内容是有效的UTF-8格式
-            try:
-                html_content = result.document.export_to_html()
-                
-                # 检查编码，尝试解决UTF-8编码问题
-                if isinstance(html_content, bytes):
-                    html_content = html_content.decode('utf-8', errors='replace')
-                elif isinstance(html_content, str):
-                    # 确保是有效的UTF-8字符串
-                    html_content = html_content.encode('utf-8', errors='replace').decode('utf-8')
-            except UnicodeDecodeError as ude:
-                logger.error(f"HTML内容编码错误: {str(ude)}")
-                # 使用replace模式处理编码错误
-                html_content = result.document.export_to_html().decode('utf-8', errors='replace')
+            html_content = self._export_html(result.document)
             
             logger.info(f"Docling转换成功，生成了HTML内容")
             return html_content
             
+        except (SelectionError, AdmissionRejected):
+            raise
         except Exception as e:
             error_msg = f"Docling HTML转换失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             raise Exception(error_msg)
             
+    @cached_conversion('docling', 'json', method=True)
     def convert_to_json(self, file_path):
         """使用Docling将文件转换为JSON格式"""
         try:
@@ -343,52 +505,208 @@ class DoclingConverter(BaseConverter):
             # 使用Docling处理文件
             file_name = os.path.basename(file_path)
             
-            # 将文件转换为JSON
-            device = "cuda" if self._has_cuda else "cpu"
-            
             # 使用Docling API调用
-            from docling.document_converter import DocumentConverter
-            converter = DocumentConverter()
-            result = converter.convert(file_path)
+            result = self.convert_document(file_path)
             
-            # 处理可能出现的编码问题
-            try:
-                import json
-                
-                # 先转为字典
-                json_dict = result.document.to_dict()
-                
-                # 通过json序列化和反序列化来检查和修复编码问题
-                json_str = json.dumps(json_dict, ensure_ascii=False)
-                json_content = json.loads(json_str)
-                
-                # 如果仍存在问题，进行更彻底的编码处理
-                if not json_content:
-                    logger.warning("JSON内容为空，尝试使用替代方法")
-                    # 使用markdown导出作为备选
-                    markdown_content = result.document.export_to_markdown()
-                    json_content = {
-                        "content": markdown_content,
-                        "warning": "由于编码问题，内容已转换为Markdown格式"
-                    }
-                
-            except Exception as json_error:
-                logger.error(f"JSON编码处理错误: {str(json_error)}")
-                # 创建一个基本的JSON结构作为备选
-                json_content = {
-                    "error": "无法正确解析JSON结构",
-                    "error_message": str(json_error),
-                    "fallback_content": str(result.document)[:1000] + "..."  # 截取部分内容
-                }
+            json_content = self._export_json(result.document)
             
             logger.info(f"Docling转换成功，生成了JSON内容")
             return json_content
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             error_msg = f"Docling JSON转换失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             raise Exception(error_msg)
+    
+    @cached_conversion('docling', 'multi', method=True)
+    def convert_to_formats(self, file_path, formats=DOCLING_OUTPUT_FORMATS, table_formats=DOCLING_TABLE_FORMATS, pages=None):
+        """
+        只解析一次文件，从同一个DoclingDocument导出多种格式
+        
+        Args:
+            file_path: 文件路径
+            formats: 输出格式列表，取值见DOCLING_OUTPUT_FORMATS
+            table_formats: formats包含tables时每个表格的导出格式，支持md、csv、html
+            pages: PDF页码范围，只支持单个连续范围，默认转换全部页面
+            
+        Returns:
+            dict: 格式 -> 内容，md、text、html为字符串，json为字典，tables为每个表格的导出内容列表
+        """
+        try:
+            if not self._has_docling:
+                raise ImportError("Docling库不可用")
+            
+            unknown = [fmt for fmt in formats if fmt not in DOCLING_OUTPUT_FORMATS]
+            if unknown:
+                raise ValueError(f"不支持的输出格式: {'、'.join(unknown)}，支持的格式为：{'、'.join(DOCLING_OUTPUT_FORMATS)}")
+            
+            logger.info(f"使用Docling开始将文件转换为多种格式: {file_path}，输出格式: {list(formats)}")
+            start_time = time.time()
+            
+            result = self.convert_document(file_path, pages=pages)
+            document = result.document
+            
+            outputs = {}
+            if 'md' in formats or 'text' in formats:
+                with instrumentation.stage('serialization', converter='docling'):
+                    markdown_text = document.export_to_markdown()
+                if 'md' in formats:
+                    outputs['md'] = markdown_text
+                if 'text' in formats:
+                    outputs['text'] = self._markdown_to_text(markdown_text)
+            if 'html' in formats:
+                outputs['html'] = self._export_html(document)
+            if 'json' in formats:
+                outputs['json'] = self._export_json(document)
+            if 'tables' in formats:
+                outputs['tables'] = self._export_table_contents(document, table_formats)
+            
+            logger.info(f"Docling多格式转换完成，耗时: {time.time() - start_time:.2f}秒")
+            return outputs
+        except (SelectionError, AdmissionRejected):
+            raise
+        except Exception as e:
+            error_msg = f"Docling多格式转换失败: {str(e)}"
+            logger.error(error_msg)
+            logger.error(traceback.format_exc())
+            raise Exception(error_msg)
+    
+    def export_tables(self, file_path, output_dir, export_formats=('md', 'csv', 'html'), base_name=None):
+        """
+        使用Docling提取文件中的表格并导出为指定格式
+        
+        Args:
+            file_path: 文件路径
+            output_dir: 表格文件的输出目录
+            export_formats: 导出格式，支持md、csv、html
+            base_name: 输出文件名前缀，默认使用输入文件名
+            
+        Returns:
+            list: 每个表格的导出信息，包含index及各格式的文件路径
+        """
+        if not self._has_docling:
+            raise ImportError("Docling库不可用")
+        
+        logger.info(f"使用Docling开始提取表格: {file_path}，导出格式: {list(export_formats)}")
+        os.makedirs(output_dir, exist_ok=True)
+        
+        conv_res = self.convert_document(file_path)
+        doc_filename = base_name or conv_res.input.file.stem
+        
+        table_outputs = []
+        for table in self._export_table_contents(conv_res.document, export_formats):
+            table_outputs_item = {'index': table['index']}
+            for fmt in ('csv', 'md', 'html'):
+                if fmt not in table:
+                    continue
+                table_path = os.path.join(output_dir, f"{doc_filename}-table-{table['index']}.{fmt}")
+                with open(table_path, 'w', encoding='utf-8') as f:
+                    f.write(table[fmt])
+                table_outputs_item[f'{fmt}_path'] = table_path
+            table_outputs.append(table_outputs_item)
+            logger.info(f"表格 {table['index']} 导出完成")
+        
+        logger.info(f"Docling表格提取完成，共导出 {len(table_outputs)} 个表格")
+        return table_outputs
+    
+    def export_images(self, file_path, output_dir, base_name=None, image_options=None):
+        """
+        使用Docling将文件转换为Markdown，并导出页面、表格和图片元素的图片
+        
+        Args:
+            file_path: 文件路径
+            output_dir: Markdown和图片的输出目录
+            base_name: 输出文件名前缀，默认使用输入文件名
+            image_options: 图片导出选项（格式、质量、缩放比例、是否导出整页图片），
+                默认使用image_export.default_options()
+            
+        Returns:
+            dict: 包含md_path、doc_filename、page_count以及page_images、table_images、picture_images路径列表
+        """
+        if not self._has_docling:
+            raise ImportError("Docling库不可用")
+        
+        from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
+        from app.utils import image_export
+        
+        logger.info(f"使用Docling开始转换文件并导出图片: {file_path}")
+        os.makedirs(output_dir, exist_ok=True)
+        image_options = image_options or image_export.default_options()
+        extension = image_export.image_extension(image_options)
+        
+        # 不导出整页图片时使用不保留页面图片的管线
+        conv_res = self.convert_document(file_path, generate_images=True, page_images=image_options['page_images'])
+        doc_filename = base_name or conv_res.input.file.stem
+        
+        with instrumentation.stage('image_export', converter='docling'):
+            # 收集需要保存的图片，编码在线程池中并行进行
+            tasks = []
+            kinds = []
+            picture_tasks = []  # 每个图片元素在tasks中的位置，没有图片的元素为None
+            if image_options['page_images']:
+                for _, page in conv_res.document.pages.items():
+                    if getattr(page, 'image', None) is not None and getattr(page.image, 'pil_image', None) is not None:
+                        page_image_path = os.path.join(output_dir, f"{doc_filename}-page-{page.page_no}{extension}")
+                        tasks.append((page.image.pil_image, page_image_path, f"页面 {page.page_no} "))
+                        kinds.append('page')
+                    else:
+                        logger.warning(f"页面 {page.page_no} 没有可用的图片")
+        
+            # 表格和图片元素只有成功获取图片时才增加编号
+            counters = {'table': 0, 'picture': 0}
+            for element, _level in conv_res.document.iterate_items():
+                if isinstance(element, TableItem):
+                    kind = 'table'
+                elif isinstance(element, PictureItem):
+                    kind = 'picture'
+                    picture_tasks.append(None)
+                else:
+                    continue
+            
+                try:
+                    image = element.get_image(conv_res.document)
+                    if image is None:
+                        logger.warning(f"无法获取{kind}图片，图片为None")
+                        continue
+                    counters[kind] += 1
+                    image_path = os.path.join(output_dir, f"{doc_filename}-{kind}-{counters[kind]}{extension}")
+                    if kind == 'picture':
+                        picture_tasks[-1] = len(tasks)
+                    tasks.append((image, image_path, kind))
+                    kinds.append(kind)
+                except Exception as e:
+                    logger.warning(f"处理{kind}图片时出错: {str(e)}")
+        
+            saved = image_export.save_images(tasks, image_options)
+            images = {'page': [], 'table': [], 'picture': []}
+            for kind, path in zip(kinds, saved):
+                if path is not None:
+                    images[kind].append(path)
+            
+            # 保存Markdown文件，图片元素引用上面已保存的图片文件
+            md_path = os.path.join(output_dir, f"{doc_filename}.md")
+            markdown_text = conv_res.document.export_to_markdown(
+                image_mode=ImageRefMode.PLACEHOLDER,
+                image_placeholder=image_export.MARKDOWN_IMAGE_PLACEHOLDER
+            )
+            picture_paths = [saved[index] if index is not None else None for index in picture_tasks]
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(image_export.reference_images(markdown_text, picture_paths))
+            logger.info(f"Markdown已保存到: {md_path}")
+        
+        page_images, table_images, picture_images = images['page'], images['table'], images['picture']
+        logger.info(f"Docling图片导出完成，页面 {len(page_images)} 张，表格 {len(table_images)} 张，图片 {len(picture_images)} 张")
+        return {
+            'md_path': md_path,
+            'doc_filename': doc_filename,
+            'page_count': len(conv_res.document.pages),
+            'page_images': page_images,
+            'table_images': table_images,
+            'picture_images': picture_images
+        }
 
 class ConverterFactory:
     """转换器工厂类，负责创建和管理各种转换器实例"""
@@ -1,8 +1,3 @@
-import docx
-import openpyxl
-from pptx import Presentation
-import PyPDF2
-import markdown
 import os
 import logging
 import traceback
@@ -10,57 +5,58 @@ import sys
 import subprocess
 import tempfile
 import io
-from PIL import Image
+import time
+from collections import deque
+from importlib.util import find_spec
 
-# 导入OCR工具
-try:
-    from app.utils.ocr_utils import extract_text_from_image, extract_text_from_image_bytes, extract_text_from_pdf_images, HAS_TESSERACT
-except ImportError:
-    HAS_TESSERACT = False
-    logger = logging.getLogger(__name__)
-    logger.warning("无法导入OCR工具模块，图片文字识别功能将不可用")
-
-# 导入MarkItDown
-try:
-    from markitdown import MarkItDown
-    HAS_MARKITDOWN = True
-    logger = logging.getLogger(__name__)
-    logger.info("成功导入MarkItDown库")
-except ImportError:
-    HAS_MARKITDOWN = False
-    logger = logging.getLogger(__name__)
-    logger.warning("无法导入MarkItDown库，将使用替代方法进行文档转Markdown")
+from app.utils import conversion_context, instrumentation
+from app.utils.result_cache import cached_conversion
+from app.utils.engine_registry import get_markitdown
+from app.utils.selection import PageSelector, SheetSelector, SelectionError, selection_for
+from app.utils.ocr_utils import (
+    extract_text_from_pdf_images, has_tesseract, ocr_engine_name,
+    ocr_embedded_images, embedded_image_executor, EmbeddedImageOCR,
+    OCR_MIN_IMAGE_PIXELS, OCR_MAX_IMAGE_SIDE
+)
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
-# 尝试导入处理.doc文件所需的库
-HAS_TEXTRACT = False
-HAS_WIN32 = False
+# docx、openpyxl、pptx、PyPDF2、markdown等文档库在对应转换函数中导入，
+# 可选依赖只检查是否已安装而不导入，工作进程启动时不加载任何文档处理库
+HAS_WIN32 = sys.platform == 'win32' and find_spec('win32com') is not None
+HAS_TEXTRACT = find_spec('textract') is not None
+HAS_PYDUB = find_spec('pydub') is not None
 
-try:
-    import win32com.client
-    HAS_WIN32 = sys.platform == 'win32'
-    logger.info("成功导入win32com库")
-except ImportError:
+if not HAS_WIN32:
     logger.warning("无法导入win32com库，将无法使用COM方式处理.doc文件")
-
-try:
-    import textract # type: ignore
-    HAS_TEXTRACT = True
-    logger.info("成功导入textract库")
-except ImportError:
+if not HAS_TEXTRACT:
     logger.warning("无法导入textract库，将使用替代方法处理.doc文件")
-
-# 尝试导入音频处理库
-try:
-    import pydub
-    HAS_PYDUB = True
-    logger.info("成功导入pydub库")
-except ImportError:
-    HAS_PYDUB = False
+if not HAS_PYDUB:
     logger.warning("无法导入pydub库，将无法处理音频文件")
 
+# Excel每个工作表最多读取的行数，0表示不限制
+XLSX_MAX_ROWS_PER_SHEET = int(os.environ.get('XLSX_MAX_ROWS_PER_SHEET', '0'))
+
+# PDF页面文本层的非空白字符数低于该值时视为扫描页，需要OCR
+PDF_OCR_MIN_TEXT_CHARS = int(os.environ.get('PDF_OCR_MIN_TEXT_CHARS', '50'))
+# PDF页面中图片覆盖的面积占比达到该值时视为图片页，需要OCR
+PDF_OCR_IMAGE_COVERAGE = float(os.environ.get('PDF_OCR_IMAGE_COVERAGE', '0.5'))
+# PowerPoint转换时最多同时等待图片OCR结果的幻灯片数量
+PPTX_OCR_PENDING_SLIDES = int(os.environ.get('PPTX_OCR_PENDING_SLIDES', '8'))
+
+def _ocr_cache_key():
+    """OCR是否可用、使用的OCR引擎以及决定哪些页面和图片需要OCR的配置会影响转换结果，需计入缓存键"""
+    return {
+        'ocr': ocr_engine_name(),
+        'pdf_ocr_min_text_chars': PDF_OCR_MIN_TEXT_CHARS,
+        'pdf_ocr_image_coverage': PDF_OCR_IMAGE_COVERAGE,
+        'ocr_min_image_pixels': OCR_MIN_IMAGE_PIXELS,
+        'ocr_max_image_side': OCR_MAX_IMAGE_SIDE
+    }
+
+@cached_conversion('legacy', 'text', extra_key=_ocr_cache_key)
+@instrumentation.timed('parse', converter='legacy')
 def convert_docx(file_path):
     """将Word文档转换为文本"""
     try:
@@ -83,6 +79,7 @@ def convert_docx(file_path):
         # 处理.docx格式（新版Word）
         logger.info("处理.docx格式文件")
         try:
+            import docx
             doc = docx.Document(file_path)
             full_text = []
             
@@ -136,7 +133,7 @@ def convert_docx(file_path):
                     full_text.append("")  # 表格之间添加空行
             
             # 处理文档中的图片
-            if HAS_TESSERACT:
+            if has_tesseract():
                 logger.info("开始处理文档中的图片")
                 image_texts = extract_images_from_docx(doc, file_path)
                 if image_texts:
@@ -163,48 +160,31 @@ def convert_docx(file_path):
         raise Exception(error_msg)
 
 def extract_images_from_docx(doc, file_path):
-    """从Word文档中提取图片并识别文本"""
+    """从Word文档中提取图片并识别文本，图片在内存中解码并并行识别"""
     try:
         logger.info("开始从Word文档提取图片")
-        image_texts = []
+        blobs = []
         
-        # 创建临时目录存储图片
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 提取文档中的所有关系
-            image_count = 0
-            
-            # 遍历文档中的所有部分
-            for rel in doc.part.rels.values():
-                # 检查是否是图片
-                if "image" in rel.target_ref:
-                    try:
-                        image_count += 1
-                        logger.info(f"处理图片 #{image_count}: {rel.target_ref}")
-                        
-                        # 获取图片数据
-                        image_part = rel.target_part
-                        image_bytes = image_part.blob
-                        
-                        # 保存图片到临时文件
-                        image_path = os.path.join(temp_dir, f"image_{image_count}.png")
-                        with open(image_path, "wb") as f:
-                            f.write(image_bytes)
-                        
-                        # 提取图片文本
-                        text = extract_text_from_image(image_path)
-                        if text and text != "[图片中未检测到文本]":
-                            image_texts.append(text)
-                    except Exception as e:
-                        logger.warning(f"处理图片 #{image_count} 时出错: {str(e)}")
-            
-            logger.info(f"从Word文档中提取了 {image_count} 张图片，识别出 {len(image_texts)} 张图片中的文本")
+        # 遍历文档中的所有关系
+        for rel in doc.part.rels.values():
+            # 检查是否是图片
+            if "image" in rel.target_ref:
+                try:
+                    # 获取图片数据
+                    blobs.append(rel.target_part.blob)
+                    logger.debug(f"读取图片 #{len(blobs)}: {rel.target_ref}")
+                except Exception as e:
+                    logger.warning(f"读取图片 {rel.target_ref} 时出错: {str(e)}")
         
+        image_texts = [text for text in ocr_embedded_images(blobs) if text]
+        logger.info(f"从Word文档中提取了 {len(blobs)} 张图片，识别出 {len(image_texts)} 张图片中的文本")
         return image_texts
     except Exception as e:
         logger.error(f"提取Word文档图片时出错: {str(e)}")
         logger.error(traceback.format_exc())
         return []
 
+@instrumentation.timed('parse', converter='legacy')
 def convert_doc_to_text(file_path):
     """使用替代方法将.doc文件转换为文本"""
     word_app = None
@@ -217,6 +197,7 @@ def convert_doc_to_text(file_path):
             try:
                 logger.info("尝试使用textract库提取文本")
                 # 尝试检测编码
+                import textract # type: ignore
                 text_bytes = textract.process(file_path)
                 
                 # 尝试不同的编码解码文本
@@ -250,6 +231,7 @@ def convert_doc_to_text(file_path):
                 temp_docx = os.path.join(temp_dir, "temp.docx")
                 
                 # 使用Word转换doc到docx
+                import win32com.client
                 word_app = win32com.client.Dispatch("Word.Application")
                 word_app.visible = False
                 
@@ -384,76 +366,149 @@ def convert_doc_to_text(file_path):
             except:
                 pass
 
-def convert_xlsx(file_path):
-    """将Excel文件转换为文本"""
-    wb = None
-    try:
-        logger.info(f"开始处理Excel文件: {file_path}")
-        
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            error_msg = f"文件不存在: {file_path}"
-            logger.error(error_msg)
-            raise FileNotFoundError(error_msg)
-            
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        text_content = []
+def _xlsx_cache_key():
+    """每个工作表的行数上限会影响转换结果，需计入缓存键"""
+    return {'max_rows_per_sheet': XLSX_MAX_ROWS_PER_SHEET}
+
+@instrumentation.timed('parse', converter='legacy')
+def iter_xlsx_lines(file_path, max_rows_per_sheet=None, sheets=None):
+    """
+    以只读模式流式读取Excel文件，逐行生成文本
+    
+    工作簿不会被完整加载到内存，每行读取后立即生成，未选中的工作表不会被读取，
+    处理完成后将行数和处理速度记录到转换上下文的xlsx项中
+    
+    Args:
+        file_path: Excel文件路径
+        max_rows_per_sheet: 每个工作表最多读取的行数，默认使用XLSX_MAX_ROWS_PER_SHEET，0表示不限制
+        sheets: 工作表选择（逗号分隔的名称或从1开始的序号），默认读取全部工作表
         
+    Yields:
+        str: 一行文本（不含换行符），按换行符连接即为完整的转换结果
+    """
+    if max_rows_per_sheet is None:
+        max_rows_per_sheet = XLSX_MAX_ROWS_PER_SHEET
+    
+    # 检查文件是否存在
+    if not os.path.exists(file_path):
+        error_msg = f"文件不存在: {file_path}"
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+    
+    start_time = time.time()
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
         # 记录工作表数量
         sheet_count = len(wb.sheetnames)
         logger.info(f"Excel文件包含 {sheet_count} 个工作表")
         
-        for sheet_name in wb.sheetnames:
+        sheet_names = wb.sheetnames
+        if sheets:
+            sheet_names = SheetSelector(sheets).select(wb.sheetnames)
+            logger.info(f"只读取选中的工作表: {sheet_names}")
+            conversion_context.record('selection', {'sheets': sheets, 'total': sheet_count, 'selected': len(sheet_names)})
+        
+        total_rows = 0
+        sheet_stats = []
+        for sheet_name in sheet_names:
             sheet = wb[sheet_name]
-            
-            # 确保工作表名称使用UTF-8编码
-            if any(ord(c) > 127 for c in sheet_name):
-                logger.debug(f"工作表名称 '{sheet_name}' 包含非ASCII字符，确保UTF-8编码")
-            
-            text_content.append(f"工作表: {sheet_name}")
             logger.debug(f"处理工作表: {sheet_name}")
+            yield f"工作表: {sheet_name}"
             
-            # 获取工作表的行列数
-            row_count = sheet.max_row
-            col_count = sheet.max_column
-            logger.debug(f"工作表 {sheet_name} 包含 {row_count} 行, {col_count} 列")
-            
+            row_count = 0
+            truncated = False
             for row in sheet.iter_rows(values_only=True):
-                # 处理每个单元格，确保使用UTF-8编码
-                processed_cells = []
-                for cell in row:
-                    cell_text = str(cell) if cell is not None else ''
-                    
-                    # 检查是否包含非ASCII字符
-                    if cell_text and any(ord(c) > 127 for c in cell_text):
-                        logger.debug(f"单元格内容包含非ASCII字符，确保UTF-8编码")
-                    
-                    processed_cells.append(cell_text)
-                
-                row_text = '\t'.join(processed_cells)
-                text_content.append(row_text)
+                if max_rows_per_sheet and row_count >= max_rows_per_sheet:
+                    truncated = True
+                    break
+                row_count += 1
+                yield '\t'.join(str(cell) if cell is not None else '' for cell in row)
+            
+            if truncated:
+                logger.warning(f"工作表 {sheet_name} 超过 {max_rows_per_sheet} 行，已截断")
+                yield f"[工作表超过 {max_rows_per_sheet} 行，其余行已省略]"
+            yield '\n'
             
-            text_content.append('\n')
+            total_rows += row_count
+            sheet_stats.append({'name': sheet_name, 'rows': row_count, 'truncated': truncated})
         
-        result = '\n'.join(text_content)
+        elapsed = time.time() - start_time
+        rows_per_second = round(total_rows / elapsed, 1) if elapsed > 0 else None
+        logger.info(f"Excel文件读取完成，共 {total_rows} 行，耗时: {elapsed:.2f}秒，速度: {rows_per_second} 行/秒")
+        conversion_context.record('xlsx', {
+            'rows': total_rows,
+            'sheets': sheet_stats,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': rows_per_second
+        })
+    finally:
+        # 只读模式下需要显式关闭工作簿，释放文件句柄
+        wb.close()
+        logger.debug("Excel工作簿已关闭")
+
+def write_xlsx_text(file_path, output_path, max_rows_per_sheet=None, sheets=None):
+    """
+    将Excel文件流式转换为文本并直接写入输出文件，内存占用与工作簿大小无关
+    
+    Returns:
+        int: 写入的字符数
+    """
+    try:
+        logger.info(f"开始流式处理Excel文件: {file_path} -> {output_path}")
+        char_count = 0
+        # 先写入临时文件，转换失败时不会留下不完整的输出文件
+        tmp_path = output_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for i, line in enumerate(iter_xlsx_lines(file_path, max_rows_per_sheet, sheets=sheets)):
+                    if i > 0:
+                        f.write('\n')
+                        char_count += 1
+                    f.write(line)
+                    char_count += len(line)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"Excel文件处理完成，写入了 {char_count} 个字符")
+        return char_count
+    except SelectionError:
+        raise
+    except Exception as e:
+        error_msg = f"Excel文件转换失败: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise Exception(error_msg)
+
+@cached_conversion('legacy', 'text', extra_key=_xlsx_cache_key)
+def convert_xlsx(file_path, max_rows_per_sheet=None, sheets=None):
+    """将Excel文件转换为文本，sheets指定时只转换选中的工作表"""
+    try:
+        logger.info(f"开始处理Excel文件: {file_path}")
+        result = '\n'.join(iter_xlsx_lines(file_path, max_rows_per_sheet, sheets=sheets))
         logger.info(f"Excel文件处理完成，提取了 {len(result)} 个字符")
         return result
+    except SelectionError:
+        raise
     except Exception as e:
         error_msg = f"Excel文件转换失败: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         raise Exception(error_msg)
-    finally:
-        # 确保关闭工作簿，释放文件句柄
-        if wb is not None:
-            try:
-                wb._archive.close()
-                logger.debug("Excel工作簿已关闭")
-            except Exception as e:
-                logger.warning(f"关闭Excel工作簿时出错: {str(e)}")
 
-def convert_pptx(file_path):
-    """将PowerPoint文件转换为文本"""
+@instrumentation.timed('parse', converter='legacy')
+def iter_pptx_parts(file_path, slides=None):
+    """
+    逐张幻灯片将PowerPoint文件转换为文本
+    
+    Args:
+        file_path: PowerPoint文件路径
+        slides: 幻灯片范围（如 "1-3,5"），默认转换全部幻灯片，未选中的幻灯片不提取形状也不识别图片
+    
+    Yields:
+        str: 文本片段，按换行符连接即为完整的转换结果
+    """
     try:
         logger.info(f"开始处理PowerPoint文件: {file_path}")
         
@@ -463,18 +518,46 @@ def convert_pptx(file_path):
             logger.error(error_msg)
             raise FileNotFoundError(error_msg)
             
+        from pptx import Presentation
         prs = Presentation(file_path)
-        text_content = []
         
         # 记录幻灯片数量
         slide_count = len(prs.slides)
         logger.info(f"PowerPoint文件包含 {slide_count} 张幻灯片")
         
-        # 创建临时目录存储图片
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 处理每张幻灯片
-            for i, slide in enumerate(prs.slides):
-                text_content.append(f"幻灯片 #{i+1}")
+        slide_numbers = range(1, slide_count + 1)
+        if slides:
+            slide_numbers = PageSelector(slides).numbers(slide_count)
+            logger.info(f"只转换选中的幻灯片: {slides}")
+            conversion_context.record('selection', {'slides': slides, 'total': slide_count, 'selected': len(slide_numbers)})
+        
+        def resolve_slide(parts):
+            """等待幻灯片中图片的OCR结果，按形状顺序返回文本片段"""
+            resolved = []
+            with instrumentation.stage('ocr', converter='legacy'):
+                for part in parts:
+                    if isinstance(part, str):
+                        resolved.append(part)
+                        continue
+                    image_no, future = part
+                    img_text = future.result()
+                    if img_text:
+                        resolved.append(f"[图片 #{image_no} 文本:]")
+                        resolved.append(img_text)
+            return resolved
+        
+        # 图片在内存中解码并在线程池中并行识别（相同的图片只识别一次），识别结果按幻灯片顺序输出，
+        # 同时等待OCR结果的幻灯片数量有上限
+        with embedded_image_executor() as executor:
+            recognizer = EmbeddedImageOCR(executor)
+            pending = deque()
+            max_pending = max(1, PPTX_OCR_PENDING_SLIDES)
+            
+            # 处理每张选中的幻灯片
+            for slide_no in slide_numbers:
+                i = slide_no - 1
+                slide = prs.slides[i]
+                parts = [f"幻灯片 #{i+1}"]
                 logger.debug(f"处理幻灯片 #{i+1}")
                 
                 shape_count = 0
@@ -488,57 +571,168 @@ def convert_pptx(file_path):
                     # 提取文本形状
                     if hasattr(shape, "text") and shape.text:
                         text_shape_count += 1
-                        
-                        # 确保形状文本使用UTF-8编码
-                        shape_text = shape.text
-                        if any(ord(c) > 127 for c in shape_text):
-                            logger.debug(f"幻灯片 #{i+1} 形状文本包含非ASCII字符，确保UTF-8编码")
-                        
-                        text_content.append(shape_text)
+                        parts.append(shape.text)
                     
                     # 提取图片
-                    if HAS_TESSERACT and shape.shape_type == 13:  # MSO_SHAPE_TYPE.PICTURE
+                    if shape.shape_type == 13 and has_tesseract():  # MSO_SHAPE_TYPE.PICTURE
                         try:
+                            image_bytes = shape.image.blob
                             image_count += 1
-                            logger.info(f"处理幻灯片 #{i+1} 中的图片 #{image_count}")
-                            
-                            # 保存图片到临时文件
-                            image_path = os.path.join(temp_dir, f"slide_{i+1}_image_{image_count}.png")
-                            
-                            # 获取图片数据
-                            image = shape.image
-                            image_bytes = image.blob
-                            
-                            with open(image_path, "wb") as f:
-                                f.write(image_bytes)
-                            
-                            # 提取图片文本
-                            img_text = extract_text_from_image(image_path)
-                            if img_text and img_text != "[图片中未检测到文本]":
-                                text_content.append(f"[图片 #{image_count} 文本:]")
-                                
-                                # 确保OCR识别的文本使用UTF-8编码
-                                if any(ord(c) > 127 for c in img_text):
-                                    logger.debug(f"幻灯片 #{i+1} 图片 #{image_count} 文本包含非ASCII字符，确保UTF-8编码")
-                                
-                                text_content.append(img_text)
+                            parts.append((image_count, recognizer.submit(image_bytes)))
                         except Exception as e:
-                            logger.warning(f"处理幻灯片图片时出错: {str(e)}")
+                            logger.warning(f"读取幻灯片 #{i+1} 中的图片时出错: {str(e)}")
                 
                 logger.debug(f"幻灯片 #{i+1} 包含 {shape_count} 个形状，其中 {text_shape_count} 个包含文本，{image_count} 个图片")
-                text_content.append('\n')
+                parts.append('\n')
+                pending.append(parts)
+                
+                # 输出OCR已全部完成的幻灯片，等待的幻灯片过多时阻塞等待最早的一张
+                while pending and (len(pending) > max_pending or all(
+                        isinstance(part, str) or part[1].done() for part in pending[0])):
+                    yield from resolve_slide(pending.popleft())
+            
+            while pending:
+                yield from resolve_slide(pending.popleft())
         
-        result = '\n'.join(text_content)
-        logger.info(f"PowerPoint文件处理完成，提取了 {len(result)} 个字符")
-        return result
+        if recognizer.stats()['images']:
+            conversion_context.record('image_ocr', recognizer.stats())
+        logger.info(f"PowerPoint文件处理完成，共 {slide_count} 张幻灯片")
+    except SelectionError:
+        raise
     except Exception as e:
         error_msg = f"PowerPoint文件转换失败: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         raise Exception(error_msg)
 
-def convert_pdf(file_path):
-    """将PDF文件转换为文本"""
+@cached_conversion('legacy', 'text', extra_key=_ocr_cache_key)
+def convert_pptx(file_path, slides=None):
+    """将PowerPoint文件转换为文本，slides指定时只转换选中的幻灯片"""
+    result = '\n'.join(iter_pptx_parts(file_path, slides=slides))
+    logger.info(f"PowerPoint文件转换完成，提取了 {len(result)} 个字符")
+    return result
+
+def _page_xobjects(resources):
+    """返回资源字典中的图片XObject名称集合和Form XObject（名称到对象的映射）"""
+    image_names, forms = set(), {}
+    if resources is None:
+        return image_names, forms
+    xobjects = resources.get_object().get('/XObject')
+    if xobjects is None:
+        return image_names, forms
+    for name, xobj in xobjects.get_object().items():
+        xobj = xobj.get_object()
+        subtype = xobj.get('/Subtype')
+        if subtype == '/Image':
+            image_names.add(name)
+        elif subtype == '/Form':
+            forms[name] = xobj
+    return image_names, forms
+
+def _form_image_area(form, pdf, path, areas):
+    """
+    统计Form XObject中绘制的图片面积（Form所在坐标系下），递归进入嵌套的Form XObject
+
+    面积只与变换矩阵的行列式有关，解析内容流时只跟踪行列式；
+    path为当前递归路径上的Form，防止循环引用；areas缓存已计算的Form
+    """
+    from PyPDF2.generic import ContentStream
+
+    key = id(form)
+    if key in areas:
+        return areas[key]
+    if key in path:
+        return 0.0
+    path.add(key)
+    area = 0.0
+    try:
+        image_names, forms = _page_xobjects(form.get('/Resources'))
+        matrix = [float(v) for v in form.get('/Matrix', [1, 0, 0, 1, 0, 0])]
+        scale = matrix[0] * matrix[3] - matrix[1] * matrix[2]
+        saved = []
+        for operands, operator in ContentStream(form, pdf).operations:
+            if operator == b'q':
+                saved.append(scale)
+            elif operator == b'Q':
+                scale = saved.pop() if saved else scale
+            elif operator == b'cm' and len(operands) >= 4:
+                scale *= float(operands[0]) * float(operands[3]) - float(operands[1]) * float(operands[2])
+            elif operator == b'INLINE IMAGE':
+                area += abs(scale)
+            elif operator == b'Do' and operands:
+                if operands[0] in image_names:
+                    area += abs(scale)
+                elif operands[0] in forms:
+                    area += abs(scale) * _form_image_area(forms[operands[0]], pdf, path, areas)
+    except Exception as e:
+        logger.debug(f"解析Form XObject失败: {str(e)}")
+    path.discard(key)
+    areas[key] = area
+    return area
+
+def _analyze_pdf_page(page):
+    """
+    提取PDF页面的文本层，同时统计文本密度和图片覆盖面积
+    
+    图片面积根据绘制图片时的变换矩阵计算（图片在单位正方形内绘制），
+    与文本提取在同一次内容流解析中完成；通过Form XObject绘制的图片递归统计
+    
+    Returns:
+        (页面文本, 非空白字符数, 图片覆盖面积占比)
+    """
+    image_names, forms = set(), {}
+    try:
+        image_names, forms = _page_xobjects(page.get('/Resources'))
+    except Exception as e:
+        logger.debug(f"读取页面图片资源失败: {str(e)}")
+    
+    image_area = 0.0
+    form_areas = {}
+    # 文本提取会进入Form XObject并对其中的操作调用visitor，这些操作已在_form_image_area中统计
+    nesting = 0
+    
+    def visit_before(operator, operands, cm, tm):
+        nonlocal image_area, nesting
+        if nesting == 0:
+            scale = abs(cm[0] * cm[3] - cm[1] * cm[2])
+            if operator == b'INLINE IMAGE':
+                image_area += scale
+            elif operator == b'Do' and operands:
+                if operands[0] in image_names:
+                    image_area += scale
+                elif operands[0] in forms:
+                    image_area += scale * _form_image_area(forms[operands[0]], page.pdf, set(), form_areas)
+        if operator == b'Do':
+            nesting += 1
+    
+    def visit_after(operator, operands, cm, tm):
+        nonlocal nesting
+        if operator == b'Do':
+            nesting -= 1
+    
+    page_text = page.extract_text(visitor_operand_before=visit_before, visitor_operand_after=visit_after) or ''
+    
+    page_area = abs(float(page.mediabox.width) * float(page.mediabox.height))
+    image_coverage = min(1.0, image_area / page_area) if page_area else 0.0
+    text_chars = sum(1 for c in page_text if not c.isspace())
+    return page_text, text_chars, round(image_coverage, 3)
+
+def _needs_ocr(text_chars, image_coverage):
+    """文本层过少（扫描页）或图片占据大部分版面（图片页）的页面需要OCR"""
+    return text_chars < PDF_OCR_MIN_TEXT_CHARS or image_coverage >= PDF_OCR_IMAGE_COVERAGE
+
+@instrumentation.timed('parse', converter='legacy')
+def iter_pdf_parts(file_path, pages=None):
+    """
+    逐页将PDF文件转换为文本，文本层页面提取后立即生成，需要OCR的页面在最后统一识别
+    
+    Args:
+        file_path: PDF文件路径
+        pages: 页码范围（如 "1-3,5"），默认转换全部页面，未选中的页面不提取文本也不进行OCR
+    
+    Yields:
+        str: 文本片段，按换行符连接即为完整的转换结果
+    """
     pdf_file = None
     try:
         logger.info(f"开始处理PDF文件: {file_path}")
@@ -550,21 +744,29 @@ def convert_pdf(file_path):
             raise FileNotFoundError(error_msg)
             
         with open(file_path, 'rb') as file:
+            import PyPDF2
             reader = PyPDF2.PdfReader(file)
             pdf_file = file  # 保存文件引用以便在finally中关闭
-            text_content = []
+            page_stats = []
             
             # 记录页面数量
             page_count = len(reader.pages)
             logger.info(f"PDF文件包含 {page_count} 页")
             
-            # 提取文本内容
-            for i in range(page_count):
+            page_numbers = range(1, page_count + 1)
+            if pages:
+                page_numbers = PageSelector(pages).numbers(page_count)
+                logger.info(f"只转换选中的页面: {pages}")
+                conversion_context.record('selection', {'pages': pages, 'total': page_count, 'selected': len(page_numbers)})
+            
+            # 提取文本内容，并根据文本密度和图片覆盖面积判断页面是否需要OCR
+            for page_no in page_numbers:
+                i = page_no - 1
                 page = reader.pages[i]
                 logger.debug(f"处理第 {i+1} 页")
                 
                 try:
-                    page_text = page.extract_text()
+                    page_text, text_chars, image_coverage = _analyze_pdf_page(page)
                     
                     # 确保页面文本使用UTF-8编码
                     if page_text:
@@ -572,39 +774,51 @@ def convert_pdf(file_path):
                         if any(ord(c) > 127 for c in page_text):
                             logger.debug(f"页面 {i+1} 包含非ASCII字符，确保UTF-8编码")
                         
-                        text_content.append(f"页面 #{i+1}")
-                        text_content.append(page_text)
+                        yield f"页面 #{i+1}"
+                        yield page_text
                     else:
-                        text_content.append(f"页面 #{i+1}")
-                        text_content.append("[此页无文本内容]")
+                        yield f"页面 #{i+1}"
+                        yield "[此页无文本内容]"
+                    needs_ocr = _needs_ocr(text_chars, image_coverage)
                 except Exception as page_error:
                     logger.warning(f"提取第 {i+1} 页文本时出错: {str(page_error)}")
-                    text_content.append(f"页面 #{i+1} [提取文本失败]")
+                    yield f"页面 #{i+1} [提取文本失败]"
+                    text_chars, image_coverage, needs_ocr = 0, None, True
                 
-                text_content.append('\n')
+                page_stats.append({
+                    'page': i + 1,
+                    'text_chars': text_chars,
+                    'image_coverage': image_coverage,
+                    'path': 'ocr' if needs_ocr and has_tesseract() else 'text'
+                })
+                yield '\n'
+            
+            ocr_pages = [stat['page'] for stat in page_stats if stat['path'] == 'ocr']
+            logger.info(f"PDF页面分流完成：{len(page_stats) - len(ocr_pages)} 页使用文本层，{len(ocr_pages)} 页需要OCR")
+            conversion_context.record('pdf_pages', page_stats)
             
-            # 处理PDF中的图片（如果有）
-            if HAS_TESSERACT:
-                logger.info("开始处理PDF中的图片")
-                image_texts = extract_text_from_pdf_images(file_path)
+            # 只对扫描页和图片页进行栅格化和OCR
+            if ocr_pages:
+                logger.info(f"开始识别PDF页面图片: {ocr_pages}")
+                image_texts = extract_text_from_pdf_images(file_path, page_numbers=ocr_pages)
                 if image_texts:
-                    text_content.append("--- PDF图片中的文本 ---")
+                    yield "--- PDF图片中的文本 ---"
                     for img_data in image_texts:
-                        text_content.append(f"页面 #{img_data['page']} 图片文本:")
+                        yield f"页面 #{img_data['page']} 图片文本:"
                         
                         # 确保OCR识别的文本使用UTF-8编码
                         img_text = img_data['text']
                         if any(ord(c) > 127 for c in img_text):
                             logger.debug(f"页面 {img_data['page']} 图片文本包含非ASCII字符，确保UTF-8编码")
                         
-                        text_content.append(img_text)
-                        text_content.append("")
-            else:
+                        yield img_text
+                        yield ""
+            elif not has_tesseract() and any(_needs_ocr(stat['text_chars'], stat['image_coverage'] or 0) for stat in page_stats):
                 logger.warning("Tesseract OCR未安装，跳过PDF图片文字识别")
             
-            result = '\n'.join(text_content)
-            logger.info(f"PDF文件处理完成，提取了 {len(result)} 个字符")
-            return result
+            logger.info(f"PDF文件处理完成，共 {page_count} 页")
+    except SelectionError:
+        raise
     except Exception as e:
         error_msg = f"PDF文件转换失败: {str(e)}"
         logger.error(error_msg)
@@ -619,6 +833,15 @@ def convert_pdf(file_path):
             except Exception as e:
                 logger.warning(f"关闭PDF文件时出错: {str(e)}")
 
+@cached_conversion('legacy', 'text', extra_key=_ocr_cache_key)
+def convert_pdf(file_path, pages=None):
+    """将PDF文件转换为文本，pages指定时只转换选中的页面"""
+    result = '\n'.join(iter_pdf_parts(file_path, pages=pages))
+    logger.info(f"PDF文件转换完成，提取了 {len(result)} 个字符")
+    return result
+
+@cached_conversion('legacy', 'text')
+@instrumentation.timed('parse', converter='legacy')
 def convert_txt(file_path):
     """读取文本文件内容"""
     try:
@@ -655,6 +878,8 @@ def convert_txt(file_path):
         logger.error(traceback.format_exc())
         raise Exception(error_msg)
 
+@cached_conversion('legacy', 'text')
+@instrumentation.timed('parse', converter='legacy')
 def convert_md(file_path):
     """将Markdown文件转换为纯文本"""
     try:
@@ -688,6 +913,7 @@ def convert_md(file_path):
         
         logger.info(f"Markdown文件读取完成，开始转换为HTML")
         # 将Markdown转换为HTML
+        import markdown
         html = markdown.markdown(md_content)
         
         logger.debug("HTML生成完成，开始转换为纯文本")
@@ -713,8 +939,15 @@ def convert_md(file_path):
         raise Exception(error_msg)
 
 # 添加MarkItDown转换功能
-def convert_to_markdown(file_path):
-    """使用MarkItDown将文件转换为Markdown格式"""
+@cached_conversion('legacy', 'md', key_includes_name=True, extra_key=_ocr_cache_key)
+@instrumentation.timed('parse', converter='legacy')
+def convert_to_markdown(file_path, pages=None, slides=None, sheets=None):
+    """
+    使用MarkItDown将文件转换为Markdown格式
+    
+    MarkItDown只能转换整个文件，指定了适用于该文件类型的pages、slides或sheets时使用替代方法，
+    只转换选中的页面、幻灯片或工作表
+    """
     try:
         logger.info(f"使用MarkItDown开始处理文件: {file_path}")
         
@@ -724,10 +957,11 @@ def convert_to_markdown(file_path):
             logger.error(error_msg)
             raise FileNotFoundError(error_msg)
         
-        if HAS_MARKITDOWN:
-            # 初始化MarkItDown
-            md = MarkItDown(enable_plugins=False)
-            
+        selection = selection_for(file_path, pages=pages, slides=slides, sheets=sheets)
+        
+        # 使用进程内共享的MarkItDown实例
+        md = get_markitdown() if not selection else None
+        if md is not None:
             # 转换文件
             result = md.convert(file_path)
             
@@ -737,7 +971,10 @@ def convert_to_markdown(file_path):
             logger.info(f"MarkItDown转换成功，生成了 {len(markdown_content)} 个字符的Markdown内容")
             return markdown_content
         else:
-            logger.warning("MarkItDown库不可用，使用替代方法")
+            if selection:
+                logger.info(f"指定了转换范围 {selection}，使用替代方法")
+            else:
+                logger.warning("MarkItDown库不可用，使用替代方法")
             # 根据文件类型使用替代方法
             file_ext = os.path.splitext(file_path)[1].lower()
             
@@ -745,13 +982,13 @@ def convert_to_markdown(file_path):
                 text = convert_docx(file_path)
                 return f"# {os.path.basename(file_path)}\n\n{text}"
             elif file_ext in ['.xls', '.xlsx']:
-                text = convert_xlsx(file_path)
+                text = convert_xlsx(file_path, **selection)
                 return f"# {os.path.basename(file_path)}\n\n{text}"
             elif file_ext in ['.ppt', '.pptx']:
-                text = convert_pptx(file_path)
+                text = convert_pptx(file_path, **selection)
                 return f"# {os.path.basename(file_path)}\n\n{text}"
             elif file_ext == '.pdf':
-                text = convert_pdf(file_path)
+                text = convert_pdf(file_path, **selection)
                 return f"# {os.path.basename(file_path)}\n\n{text}"
             elif file_ext == '.txt':
                 text = convert_txt(file_path)
@@ -765,12 +1002,71 @@ def convert_to_markdown(file_path):
                     return f"# {os.path.basename(file_path)}\n\n[音频文件，无法转换：需要安装pydub库]"
             else:
                 return f"# {os.path.basename(file_path)}\n\n[不支持的文件格式: {file_ext}]"
+    except SelectionError:
+        raise
     except Exception as e:
         error_msg = f"MarkItDown转换失败: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         raise Exception(error_msg)
 
+def iter_text_parts(file_path, pages=None, slides=None, sheets=None):
+    """
+    按文件类型选择生成器形式的文本转换，用于流式响应
+    
+    PDF逐页、PowerPoint逐张幻灯片、Excel逐行生成文本，其他格式整体作为一个片段生成。
+    pages、slides、sheets分别只对PDF、PowerPoint和Excel生效。
+    文件类型不受支持时立即抛出ValueError
+    
+    Returns:
+        generator: 文本片段生成器，按换行符连接即为与非流式接口相同的转换结果
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    
+    if file_ext == '.pdf':
+        return iter_pdf_parts(file_path, pages=pages)
+    if file_ext in ['.ppt', '.pptx']:
+        return iter_pptx_parts(file_path, slides=slides)
+    if file_ext in ['.xls', '.xlsx']:
+        return iter_xlsx_lines(file_path, sheets=sheets)
+    
+    single_part_converters = {
+        '.doc': convert_docx,
+        '.docx': convert_docx,
+        '.txt': convert_txt,
+        '.md': convert_md
+    }
+    if file_ext in single_part_converters:
+        # 这些格式无法逐段读取，直接完成转换（同时可命中结果缓存）
+        return iter([single_part_converters[file_ext](file_path)])
+    if file_ext in ['.mp3', '.wav']:
+        return iter(["音频文件支持Markdown格式导出，请使用转MD API"])
+    
+    raise ValueError(f"不支持的文件类型: {file_ext}")
+
+def iter_markdown_parts(file_path, pages=None, slides=None, sheets=None):
+    """
+    生成器形式的Markdown转换，用于流式响应
+    
+    MarkItDown只能整体输出，可用且未指定转换范围时整体作为一个片段生成；
+    否则使用替代方法，PDF、PowerPoint和Excel按页、幻灯片或行生成
+    
+    Returns:
+        generator: Markdown片段生成器
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    
+    selection = selection_for(file_path, pages=pages, slides=slides, sheets=sheets)
+    
+    if (get_markitdown() is not None and not selection) or file_ext not in ['.pdf', '.ppt', '.pptx', '.xls', '.xlsx']:
+        return iter([convert_to_markdown(file_path)])
+    
+    def generate():
+        yield f"# {os.path.basename(file_path)}\n"
+        yield from iter_text_parts(file_path, **selection)
+    return generate()
+
+@instrumentation.timed('parse', converter='legacy')
 def convert_audio(file_path):
     """将音频文件转换为文本"""
     logger.info(f"开始处理音频文件: {file_path}")
@@ -807,6 +1103,8 @@ def convert_audio(file_path):
         logger.error(traceback.format_exc())
         return f"# 音频处理错误\n\n处理文件 {os.path.basename(file_path)} 时发生错误: {str(e)}"
 
+@cached_conversion('legacy', 'text')
+@instrumentation.timed('parse', converter='legacy')
 def convert_xml(file_path):
     """将XML文件转换为文本"""
     try:
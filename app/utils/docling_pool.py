@@ -0,0 +1,266 @@
+"""
+Docling转换器池模块
+在每个工作进程内按管线选项缓存预初始化的DocumentConverter实例，
+避免每次请求都重新加载版面分析和表格识别模型
+"""
+import os
+import time
+import queue
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+
+from app.utils.admission import DOCLING_MAX_CONCURRENT
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每种管线选项最多保留的转换器实例数量
+# gunicorn同步worker同一时间只处理一个请求，默认每种选项1个实例即可
+DOCLING_POOL_SIZE = int(os.environ.get('DOCLING_POOL_SIZE', '1'))
+
+# 导出图片时的分辨率缩放比例
+IMAGE_RESOLUTION_SCALE = 2.0
+
+# 预热时默认初始化的管线选项：(是否生成图片, 是否启用OCR)
+DEFAULT_WARMUP_OPTIONS = [(False, True), (True, True)]
+
+# Docling推理设备：auto（由Docling自动选择）、cpu、cuda、mps
+DOCLING_DEVICE = os.environ.get('DOCLING_DEVICE', 'auto').lower()
+# 每个Docling转换使用的线程数，默认将本机可用CPU核数平均分给同时进行的转换（DOCLING_MAX_CONCURRENT），
+# 避免多个转换各自占满所有核心互相争抢
+DOCLING_NUM_THREADS = os.environ.get('DOCLING_NUM_THREADS', '')
+# torch算子内并行线程数（intra-op），默认与DOCLING_NUM_THREADS相同
+DOCLING_INTRAOP_THREADS = os.environ.get('DOCLING_INTRAOP_THREADS', '')
+# torch算子间并行线程数（inter-op），版面分析和表格识别模型基本是顺序执行的，默认1
+DOCLING_INTEROP_THREADS = int(os.environ.get('DOCLING_INTEROP_THREADS', '1'))
+
+DOCLING_DEVICES = ['auto', 'cpu', 'cuda', 'mps']
+
+
+def available_cpus():
+    """当前进程可用的CPU核数（考虑CPU亲和性限制）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def accelerator_settings():
+    """
+    根据环境变量生成Docling推理的加速配置
+
+    Returns:
+        dict: device、num_threads、intraop_threads、interop_threads
+    """
+    device = DOCLING_DEVICE
+    if device not in DOCLING_DEVICES:
+        logger.warning(f"未知的DOCLING_DEVICE: {device}，使用auto")
+        device = 'auto'
+    num_threads = int(DOCLING_NUM_THREADS) if DOCLING_NUM_THREADS else \
+        max(1, available_cpus() // max(1, DOCLING_MAX_CONCURRENT))
+    intraop_threads = int(DOCLING_INTRAOP_THREADS) if DOCLING_INTRAOP_THREADS else num_threads
+    return {
+        'device': device,
+        'num_threads': max(1, num_threads),
+        'intraop_threads': max(1, intraop_threads),
+        'interop_threads': max(1, DOCLING_INTEROP_THREADS)
+    }
+
+
+class DoclingConverterPool:
+    """按管线选项（普通/导出图片/只导出元素图片、OCR开关）分组管理的DocumentConverter实例池"""
+
+    def __init__(self, pool_size=DOCLING_POOL_SIZE, accelerator=None):
+        self._pool_size = max(1, pool_size)
+        self.accelerator = accelerator or accelerator_settings()
+        self._torch_configured = False
+        self._lock = threading.Lock()
+        self._idle = {}       # 选项键 -> 空闲转换器队列
+        self._created = {}    # 选项键 -> 已创建的实例数量
+        self._init_seconds = {}  # 选项键 -> 累计初始化耗时
+        self._warmup_thread = None
+
+    @staticmethod
+    def make_key(generate_images=False, do_ocr=True, page_images=True):
+        """根据管线选项生成池的分组键，page_images只在generate_images为True时有效"""
+        if not generate_images:
+            mode = 'plain'
+        else:
+            mode = 'images' if page_images else 'pictures'
+        return (mode, 'ocr' if do_ocr else 'no-ocr')
+
+    def _configure_torch(self):
+        """
+        设置torch的算子内和算子间线程数，每个进程只设置一次
+
+        torch默认每个转换使用全部CPU核心，多个转换同时进行时线程数远超核数，互相争抢反而更慢。
+        算子间线程数只能在torch开始并行计算之前设置一次，之后设置会失败，只记录警告
+        """
+        with self._lock:
+            if self._torch_configured:
+                return
+            self._torch_configured = True
+        try:
+            import torch
+        except ImportError:
+            return
+        try:
+            torch.set_num_threads(self.accelerator['intraop_threads'])
+            torch.set_num_interop_threads(self.accelerator['interop_threads'])
+        except RuntimeError as e:
+            logger.warning(f"设置torch线程数失败: {str(e)}")
+        logger.info(f"torch线程数: intra-op {torch.get_num_threads()}，inter-op {torch.get_num_interop_threads()}")
+
+    def _accelerator_options(self):
+        """生成Docling的AcceleratorOptions，Docling会将num_threads用于版面分析、表格识别和OCR模型"""
+        try:
+            from docling.datamodel.accelerator_options import AcceleratorOptions, AcceleratorDevice
+        except ImportError:
+            # 旧版本Docling中加速配置位于pipeline_options
+            from docling.datamodel.pipeline_options import AcceleratorOptions, AcceleratorDevice
+        return AcceleratorOptions(
+            num_threads=self.accelerator['num_threads'],
+            device=AcceleratorDevice(self.accelerator['device'])
+        )
+
+    def _build_converter(self, generate_images, do_ocr, page_images=True):
+        """
+        创建一个新的DocumentConverter实例
+
+        不需要整页图片时不在结果中保留页面图片，表格图片改为由管线单独裁剪保存
+        （表格元素的图片默认从页面图片中裁剪）
+        """
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions
+
+        self._configure_torch()
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.do_ocr = do_ocr
+        pipeline_options.accelerator_options = self._accelerator_options()
+        if generate_images:
+            pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
+            pipeline_options.generate_page_images = page_images
+            pipeline_options.generate_picture_images = True
+            if not page_images:
+                pipeline_options.generate_table_images = True
+
+        return DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+            }
+        )
+
+    def _acquire(self, key, generate_images, do_ocr, page_images):
+        """从池中取出一个转换器，池未满时按需创建，池已满时等待其他请求归还"""
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            create_new = self._created.get(key, 0) < self._pool_size
+            if create_new:
+                # 先占位，避免并发请求超额创建
+                self._created[key] = self._created.get(key, 0) + 1
+
+        if not create_new:
+            logger.info(f"Docling转换器池 {key} 已全部占用，等待空闲实例")
+            return idle.get()
+
+        try:
+            start_time = time.time()
+            converter = self._build_converter(generate_images, do_ocr, page_images)
+            elapsed = time.time() - start_time
+        except Exception:
+            with self._lock:
+                self._created[key] -= 1
+            raise
+
+        with self._lock:
+            self._init_seconds[key] = self._init_seconds.get(key, 0.0) + elapsed
+        logger.info(f"创建Docling转换器 {key}，耗时: {elapsed:.2f}秒")
+        return converter
+
+    def _release(self, key, converter):
+        """将转换器归还到池中"""
+        self._idle[key].put(converter)
+
+    @contextmanager
+    def converter(self, generate_images=False, do_ocr=True, page_images=True):
+        """
+        借出一个与管线选项匹配的DocumentConverter，使用完毕后自动归还
+
+        Args:
+            generate_images: 是否生成页面图片和图片元素
+            do_ocr: 是否启用OCR
+            page_images: generate_images为True时是否在结果中保留整页图片
+
+        Yields:
+            DocumentConverter: 预初始化的转换器实例
+        """
+        key = self.make_key(generate_images, do_ocr, page_images)
+        converter = self._acquire(key, generate_images, do_ocr, page_images)
+        try:
+            yield converter
+        finally:
+            self._release(key, converter)
+
+    def warmup(self, options=None):
+        """
+        预热转换器池：创建转换器并加载PDF管线模型
+
+        Args:
+            options: (是否生成图片, 是否启用OCR)元组列表，默认使用DEFAULT_WARMUP_OPTIONS
+        """
+        try:
+            from docling.datamodel.base_models import InputFormat
+        except ImportError:
+            logger.warning("无法导入Docling库，跳过转换器预热")
+            return
+
+        for generate_images, do_ocr in (options or DEFAULT_WARMUP_OPTIONS):
+            key = self.make_key(generate_images, do_ocr)
+            try:
+                start_time = time.time()
+                with self.converter(generate_images, do_ocr) as converter:
+                    converter.initialize_pipeline(InputFormat.PDF)
+                logger.info(f"Docling转换器 {key} 预热完成，耗时: {time.time() - start_time:.2f}秒")
+            except Exception as e:
+                logger.error(f"Docling转换器 {key} 预热失败: {str(e)}")
+                logger.error(traceback.format_exc())
+
+    def warmup_async(self, options=None):
+        """在后台线程中预热转换器池，不阻塞worker启动"""
+        if self._warmup_thread is not None and self._warmup_thread.is_alive():
+            return self._warmup_thread
+
+        self._warmup_thread = threading.Thread(
+            target=self.warmup, args=(options,), name='docling-warmup', daemon=True
+        )
+        self._warmup_thread.start()
+        logger.info(f"Docling转换器池开始后台预热 (pid={os.getpid()})")
+        return self._warmup_thread
+
+    def stats(self):
+        """获取转换器池的统计信息"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'pool_size': self._pool_size,
+                'accelerator': dict(self.accelerator),
+                'converters': {
+                    '/'.join(key): {
+                        'created': count,
+                        'idle': self._idle[key].qsize() if key in self._idle else 0,
+                        'init_seconds': round(self._init_seconds.get(key, 0.0), 2)
+                    }
+                    for key, count in self._created.items()
+                }
+            }
+
+# 创建全局转换器池实例（每个gunicorn worker进程各一份）
+docling_pool = DoclingConverterPool()
@@ -0,0 +1,107 @@
+"""
+解析结果内存缓存模块
+在工作进程内短时间保留Docling解析得到的ConversionResult（含DoclingDocument），
+同一内容的后续导出请求（Markdown、HTML、JSON、表格等）直接复用，无需再次进行版面分析和OCR
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from app.utils import instrumentation
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用解析结果内存缓存
+DOCUMENT_CACHE_ENABLED = os.environ.get('DOCUMENT_CACHE_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 每个工作进程最多保留的解析结果数量，包含页面图片的结果占用内存较多，默认只保留少量
+DOCUMENT_CACHE_SIZE = int(os.environ.get('DOCUMENT_CACHE_SIZE', '4'))
+# 解析结果的保留时间（秒）
+DOCUMENT_CACHE_TTL = int(os.environ.get('DOCUMENT_CACHE_TTL', '300'))
+
+
+class DocumentCache:
+    """有数量上限和过期时间的进程内LRU缓存，缓存对象直接保存在内存中，不做序列化"""
+
+    def __init__(self, max_entries=DOCUMENT_CACHE_SIZE, ttl=DOCUMENT_CACHE_TTL, enabled=DOCUMENT_CACHE_ENABLED):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self.enabled = enabled and self.max_entries > 0 and ttl > 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 键 -> (过期时间, 对象)
+        self.hits = 0
+        self.misses = 0
+        # fork出的子进程（如批量转换进程池）不能复用父进程的锁，缓存的对象也不共享
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(content_hash, generate_images=False, do_ocr=True, pages=None, page_images=True):
+        """根据内容哈希、管线选项和页码范围生成缓存键，page_images只在generate_images为True时有效"""
+        return (content_hash, bool(generate_images), bool(do_ocr), pages or None,
+                bool(page_images) if generate_images else None)
+
+    def get(self, *keys):
+        """
+        依次查找多个键，返回第一个未过期的缓存对象并将其移到最近使用的位置，全部未命中时返回None
+
+        调用方可以在精确的键之后给出可以替代使用的键（如包含页面图片的解析结果也可用于普通导出）
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        value = None
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                value = entry[1]
+                break
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        instrumentation.record_cache('docling', 'document', 'miss' if value is None else 'hit')
+        return value
+
+    def put(self, key, value):
+        """保存对象，超过数量上限时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存状态：条目数、上限、过期时间和命中统计"""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# 创建全局解析结果缓存实例
+document_cache = DocumentCache()
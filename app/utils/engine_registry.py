@@ -0,0 +1,117 @@
+"""
+转换引擎注册表模块
+在每个工作进程内按名称延迟创建并共享转换引擎实例（如MarkItDown），
+同时记录每个引擎的初始化耗时和使用次数，确认初始化成本只在每个进程中支付一次
+"""
+import os
+import time
+import logging
+import threading
+import traceback
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class EngineRegistry:
+    """线程安全的转换引擎注册表，引擎在第一次使用时创建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories = {}   # 引擎名称 -> 创建函数
+        self._engines = {}     # 引擎名称 -> 已创建的实例（依赖缺失时为None）
+        self._init_locks = {}  # 引擎名称 -> 初始化锁
+        self._stats = {}       # 引擎名称 -> 统计信息
+
+    def register(self, name, factory):
+        """
+        注册转换引擎
+
+        Args:
+            name: 引擎名称
+            factory: 无参数的创建函数，依赖缺失时应抛出ImportError
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._init_locks[name] = threading.Lock()
+            self._stats[name] = {
+                'initialized': False,
+                'available': None,
+                'init_count': 0,
+                'init_seconds': 0.0,
+                'uses': 0,
+                'error': None
+            }
+
+    def get(self, name):
+        """
+        获取共享的引擎实例，第一次调用时创建
+
+        Returns:
+            引擎实例，依赖库未安装时返回None
+        """
+        if name not in self._factories:
+            raise KeyError(f"未注册的转换引擎: {name}")
+
+        if name not in self._engines:
+            # 每个引擎单独加锁，避免并发请求重复初始化，也不阻塞其他引擎
+            with self._init_locks[name]:
+                if name not in self._engines:
+                    self._initialize(name)
+
+        with self._lock:
+            self._stats[name]['uses'] += 1
+        return self._engines[name]
+
+    def _initialize(self, name):
+        stats = self._stats[name]
+        start_time = time.time()
+        try:
+            engine = self._factories[name]()
+            available = True
+        except ImportError as e:
+            logger.warning(f"无法导入转换引擎 {name} 所需的库: {str(e)}")
+            engine = None
+            available = False
+            stats['error'] = str(e)
+        except Exception as e:
+            # 其他初始化错误不缓存，下次调用时重试
+            logger.error(f"初始化转换引擎 {name} 失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            with self._lock:
+                stats['error'] = str(e)
+            raise
+        elapsed = time.time() - start_time
+
+        with self._lock:
+            stats['initialized'] = True
+            stats['available'] = available
+            stats['init_count'] += 1
+            stats['init_seconds'] += elapsed
+            self._engines[name] = engine
+
+        if available:
+            logger.info(f"转换引擎 {name} 初始化完成 (pid={os.getpid()})，耗时: {elapsed:.2f}秒")
+
+    def stats(self):
+        """获取所有引擎的统计信息"""
+        with self._lock:
+            return {
+                name: dict(stats, init_seconds=round(stats['init_seconds'], 3))
+                for name, stats in self._stats.items()
+            }
+
+
+def _create_markitdown():
+    from markitdown import MarkItDown
+    return MarkItDown(enable_plugins=False)
+
+
+# 创建全局引擎注册表实例（每个gunicorn worker进程各一份）
+engine_registry = EngineRegistry()
+engine_registry.register('markitdown', _create_markitdown)
+
+
+def get_markitdown():
+    """获取共享的MarkItDown实例，未安装MarkItDown时返回None"""
+    return engine_registry.get('markitdown')
@@ -0,0 +1,237 @@
+"""
+Docling图片导出模块
+页面、表格和图片元素的图片编码（尤其是高分辨率页面的PNG编码）是导出图片接口中最耗时的部分。
+PIL在缩放和编码时释放GIL，使用线程池并行保存；支持WebP/JPEG格式和质量、缩放比例，
+以及跳过整页图片。预览接口的导出目录以文件内容和导出选项的哈希命名，相同的请求直接复用已导出的结果
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils import instrumentation
+from app.utils.docling_pool import IMAGE_RESOLUTION_SCALE, available_cpus
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 并行保存图片的线程数
+IMAGE_EXPORT_WORKERS = int(os.environ.get('IMAGE_EXPORT_WORKERS', str(min(4, available_cpus()))))
+# 默认图片格式
+IMAGE_EXPORT_FORMAT = os.environ.get('IMAGE_EXPORT_FORMAT', 'png').lower()
+# JPEG、WebP的默认质量（1-100）
+IMAGE_EXPORT_QUALITY = int(os.environ.get('IMAGE_EXPORT_QUALITY', '85'))
+
+# 支持的图片格式：格式名 -> (PIL格式, 文件扩展名)
+IMAGE_FORMATS = {
+    'png': ('PNG', '.png'),
+    'jpeg': ('JPEG', '.jpg'),
+    'jpg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp')
+}
+
+# 导出目录中记录导出结果的文件，存在即表示导出已完成
+MANIFEST_FILENAME = 'export.json'
+# 导出结果的格式版本，导出目录结构变化时递增
+EXPORT_FORMAT_VERSION = 2
+# 生成Markdown时图片元素的占位符，之后按顺序替换为已保存图片的引用
+MARKDOWN_IMAGE_PLACEHOLDER = '<!-- x2k-image -->'
+# 图片元素没有可用图片时保留的占位符（与Docling的默认占位符一致）
+MISSING_IMAGE_PLACEHOLDER = '<!-- image -->'
+
+
+def default_options():
+    """默认的图片导出选项"""
+    return {
+        'format': IMAGE_EXPORT_FORMAT if IMAGE_EXPORT_FORMAT in IMAGE_FORMATS else 'png',
+        'quality': IMAGE_EXPORT_QUALITY,
+        'scale': IMAGE_RESOLUTION_SCALE,
+        'page_images': True
+    }
+
+
+def parse_image_options(values):
+    """
+    从请求参数中解析图片导出选项
+
+    Args:
+        values: 请求参数（如request.form），支持image_format、image_quality、images_scale、page_images
+
+    Returns:
+        dict: format、quality、scale、page_images
+
+    Raises:
+        ValueError: 参数无效
+    """
+    options = default_options()
+
+    image_format = (values.get('image_format') or '').strip().lower()
+    if image_format:
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图片格式: {image_format}，支持的格式: png、jpeg、webp")
+        options['format'] = 'jpeg' if image_format == 'jpg' else image_format
+
+    quality = (values.get('image_quality') or '').strip()
+    if quality:
+        if not quality.isdigit() or not 1 <= int(quality) <= 100:
+            raise ValueError(f"image_quality必须是1到100之间的整数，收到: {quality}")
+        options['quality'] = int(quality)
+
+    scale = (values.get('images_scale') or '').strip()
+    if scale:
+        try:
+            options['scale'] = float(scale)
+        except ValueError:
+            raise ValueError(f"images_scale必须是数字，收到: {scale}")
+        # Docling按IMAGE_RESOLUTION_SCALE渲染页面，导出时只能缩小
+        if not 0 < options['scale'] <= IMAGE_RESOLUTION_SCALE:
+            raise ValueError(f"images_scale必须大于0且不超过{IMAGE_RESOLUTION_SCALE}，收到: {scale}")
+
+    page_images = values.get('page_images')
+    if page_images is not None and page_images != '':
+        options['page_images'] = str(page_images).lower() in ['true', '1', 't', 'y', 'yes']
+
+    # PNG为无损格式，质量参数不影响输出，不计入导出目录的键
+    if options['format'] == 'png':
+        options['quality'] = None
+    return options
+
+
+def image_extension(options):
+    """导出选项对应的图片文件扩展名"""
+    return IMAGE_FORMATS[options['format']][1]
+
+
+def _save_image(image, path, options):
+    """缩放并保存一张图片，在线程池中执行"""
+    pil_format = IMAGE_FORMATS[options['format']][0]
+    ratio = options['scale'] / IMAGE_RESOLUTION_SCALE
+    if ratio < 1:
+        size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+        image = image.resize(size)
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    save_kwargs = {}
+    if pil_format != 'PNG':
+        save_kwargs['quality'] = options['quality']
+    with open(path, 'wb') as fp:
+        image.save(fp, format=pil_format, **save_kwargs)
+    return path
+
+
+def save_images(tasks, options=None, workers=IMAGE_EXPORT_WORKERS):
+    """
+    使用线程池并行保存图片
+
+    Args:
+        tasks: (PIL图片, 保存路径, 描述)列表
+        options: 图片导出选项，默认使用default_options()
+        workers: 线程数
+
+    Returns:
+        list: 与tasks顺序一致的保存路径，保存失败的图片为None
+    """
+    if not tasks:
+        return []
+    options = options or default_options()
+    workers = max(1, min(workers, len(tasks)))
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-export') as executor:
+        futures = [executor.submit(_save_image, image, path, options) for image, path, _ in tasks]
+        saved = []
+        for future, (_, _, label) in zip(futures, tasks):
+            try:
+                saved.append(future.result())
+            except Exception as e:
+                logger.warning(f"保存{label}图片时出错: {str(e)}")
+                saved.append(None)
+
+    logger.info(f"并行保存 {len(tasks)} 张图片（{options['format']}，{workers} 个线程），耗时: {time.time() - start_time:.2f}秒")
+    if instrumentation.METRICS_ENABLED:
+        instrumentation.registry.inc(instrumentation.METRIC_PREFIX + 'docling_images_exported_total',
+                                     {'format': options['format']}, sum(1 for path in saved if path))
+    return saved
+
+
+def reference_images(markdown_text, image_paths):
+    """
+    将Markdown中的图片占位符按顺序替换为已保存图片的引用
+
+    图片与Markdown文件保存在同一目录，引用使用文件名；直接复用save_images并行保存的文件，
+    不再由Docling逐张编码PNG。占位符与图片元素数量不一致时无法确定对应关系，
+    所有图片都保留占位符，避免引用错误的图片
+
+    Args:
+        markdown_text: 使用MARKDOWN_IMAGE_PLACEHOLDER作为图片占位符导出的Markdown
+        image_paths: 与文档中图片元素顺序一致的保存路径，没有图片的元素为None
+    """
+    parts = markdown_text.split(MARKDOWN_IMAGE_PLACEHOLDER)
+    if len(parts) - 1 != len(image_paths):
+        logger.warning(f"Markdown中的图片占位符数量（{len(parts) - 1}）与图片元素数量（{len(image_paths)}）不一致，"
+                       f"所有图片保留占位符")
+        return MISSING_IMAGE_PLACEHOLDER.join(parts)
+    output = [parts[0]]
+    for path, part in zip(image_paths, parts[1:]):
+        output.append(f"![Image]({os.path.basename(path)})" if path else MISSING_IMAGE_PLACEHOLDER)
+        output.append(part)
+    return ''.join(output)
+
+
+def export_key(content_hash, options):
+    """根据文件内容哈希、导出选项和docling版本生成导出目录名"""
+    from app.utils.artifact_store import docling_version
+
+    key_source = json.dumps({
+        'version': EXPORT_FORMAT_VERSION,
+        'content': content_hash,
+        'options': options,
+        'docling': docling_version()
+    }, sort_keys=True)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()[:32]
+
+
+def load_manifest(export_dir):
+    """读取已完成的导出结果，目录不存在或导出未完成时返回None"""
+    try:
+        with open(os.path.join(export_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def staging_dir(export_dir):
+    """导出过程中使用的临时目录，与最终目录位于同一父目录下，完成后整体重命名"""
+    return f"{export_dir}.tmp-{uuid.uuid4().hex}"
+
+
+def publish(temp_dir, export_dir, manifest):
+    """
+    写入导出结果并将临时目录重命名为最终目录
+
+    同一内容的请求同时完成导出时只保留先完成的目录，后完成的临时目录直接删除
+
+    Returns:
+        bool: 本次导出的目录是否被采用
+    """
+    with open(os.path.join(temp_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    try:
+        os.rename(temp_dir, export_dir)
+        return True
+    except OSError:
+        if load_manifest(export_dir) is None:
+            # 最终目录存在但导出未完成（如进程在写入过程中退出），替换为本次结果
+            shutil.rmtree(export_dir, ignore_errors=True)
+            try:
+                os.rename(temp_dir, export_dir)
+                return True
+            except OSError:
+                pass
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return False
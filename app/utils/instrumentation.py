@@ -0,0 +1,577 @@
+"""
+性能监控模块
+提供统一的阶段耗时记录接口（上传保存、解析、OCR、Docling模型推理、图片导出、序列化），
+以及按接口统计的请求耗时、响应大小、进行中请求数、错误数和缓存命中数，
+并以Prometheus文本格式通过 /metrics 接口输出
+
+多个gunicorn worker进程各自记录指标，并定期将快照写入METRICS_DIR，
+/metrics 接口汇总所有进程的快照后输出；已退出进程的计数器和直方图合并到一份持久化的累计值后删除其快照
+"""
+import os
+import json
+import time
+import uuid
+import inspect
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+
+from flask import g, request, has_request_context
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用性能监控
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 多进程指标快照目录，为空时只输出当前进程的指标
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join('cache', 'metrics'))
+# 进程将指标快照写入METRICS_DIR的最短间隔（秒）
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# 已退出进程的累计指标文件和合并时使用的锁文件
+RETIRED_FILENAME = 'retired.json'
+RETIRED_LOCK_FILENAME = 'retired.lock'
+# 累计指标文件中记录的已合并快照实例数上限，用于合并后删除快照前进程退出时避免重复合并
+RETIRED_INSTANCES_LIMIT = 1000
+
+# 指标名称前缀
+METRIC_PREFIX = 'x2k_'
+
+# 转换器上报的阶段名称
+STAGES = ['upload_save', 'parse', 'ocr', 'docling_inference', 'image_export', 'serialization']
+
+# 耗时直方图的桶上限（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 响应大小直方图的桶上限（字节），1KB到256MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# 当前执行范围（后台任务、批量转换等没有请求上下文的场景使用）
+_scope = contextvars.ContextVar('instrumentation_scope', default=None)
+# 当前转换器名称
+_converter = contextvars.ContextVar('instrumentation_converter', default='none')
+# 当前正在计时的阶段，嵌套的同名阶段只由最外层记录
+_active_stages = contextvars.ContextVar('instrumentation_active_stages', default=frozenset())
+
+
+class MetricsRegistry:
+    """线程安全的进程内指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definitions = {}  # 指标名称 -> (类型, 说明, 桶上限)
+        self._samples = {}      # 指标名称 -> {标签元组: 值}
+
+    def define(self, name, metric_type, help_text, buckets=None):
+        with self._lock:
+            self._definitions[name] = (metric_type, help_text, tuple(buckets) if buckets else None)
+            self._samples.setdefault(name, {})
+
+    def reset(self):
+        """清空所有样本（fork出的子进程不应继承父进程的计数）"""
+        with self._lock:
+            for samples in self._samples.values():
+                samples.clear()
+
+    @staticmethod
+    def _label_key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, labels, amount=1):
+        """增加计数器或仪表的值"""
+        key = self._label_key(labels)
+        with self._lock:
+            samples = self._samples[name]
+            samples[key] = samples.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """向直方图添加一个观测值"""
+        key = self._label_key(labels)
+        buckets = self._definitions[name][2]
+        with self._lock:
+            samples = self._samples[name]
+            sample = samples.get(key)
+            if sample is None:
+                sample = samples[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, upper in enumerate(buckets):
+                if value <= upper:
+                    sample['buckets'][i] += 1
+                    break
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def snapshot(self):
+        """导出可序列化为JSON的指标快照"""
+        with self._lock:
+            return {
+                name: {
+                    'type': metric_type,
+                    'help': help_text,
+                    'buckets': list(buckets) if buckets else None,
+                    'samples': [
+                        [list(map(list, key)), dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value]
+                        for key, value in self._samples[name].items()
+                    ]
+                }
+                for name, (metric_type, help_text, buckets) in self._definitions.items()
+            }
+
+
+def merge_snapshots(snapshots):
+    """
+    合并多个进程的指标快照：计数器和直方图求和，仪表只合并仍在运行的进程
+
+    Args:
+        snapshots: (快照, 进程是否仍在运行) 列表
+    """
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            if metric['type'] == GAUGE and not alive:
+                continue
+            for key, value in metric['samples']:
+                key = tuple(tuple(item) for item in key)
+                if metric['type'] == HISTOGRAM:
+                    current = target['samples'].get(key)
+                    if current is None:
+                        target['samples'][key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+                    else:
+                        current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                        current['sum'] += value['sum']
+                        current['count'] += value['count']
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    return merged
+
+
+def to_snapshot(merged):
+    """将merge_snapshots的结果转换回快照格式"""
+    return {
+        name: dict(metric, samples=[[list(map(list, key)), value] for key, value in metric['samples'].items()])
+        for name, metric in merged.items()
+    }
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + list(extra or [])
+    if not items:
+        return ''
+    escaped = []
+    for name, value in items:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def render_prometheus(merged):
+    """将合并后的指标输出为Prometheus文本格式"""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            if metric['type'] == HISTOGRAM:
+                cumulative = 0
+                for upper, count in zip(metric['buckets'], value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(float(upper)))])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# 创建全局指标注册表实例（每个进程各一份）
+registry = MetricsRegistry()
+registry.define(METRIC_PREFIX + 'http_requests_total', COUNTER, '按接口、方法和状态码统计的请求数')
+registry.define(METRIC_PREFIX + 'http_request_duration_seconds', HISTOGRAM, '请求处理耗时（流式响应计到发送完毕）', DURATION_BUCKETS)
+registry.define(METRIC_PREFIX + 'http_response_size_bytes', HISTOGRAM, '响应体大小', SIZE_BUCKETS)
+registry.define(METRIC_PREFIX + 'http_requests_in_flight', GAUGE, '正在处理的请求数')
+registry.define(METRIC_PREFIX + 'stage_duration_seconds', HISTOGRAM, '按接口、转换器和阶段统计的耗时', DURATION_BUCKETS)
+registry.define(METRIC_PREFIX + 'errors_total', COUNTER, '按接口、转换器和阶段统计的错误数（stage=request表示返回5xx的请求）')
+registry.define(METRIC_PREFIX + 'cache_requests_total', COUNTER, '转换结果缓存的命中和未命中次数')
+registry.define(METRIC_PREFIX + 'admission_running', GAUGE, '按准入控制器（pool为docling或batch）统计的正在进行的转换数')
+registry.define(METRIC_PREFIX + 'admission_waiting', GAUGE, '按准入控制器统计的等待转换名额的请求数（队列深度）')
+registry.define(METRIC_PREFIX + 'admission_wait_seconds', HISTOGRAM, '等待转换名额的耗时（result为admitted、queue_full或timeout）', DURATION_BUCKETS)
+registry.define(METRIC_PREFIX + 'admission_total', COUNTER, '准入结果（admitted表示获准转换，queue_full和timeout表示被拒绝）')
+registry.define(METRIC_PREFIX + 'docling_images_exported_total', COUNTER, 'Docling图片导出接口保存的图片数（按图片格式）')
+
+
+def current_endpoint():
+    """获取当前指标使用的接口标签"""
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return _scope.get() or 'background'
+
+
+@contextlib.contextmanager
+def scope(name):
+    """
+    为没有请求上下文的执行过程（后台任务、批量转换进程等）设置接口标签
+
+    Args:
+        name: 标签值，例如 job_md、batch
+    """
+    token = _scope.set(name)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _record_stage(name, converter, elapsed, failed):
+    labels = {'endpoint': current_endpoint(), 'converter': converter, 'stage': name}
+    registry.observe(METRIC_PREFIX + 'stage_duration_seconds', labels, elapsed)
+    if failed:
+        registry.inc(METRIC_PREFIX + 'errors_total', labels)
+
+
+@contextlib.contextmanager
+def _activate(name, converter):
+    """在当前上下文中标记阶段为进行中，并设置转换器名称"""
+    stage_token = _active_stages.set(_active_stages.get() | {name})
+    converter_token = _converter.set(converter) if converter else None
+    try:
+        yield
+    finally:
+        if converter_token is not None:
+            _converter.reset(converter_token)
+        _active_stages.reset(stage_token)
+
+
+@contextlib.contextmanager
+def stage(name, converter=None):
+    """
+    记录一个阶段的耗时，阶段内抛出的异常计入错误数
+
+    同名阶段嵌套时只有最外层计时，例如Markdown转换回退到文本解析时不会重复计入解析耗时
+
+    Args:
+        name: 阶段名称，取值见STAGES
+        converter: 转换器名称，默认沿用外层阶段的转换器
+    """
+    if not METRICS_ENABLED or name in _active_stages.get():
+        yield
+        return
+
+    converter = converter or _converter.get()
+    failed = False
+    start = time.perf_counter()
+    try:
+        with _activate(name, converter):
+            yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record_stage(name, converter, time.perf_counter() - start, failed)
+
+
+def timed(name, converter=None):
+    """
+    记录函数执行耗时的装饰器，等同于用stage()包裹整个函数
+
+    被装饰的是生成器函数时，只累计生成器内部执行的时间（不含调用方处理每个片段的时间），
+    在生成器结束或关闭时记录一次
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not METRICS_ENABLED or name in _active_stages.get():
+                    yield from func(*args, **kwargs)
+                    return
+
+                stage_converter = converter or _converter.get()
+                generator = func(*args, **kwargs)
+                elapsed = 0.0
+                failed = False
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            with _activate(name, stage_converter):
+                                item = next(generator)
+                        except StopIteration:
+                            break
+                        except BaseException:
+                            failed = True
+                            raise
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        yield item
+                finally:
+                    generator.close()
+                    _record_stage(name, stage_converter, elapsed, failed)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, converter):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(converter_name, output_format, result):
+    """记录一次转换结果缓存查询，result为hit或miss"""
+    if METRICS_ENABLED:
+        registry.inc(METRIC_PREFIX + 'cache_requests_total', {
+            'converter': converter_name, 'format': output_format, 'result': result
+        })
+
+
+class _ProcessSnapshots:
+    """
+    将当前进程的指标快照写入共享目录，并读取所有进程的快照
+
+    每个快照带有进程实例ID：进程退出后PID可能被新进程复用，新进程首次写入前
+    先将同一PID下旧实例的快照合并到累计值，避免计数器回退
+    """
+
+    def __init__(self, metrics_dir):
+        self.metrics_dir = metrics_dir
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._instance = None
+        self._instance_pid = None
+
+    def _path(self, pid):
+        return os.path.join(self.metrics_dir, f'metrics_{pid}.json')
+
+    @contextlib.contextmanager
+    def _retire_lock(self):
+        """跨进程互斥地合并已退出进程的快照"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.metrics_dir, RETIRED_LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _unpack(data, name):
+        """返回快照的(实例ID, 指标)，兼容不带实例ID的旧格式快照"""
+        if 'instance' in data:
+            return data['instance'], data['metrics']
+        return name, data
+
+    def _read_retired(self):
+        try:
+            return self._read(os.path.join(self.metrics_dir, RETIRED_FILENAME))
+        except FileNotFoundError:
+            return {'instances': [], 'metrics': {}}
+
+    def _retire(self, names):
+        """
+        将指定快照文件合并到累计值并删除，调用方需持有_retire_lock
+
+        先写入包含已合并实例ID的累计值再删除快照文件，两步之间进程退出时快照不会被重复合并
+        """
+        retired = self._read_retired()
+        instances = retired['instances']
+        snapshots = [(retired['metrics'], False)]
+        for name in names:
+            path = os.path.join(self.metrics_dir, name)
+            try:
+                data = self._read(path)
+            except FileNotFoundError:
+                continue
+            except (ValueError, OSError) as e:
+                logger.warning(f"读取指标快照失败: {name}，原因: {str(e)}")
+                continue
+            instance, metrics = self._unpack(data, name)
+            if instance not in instances:
+                # 仪表只反映运行中的进程，merge_snapshots会跳过已退出进程的仪表
+                snapshots.append((metrics, False))
+                instances.append(instance)
+        if len(snapshots) > 1:
+            self._write(os.path.join(self.metrics_dir, RETIRED_FILENAME), {
+                'instances': instances[-RETIRED_INSTANCES_LIMIT:],
+                'metrics': to_snapshot(merge_snapshots(snapshots))
+            })
+        for name in names:
+            try:
+                os.remove(os.path.join(self.metrics_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _claim_pid(self):
+        """本进程首次写入快照（或fork后PID变化）时生成实例ID，并合并同一PID下旧进程遗留的快照"""
+        pid = os.getpid()
+        if self._instance_pid == pid:
+            return
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        with self._retire_lock():
+            if os.path.exists(self._path(pid)):
+                self._retire([os.path.basename(self._path(pid))])
+        self._instance = uuid.uuid4().hex
+        self._instance_pid = pid
+
+    def flush(self, force=False):
+        now = time.time()
+        if not force and now - self._last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        with self._lock:
+            self._last_flush = now
+            try:
+                self._claim_pid()
+                self._write(self._path(os.getpid()), {'instance': self._instance, 'metrics': registry.snapshot()})
+            except Exception as e:
+                logger.warning(f"写入指标快照失败: {str(e)}")
+
+    def collect(self):
+        from app.utils.common import is_process_alive
+
+        self.flush(force=True)
+        alive, dead = [], []
+        for name in os.listdir(self.metrics_dir):
+            if not (name.startswith('metrics_') and name.endswith('.json')):
+                continue
+            try:
+                pid = int(name[len('metrics_'):-len('.json')])
+            except ValueError:
+                continue
+            (alive if is_process_alive(pid) else dead).append(name)
+
+        snapshots = []
+        try:
+            with self._retire_lock():
+                if dead:
+                    self._retire(dead)
+                    logger.info(f"已合并 {len(dead)} 个已退出进程的指标快照")
+                snapshots.append((self._read_retired()['metrics'], False))
+        except (ValueError, OSError) as e:
+            logger.warning(f"合并已退出进程的指标快照失败: {str(e)}")
+
+        for name in alive:
+            try:
+                snapshots.append((self._unpack(self._read(os.path.join(self.metrics_dir, name)), name)[1], True))
+            except FileNotFoundError:
+                # 快照在读取前已被合并
+                continue
+            except (ValueError, OSError) as e:
+                logger.warning(f"读取指标快照失败: {name}，原因: {str(e)}")
+        return snapshots
+
+
+_snapshots = _ProcessSnapshots(METRICS_DIR) if METRICS_DIR else None
+
+
+def flush(force=False):
+    """将当前进程的指标写入共享目录（未启用多进程汇总时不执行任何操作）"""
+    if METRICS_ENABLED and _snapshots is not None:
+        _snapshots.flush(force)
+
+
+def render():
+    """输出所有进程汇总后的Prometheus文本格式指标"""
+    if _snapshots is not None:
+        snapshots = _snapshots.collect()
+    else:
+        snapshots = [(registry.snapshot(), True)]
+    return render_prometheus(merge_snapshots(snapshots))
+
+
+def _count_response_bytes(iterable, on_done):
+    """统计流式响应实际发送的字节数"""
+    size = 0
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+        on_done(size)
+
+
+def _finish_request(endpoint, method, status, start, size):
+    registry.observe(METRIC_PREFIX + 'http_request_duration_seconds', {'endpoint': endpoint, 'method': method},
+                     time.perf_counter() - start)
+    registry.inc(METRIC_PREFIX + 'http_requests_total', {'endpoint': endpoint, 'method': method, 'status': status})
+    if size is not None:
+        registry.observe(METRIC_PREFIX + 'http_response_size_bytes', {'endpoint': endpoint}, size)
+    if status >= 500:
+        registry.inc(METRIC_PREFIX + 'errors_total', {'endpoint': endpoint, 'converter': 'none', 'stage': 'request'})
+    registry.inc(METRIC_PREFIX + 'http_requests_in_flight', {'endpoint': endpoint}, -1)
+    flush()
+
+
+def _before_request():
+    endpoint = current_endpoint()
+    g.metrics_request = {'endpoint': endpoint, 'method': request.method, 'start': time.perf_counter()}
+    registry.inc(METRIC_PREFIX + 'http_requests_in_flight', {'endpoint': endpoint})
+
+
+def _after_request(response):
+    state = g.pop('metrics_request', None)
+    if state is None:
+        return response
+
+    if response.is_streamed and response.content_length is None:
+        # 流式响应在发送完毕后才记录耗时和大小
+        def on_done(size):
+            _finish_request(state['endpoint'], state['method'], response.status_code, state['start'], size)
+        response.response = _count_response_bytes(response.response, on_done)
+    else:
+        _finish_request(state['endpoint'], state['method'], response.status_code, state['start'], response.content_length)
+    return response
+
+
+def _teardown_request(exc=None):
+    # after_request未执行（例如请求处理过程中出现未捕获的异常）时补记
+    state = g.pop('metrics_request', None)
+    if state is not None:
+        _finish_request(state['endpoint'], state['method'], 500, state['start'], None)
+
+
+def init_app(app):
+    """注册请求级别的指标记录回调"""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# fork出的子进程（如批量转换进程）从零开始计数，避免重复汇总父进程的指标
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
@@ -0,0 +1,457 @@
+"""
+异步转换任务模块
+提供基于SQLite持久化的任务存储和本地有界工作线程池，
+用于在请求线程之外执行耗时较长的文档转换
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import sqlite3
+import logging
+import threading
+import traceback
+from collections import deque
+
+from app.utils import conversion_context, instrumentation
+from app.utils.common import is_process_alive
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个进程内执行任务的工作线程数量
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# 每个进程内等待执行的任务队列上限
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '16'))
+# 已结束任务（成功或失败）的保留时间（秒），超过后删除任务记录、结果和输出文件
+JOB_TTL = int(os.environ.get('JOB_TTL', str(24 * 3600)))
+# 清理过期任务、恢复遗留任务的间隔（秒）
+JOB_MAINTENANCE_INTERVAL = int(os.environ.get('JOB_MAINTENANCE_INTERVAL', '300'))
+# 任务最多执行的次数：执行任务的进程异常退出（如内存不足、超时被杀）后任务会被重新执行，
+# 达到该次数后不再恢复，标记为失败，避免一个导致进程崩溃的文件反复拖垮所有worker
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '2'))
+
+# 支持的目标格式
+JOB_TARGET_FORMATS = ['text', 'md', 'html', 'json', 'tables', 'images']
+# 批量转换任务，由批量转换接口提交，输入为暂存了全部文件的目录
+JOB_BATCH_FORMAT = 'batch'
+
+# 任务状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """任务队列已满时抛出的异常"""
+    pass
+
+
+def run_conversion(target_format, file_path, output_dir, options=None):
+    """
+    调用现有的转换器执行一次转换
+
+    Args:
+        target_format: 目标格式，取值见JOB_TARGET_FORMATS
+        file_path: 输入文件路径
+        output_dir: 输出文件目录（tables、images格式使用）
+        options: 其他转换选项
+
+    Returns:
+        dict: 可序列化为JSON的转换结果
+    """
+    from app.utils.converter_factory import converter_factory
+
+    options = options or {}
+    base_name = options.get('base_name')
+
+    if target_format == JOB_BATCH_FORMAT:
+        from app.utils.batch_converter import BatchConverter
+        return BatchConverter.load(file_path).run()
+    # 转换范围（pages、slides、sheets），只有text、md和html格式支持
+    selection = options.get('selection') or {}
+
+    if target_format == 'text':
+        return {'text': converter_factory.get_default_converter().convert_to_text(file_path, **selection)}
+    if target_format == 'md':
+        from app.utils.converters import convert_to_markdown
+        return {'text': convert_to_markdown(file_path, **selection)}
+
+    from app.utils import admission
+
+    docling_converter = converter_factory.get_converter('docling')
+    if target_format not in ('html', 'json', 'tables', 'images'):
+        raise ValueError(f"不支持的目标格式: {target_format}")
+    # 与同步接口共享Docling转换名额（推理时才占用）；任务已经在任务队列中排队，这里不受等待队列长度限制
+    with admission.background():
+        if target_format == 'html':
+            return {'html': docling_converter.convert_to_html(file_path, **selection)}
+        if target_format == 'json':
+            return {'json': docling_converter.convert_to_json(file_path)}
+        if target_format == 'tables':
+            export_formats = options.get('export_formats') or ['md', 'csv', 'html']
+            tables = docling_converter.export_tables(file_path, output_dir, export_formats, base_name)
+            return {'table_count': len(tables), 'tables': tables}
+        if target_format == 'images':
+            export_result = docling_converter.export_images(file_path, output_dir, base_name)
+            with open(export_result['md_path'], 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+            return {
+                'text': markdown_text,
+                'output_path': export_result['md_path'],
+                'page_images': export_result['page_images'],
+                'table_images': export_result['table_images'],
+                'picture_images': export_result['picture_images']
+            }
+
+
+class JobStore:
+    """基于SQLite的任务存储，多个worker进程共享同一个数据库文件"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    target_format TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    output_dir TEXT NOT NULL,
+                    options TEXT,
+                    result_path TEXT,
+                    error TEXT,
+                    worker_pid INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            # 旧版本创建的数据库没有attempts列
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'attempts' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, job):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, target_format, filename, file_path, output_dir, options, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job['id'], STATUS_QUEUED, job['target_format'], job['filename'], job['file_path'],
+                 job['output_dir'], json.dumps(job.get('options') or {}, ensure_ascii=False), time.time())
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, job_id):
+        """原子地将任务从排队状态切换为运行状态并增加执行次数，返回是否认领成功"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, worker_pid = ?, started_at = ?, attempts = attempts + 1 '
+                'WHERE id = ? AND status = ?',
+                (STATUS_RUNNING, os.getpid(), time.time(), job_id, STATUS_QUEUED)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, status, result_path=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result_path = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, result_path, error, time.time(), job_id)
+            )
+
+    def requeue_orphans(self, max_attempts=JOB_MAX_ATTEMPTS):
+        """
+        将所属进程已退出的运行中任务重新置为排队状态，返回所有排队任务ID
+
+        已执行max_attempts次的任务不再重新执行，直接标记为失败
+        """
+        with self._connect() as conn:
+            running = conn.execute(
+                'SELECT id, worker_pid, attempts FROM jobs WHERE status = ?', (STATUS_RUNNING,)
+            ).fetchall()
+            for row in running:
+                if is_process_alive(row['worker_pid']):
+                    continue
+                if row['attempts'] >= max_attempts:
+                    logger.warning(f"任务 {row['id']} 执行 {row['attempts']} 次均因进程退出而中断，不再重新执行")
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?',
+                        (STATUS_FAILED,
+                         f"执行任务的进程异常退出（可能因内存不足或超时被终止），已尝试 {row['attempts']} 次，不再重试",
+                         time.time(), row['id'], STATUS_RUNNING)
+                    )
+                else:
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, worker_pid = NULL, started_at = NULL WHERE id = ? AND status = ?',
+                        (STATUS_QUEUED, row['id'], STATUS_RUNNING)
+                    )
+            queued = conn.execute(
+                'SELECT id FROM jobs WHERE status = ? ORDER BY created_at', (STATUS_QUEUED,)
+            ).fetchall()
+        return [row['id'] for row in queued]
+
+    def expired(self, finished_before):
+        """获取在指定时间之前结束的任务ID"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+                (STATUS_SUCCEEDED, STATUS_FAILED, finished_before)
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def delete(self, job_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+
+class JobQueue:
+    """本地有界任务队列，任务状态持久化在JobStore中，worker重启后可恢复未完成的任务"""
+
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self._workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._backlog = deque()  # 本地队列已满时暂存的待执行任务ID
+        self._pending = set()    # 已在本地队列或暂存中的任务ID，避免重复入队
+        self.job_folder = None
+        self.store = None
+
+    def start(self, job_folder):
+        """初始化任务存储，启动工作线程并恢复未完成的任务"""
+        with self._lock:
+            if self._threads:
+                return
+
+            self.job_folder = job_folder
+            os.makedirs(job_folder, exist_ok=True)
+            self.store = JobStore(os.path.join(job_folder, 'jobs.db'))
+
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._maintenance_loop, name='job-maintenance', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        recovered = self._recover()
+        logger.info(f"任务队列已启动 (pid={os.getpid()})，工作线程: {self._workers}，恢复排队任务: {recovered}")
+
+    def _recover(self):
+        """
+        恢复数据库中排队的任务（包括已退出进程遗留的运行中任务），返回新加入本进程的任务数量
+
+        本地队列放不下的任务暂存起来，有工作线程空闲时继续放入队列
+        """
+        recovered = 0
+        for job_id in self.store.requeue_orphans():
+            with self._lock:
+                if job_id in self._pending:
+                    continue
+                self._pending.add(job_id)
+                self._backlog.append(job_id)
+            recovered += 1
+        self._feed()
+        return recovered
+
+    def _feed(self):
+        """将暂存的任务放入本地队列，直到队列已满"""
+        with self._lock:
+            while self._backlog:
+                try:
+                    self._queue.put_nowait(self._backlog[0])
+                except queue.Full:
+                    break
+                self._backlog.popleft()
+
+    def sweep(self):
+        """删除超过JOB_TTL的已结束任务的记录和工作目录（含上传文件、输出文件和结果），返回删除的任务数量"""
+        removed = 0
+        for job_id in self.store.expired(time.time() - JOB_TTL):
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            self.store.delete(job_id)
+            removed += 1
+        if removed:
+            logger.info(f"已清理 {removed} 个过期任务")
+        return removed
+
+    def _maintenance_loop(self):
+        while True:
+            time.sleep(JOB_MAINTENANCE_INTERVAL)
+            try:
+                self.sweep()
+                self._recover()
+            except Exception as e:
+                logger.error(f"任务队列维护失败: {str(e)}")
+                logger.error(traceback.format_exc())
+
+    def job_dir(self, job_id):
+        """获取任务的工作目录"""
+        return os.path.join(self.job_folder, job_id)
+
+    def reserve(self):
+        """
+        为新任务分配ID并创建工作目录，调用方在目录中准备好输入后调用enqueue提交
+
+        Raises:
+            JobQueueFull: 任务队列已满
+        """
+        if self._queue.full():
+            raise JobQueueFull("任务队列已满，请稍后重试")
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        return job_id
+
+    def discard(self, job_id):
+        """放弃reserve分配但未提交的任务，删除工作目录"""
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def enqueue(self, job_id, target_format, filename, file_path, output_dir=None, options=None):
+        """
+        提交已准备好输入的任务
+
+        Args:
+            job_id: reserve分配的任务ID
+            target_format: 目标格式
+            filename: 原始文件名（用于展示）
+            file_path: 输入文件或目录，任务结束后删除
+            output_dir: 输出目录，默认为任务工作目录下的output
+            options: 其他转换选项
+
+        Returns:
+            dict: 新创建的任务记录
+        """
+        if target_format not in JOB_TARGET_FORMATS and target_format != JOB_BATCH_FORMAT:
+            raise ValueError(f"不支持的目标格式: {target_format}")
+
+        self.store.create({
+            'id': job_id,
+            'target_format': target_format,
+            'filename': filename,
+            'file_path': file_path,
+            'output_dir': output_dir or os.path.join(self.job_dir(job_id), 'output'),
+            'options': options
+        })
+
+        try:
+            with self._lock:
+                self._queue.put_nowait(job_id)
+                self._pending.add(job_id)
+        except queue.Full:
+            self.store.finish(job_id, STATUS_FAILED, error="任务队列已满")
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            raise JobQueueFull("任务队列已满，请稍后重试")
+
+        logger.info(f"提交转换任务: {job_id}，文件: {filename}，目标格式: {target_format}")
+        return self.store.get(job_id)
+
+    def submit(self, file_storage, filename, target_format, options=None):
+        """
+        保存上传文件并提交转换任务
+
+        Args:
+            file_storage: 上传的文件对象
+            filename: 原始文件名
+            target_format: 目标格式
+            options: 其他转换选项
+
+        Returns:
+            dict: 新创建的任务记录
+        """
+        if target_format not in JOB_TARGET_FORMATS:
+            raise ValueError(f"不支持的目标格式: {target_format}")
+
+        job_id = self.reserve()
+        file_path = os.path.join(self.job_dir(job_id), os.path.basename(filename))
+        with instrumentation.stage('upload_save'):
+            file_storage.save(file_path)
+
+        options = dict(options or {})
+        options.setdefault('base_name', os.path.splitext(os.path.basename(filename))[0])
+        return self.enqueue(job_id, target_format, filename, file_path, options=options)
+
+    def get(self, job_id):
+        """获取任务记录"""
+        return self.store.get(job_id)
+
+    def load_result(self, job):
+        """读取已完成任务的结果"""
+        if not job.get('result_path') or not os.path.exists(job['result_path']):
+            return None
+        with open(job['result_path'], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"执行任务 {job_id} 时出现未处理的错误: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                with self._lock:
+                    self._pending.discard(job_id)
+                self._queue.task_done()
+                self._feed()
+
+    def _run_job(self, job_id):
+        # 认领失败说明任务已被其他进程处理
+        if not self.store.claim(job_id):
+            return
+
+        job = self.store.get(job_id)
+        start_time = time.time()
+        conversion_context.reset()
+        logger.info(f"开始执行转换任务: {job_id}，目标格式: {job['target_format']}")
+
+        try:
+            options = json.loads(job['options'] or '{}')
+            with instrumentation.scope(f"job_{job['target_format']}"):
+                result = run_conversion(job['target_format'], job['file_path'], job['output_dir'], options)
+            result['processing_time'] = round(time.time() - start_time, 2)
+            result['cache'] = conversion_context.get('cache')
+            for key in ('pdf_pages', 'xlsx', 'image_ocr'):
+                if conversion_context.get(key) is not None:
+                    result[key] = conversion_context.get(key)
+
+            result_path = os.path.join(self.job_dir(job_id), 'result.json')
+            tmp_path = result_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, result_path)
+
+            self.store.finish(job_id, STATUS_SUCCEEDED, result_path=result_path)
+            logger.info(f"转换任务完成: {job_id}，耗时: {time.time() - start_time:.2f}秒")
+        except Exception as e:
+            logger.error(f"转换任务失败: {job_id}，原因: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.store.finish(job_id, STATUS_FAILED, error=str(e))
+        finally:
+            # 任务结束后删除上传的原始文件（批量任务为暂存目录），保留结果和输出文件
+            try:
+                if os.path.isdir(job['file_path']):
+                    shutil.rmtree(job['file_path'])
+                elif os.path.exists(job['file_path']):
+                    os.remove(job['file_path'])
+            except Exception as e:
+                logger.warning(f"无法删除任务输入文件: {job['file_path']}, 原因: {str(e)}")
+
+# 创建全局任务队列实例
+job_queue = JobQueue()
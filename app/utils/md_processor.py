@@ -1,14 +1,127 @@
 """
-Markdown预处理工具，用于将Markdown文件处理为JSON和CSV格式
-处理知识库入库前的数据准备工作
+Markdown预处理工具，用于将Markdown文件处理为JSON、JSON Lines和CSV格式
+处理知识库入库前的数据准备工作：按标题切分为问答对，或进一步切分为适合向量化的重叠分块
 """
+import io
 import os
 import re
-import json
 import csv
+import json
+import uuid
 import logging
-from typing import List, Dict, Tuple
-import pandas as pd
+from abc import ABC, abstractmethod
+from typing import List, Dict, Tuple, Iterable, Iterator, Union, Optional
+
+from app.utils import instrumentation
+from app.utils.engine_registry import engine_registry
+
+# ATX标题行：行首的#号后跟空白和标题文本
+HEADING_PATTERN = re.compile(r'^(#+)[ \t]+(.*?)\s*$')
+# 围栏代码块的开始行：最多3个空格缩进，后跟至少3个`或~
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})(.*)$')
+
+
+# 行的类型
+LINE_HEADING = 'heading'
+LINE_FENCE = 'fence'    # 围栏代码块（含开始和结束行）
+LINE_TABLE = 'table'
+LINE_TEXT = 'text'
+LINE_BLANK = 'blank'
+
+
+def _scan_lines(markdown: Union[str, Iterable[str]]) -> Iterator[Tuple[str, int, str, Optional[Tuple[int, str]]]]:
+    """
+    逐行扫描Markdown并识别每行的类型
+
+    Args:
+        markdown: Markdown文本，或逐行读取的可迭代对象（如打开的文件）
+
+    Yields:
+        (去掉换行符的行, 行首在文档中的字符偏移, 行类型, 标题行的(级别, 标题文本)或None)
+    """
+    lines = io.StringIO(markdown) if isinstance(markdown, str) else markdown
+    fence = None          # 当前所在围栏代码块的 (围栏字符, 围栏长度)
+    offset = 0
+
+    for raw_line in lines:
+        line = raw_line.rstrip('\r\n')
+        line_offset = offset
+        offset += len(raw_line)
+
+        if fence is not None:
+            match = FENCE_PATTERN.match(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= fence[1] and not match.group(2).strip():
+                fence = None
+            yield line, line_offset, LINE_FENCE, None
+            continue
+
+        match = FENCE_PATTERN.match(line)
+        if match and not (match.group(1)[0] == '`' and '`' in match.group(2)):
+            fence = (match.group(1)[0], len(match.group(1)))
+            yield line, line_offset, LINE_FENCE, None
+            continue
+
+        match = HEADING_PATTERN.match(line)
+        if match is not None:
+            yield line, line_offset, LINE_HEADING, (len(match.group(1)), match.group(2).strip())
+        elif not line.strip():
+            yield line, line_offset, LINE_BLANK, None
+        elif line.lstrip().startswith('|'):
+            yield line, line_offset, LINE_TABLE, None
+        else:
+            yield line, line_offset, LINE_TEXT, None
+
+
+class _HeadingStack:
+    """维护当前标题的所有上级标题"""
+
+    def __init__(self):
+        self._stack = []  # (标题级别, 标题文本)，从上到下依次为上级标题
+
+    def push(self, level: int, heading_text: str) -> List[str]:
+        """进入新标题，返回从一级标题到当前标题的标题列表"""
+        # 弹出同级和更低级的标题，栈中剩下的即为当前标题的上级标题
+        while self._stack and self._stack[-1][0] >= level:
+            self._stack.pop()
+        self._stack.append((level, heading_text))
+        return [title for _, title in self._stack]
+
+
+def iter_qa_pairs(markdown: Union[str, Iterable[str]]) -> Iterator[Dict[str, str]]:
+    """
+    逐行扫描Markdown，按标题切分为问答对并逐个生成
+
+    使用标题栈维护当前标题的所有上级标题，整个文档只扫描一遍；
+    围栏代码块（``` 或 ~~~）内以#开头的行不会被当作标题
+
+    Args:
+        markdown: Markdown文本，或逐行读取的可迭代对象（如打开的文件）
+
+    Yields:
+        包含'question'和'answer'键的字典，question为以逗号连接的上级标题和当前标题
+    """
+    headings = _HeadingStack()
+    question = None       # 当前标题对应的问题，文档开头第一个标题之前的内容不输出
+    content_lines = []
+
+    for line, _, kind, heading in _scan_lines(markdown):
+        if kind != LINE_HEADING:
+            content_lines.append(line)
+            continue
+
+        # 遇到新标题，输出上一个标题下的内容（跳过没有内容的标题）
+        if question is not None:
+            answer = '\n'.join(content_lines).strip()
+            if answer:
+                yield {"question": question, "answer": answer}
+        content_lines = []
+        question = ",".join(headings.push(*heading))
+
+    if question is not None:
+        answer = '\n'.join(content_lines).strip()
+        if answer:
+            yield {"question": question, "answer": answer}
+
 
 def parse_markdown_to_qa(markdown_text: str) -> List[Dict[str, str]]:
     """
@@ -20,107 +133,417 @@ def parse_markdown_to_qa(markdown_text: str) -> List[Dict[str, str]]:
     Returns:
         包含问答对的字典列表，每个字典包含'question'和'answer'键
     """
-    # 添加一个结束标记，确保最后一个部分也能被处理
-    markdown_text = markdown_text.strip() + "\n# END_OF_DOCUMENT"
-    
-    # 正则表达式匹配标题行（# 开头的行）
-    heading_pattern = re.compile(r'^(#+)\s+(.*?)$', re.MULTILINE)
-    
-    # 查找所有标题位置
-    headings = list(heading_pattern.finditer(markdown_text))
-    
-    # 如果没有找到标题，则返回空列表
-    if not headings or len(headings) <= 1:  # 只有END_OF_DOCUMENT不处理
-        return []
-    
-    qa_pairs = []
-    
-    # 处理标题和内容
-    for i in range(len(headings) - 1):  # 减1是因为最后一个是我们添加的END_OF_DOCUMENT
-        current_heading = headings[i]
-        next_heading = headings[i + 1]
-        
-        # 获取当前标题的级别和文本
-        level = len(current_heading.group(1))  # #的数量表示标题级别
-        heading_text = current_heading.group(2).strip()
-        
-        # 跳过END_OF_DOCUMENT标题
-        if heading_text == "END_OF_DOCUMENT":
-            continue
-        
-        # 获取此标题下的内容（到下一个标题之前的所有文本）
-        content_start = current_heading.end()
-        content_end = next_heading.start()
-        content = markdown_text[content_start:content_end].strip()
-        
-        # 跳过没有内容的标题
-        if not content:
-            continue
-        
-        # 查找上级标题（如果存在）
-        parent_titles = []
-        if level > 1:
-            for j in range(i-1, -1, -1):
-                prev_heading = headings[j]
-                prev_level = len(prev_heading.group(1))
-                
-                if prev_level < level:
-                    parent_title = prev_heading.group(2).strip()
-                    parent_titles.insert(0, parent_title)  # 插入到前面，保持层级顺序
-                    
-                    # 如果找到一级标题，停止查找
-                    if prev_level == 1:
-                        break
-        
-        # 构建完整问题标题
-        if parent_titles:
-            question = ",".join(parent_titles) + "," + heading_text
-        else:
-            question = heading_text
-        
-        # 添加问答对
-        qa_pairs.append({
-            "question": question,
-            "answer": content
+    return list(iter_qa_pairs(markdown_text))
+
+# 支持的分块计量单位及默认的 (分块大小, 重叠大小)
+CHUNK_UNITS = {'chars': (1000, 100), 'tokens': (512, 64)}
+# 按token计量时使用的tiktoken编码，未安装tiktoken时按字符数估算
+CHUNK_TOKEN_ENCODING = os.environ.get('CHUNK_TOKEN_ENCODING', 'cl100k_base')
+
+# 中日韩字符，估算token数时每个字符计为一个token
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def _create_token_encoder():
+    import tiktoken
+    return tiktoken.get_encoding(CHUNK_TOKEN_ENCODING)
+
+
+engine_registry.register('tiktoken', _create_token_encoder)
+
+
+def estimate_tokens(text: str) -> int:
+    """未安装tiktoken时估算token数：中日韩字符每字一个token，其他字符约每4个一个token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class _ChunkLine:
+    """分块中的一行（或超长行的一段）"""
+    __slots__ = ('text', 'start', 'size', 'group', 'joined')
+
+    def __init__(self, text, start, size, group, joined):
+        self.text = text
+        self.start = start
+        self.size = size
+        self.group = group
+        self.joined = joined  # 是否与前一段属于同一行（超长行被切开时）
+
+
+class MarkdownChunker:
+    """
+    将Markdown切分为适合向量化的重叠分块
+
+    分块不跨越标题，每个分块带有从一级标题到当前标题的标题路径和在源文档中的字符偏移；
+    段落、表格和围栏代码块尽量完整地放在同一个分块中，只有单独超过分块大小时才在行边界切开，
+    单行超过分块大小时按字符切开。逐行处理，内存占用只与分块大小有关
+    """
+
+    def __init__(self, max_size: int = None, overlap: int = None, unit: str = 'chars'):
+        if unit not in CHUNK_UNITS:
+            raise ValueError(f"不支持的分块单位: {unit}，支持的单位为：{'、'.join(CHUNK_UNITS)}")
+        default_size, default_overlap = CHUNK_UNITS[unit]
+        self.max_size = default_size if max_size is None else max_size
+        self.overlap = default_overlap if overlap is None else overlap
+        self.unit = unit
+        if self.max_size < 2:
+            raise ValueError("分块大小必须大于1")
+        if self.overlap < 0 or self.overlap >= self.max_size:
+            raise ValueError("重叠大小必须大于等于0且小于分块大小")
+
+        self._measure = len
+        if unit == 'tokens':
+            encoder = engine_registry.get('tiktoken')
+            if encoder is not None:
+                self._measure = lambda text: len(encoder.encode(text, disallowed_special=()))
+            else:
+                self._measure = estimate_tokens
+
+    def _split_long_line(self, line, start, group):
+        """将超过分块大小的单行切开，尽量在空白处切分，每段留出重叠部分的空间"""
+        size = self._measure(line)
+        piece_chars = max(1, len(line) * max(1, self.max_size - self.overlap - 1) // max(size, 1))
+        position = 0
+        while position < len(line):
+            end = min(position + piece_chars, len(line))
+            if end < len(line):
+                space = line.rfind(' ', position + piece_chars // 2, end)
+                if space >= 0:
+                    end = space + 1
+            piece = line[position:end]
+            yield _ChunkLine(piece, start + position, self._measure(piece) + 1, group, position > 0)
+            position = end
+
+    def _make_chunk(self, lines, breadcrumbs, index):
+        # 去掉首尾的空行
+        first, last = 0, len(lines) - 1
+        while first <= last and not lines[first].text.strip():
+            first += 1
+        while last >= first and not lines[last].text.strip():
+            last -= 1
+        if first > last:
+            return None
+
+        parts = [lines[first].text]
+        for line in lines[first + 1:last + 1]:
+            parts.append(line.text if line.joined else '\n' + line.text)
+        text = ''.join(parts)
+        return {
+            'question': ','.join(breadcrumbs),
+            'answer': text,
+            'breadcrumbs': list(breadcrumbs),
+            'chunk_index': index,
+            'start': lines[first].start,
+            'end': lines[last].start + len(lines[last].text),
+            'size': self._measure(text),
+            'unit': self.unit
+        }
+
+    def _overlap_tail(self, lines):
+        """取已输出分块末尾不超过重叠大小的若干行，作为下一个分块的开头"""
+        tail = []
+        size = 0
+        for line in reversed(lines):
+            if size + line.size > self.overlap:
+                break
+            tail.append(line)
+            size += line.size
+        tail.reverse()
+        # 重叠部分不以空行或被切开的行的后半段开头
+        while tail and (not tail[0].text.strip() or tail[0].joined):
+            tail.pop(0)
+        if not tail and lines and lines[-1].text.strip():
+            # 最后一行比重叠大小还长时，取该行末尾的一段，从空白处开始以免截断单词
+            line = lines[-1]
+            keep = max(1, len(line.text) * self.overlap // max(line.size, 1))
+            cut = len(line.text) - keep
+            space = line.text.find(' ', cut)
+            if 0 <= space < len(line.text) - 1:
+                cut = space + 1
+            piece = line.text[cut:]
+            size = self._measure(piece) + 1
+            if size <= self.overlap:
+                tail = [_ChunkLine(piece, line.start + cut, size, line.group, False)]
+        return tail
+
+    def iter_chunks(self, markdown: Union[str, Iterable[str]]) -> Iterator[Dict]:
+        """
+        逐个生成分块
+
+        Args:
+            markdown: Markdown文本，或逐行读取的可迭代对象（如打开的文件）
+
+        Yields:
+            分块字典：question（以逗号连接的标题路径）、answer（分块文本）、breadcrumbs（标题路径列表）、
+            chunk_index、start/end（在源文档中的字符偏移）、size、unit
+        """
+        headings = _HeadingStack()
+        breadcrumbs = []      # 文档开头第一个标题之前的内容没有标题路径
+        lines = []
+        size = 0
+        carried = 0           # lines开头来自上一分块的重叠行数
+        index = 0
+        group = 0
+        previous_kind = None
+
+        for text, start, kind, heading in _scan_lines(markdown):
+            if kind == LINE_HEADING:
+                # 分块不跨越标题
+                chunk = self._make_chunk(lines, breadcrumbs, index)
+                if chunk is not None:
+                    yield chunk
+                    index += 1
+                lines, size, carried, previous_kind = [], 0, 0, None
+                breadcrumbs = headings.push(*heading)
+                continue
+
+            # 连续的同类行（段落、表格、代码块）组成一组，空行单独成组
+            if kind != previous_kind or kind == LINE_BLANK:
+                group += 1
+            previous_kind = kind
+
+            line_size = self._measure(text) + 1
+            if line_size > self.max_size:
+                pieces = list(self._split_long_line(text, start, group))
+            else:
+                pieces = [_ChunkLine(text, start, line_size, group, False)]
+
+            for piece in pieces:
+                while lines and size + piece.size > self.max_size:
+                    # 优先在当前组开始之前切分，使段落、表格和代码块保持完整
+                    split = len(lines)
+                    if lines[-1].group == piece.group:
+                        split = next(i for i, line in enumerate(lines) if line.group == piece.group)
+                        if split == 0:
+                            split = len(lines)
+                    if split <= carried:
+                        # 切分点之前只有重叠部分时不单独输出，丢弃重叠部分
+                        lines, carried = lines[carried:], 0
+                        size = sum(line.size for line in lines)
+                        continue
+                    head, rest = lines[:split], lines[split:]
+
+                    chunk = self._make_chunk(head, breadcrumbs, index)
+                    if chunk is not None:
+                        yield chunk
+                        index += 1
+
+                    carry = self._overlap_tail(head) if self.overlap else []
+                    rest_size = sum(line.size for line in rest)
+                    while carry and sum(line.size for line in carry) + rest_size + piece.size > self.max_size:
+                        carry.pop(0)
+                    lines, carried = carry + rest, len(carry)
+                    size = sum(line.size for line in lines)
+
+                lines.append(piece)
+                size += piece.size
+
+        chunk = self._make_chunk(lines, breadcrumbs, index)
+        if chunk is not None:
+            yield chunk
+
+
+# 支持的问答对导出格式及文件扩展名
+QA_EXPORT_FORMATS = {'json': '.json', 'jsonl': '.jsonl', 'csv': '.csv'}
+# 问答对和分块的字段（CSV列名）
+QA_FIELDS = ['question', 'answer']
+CHUNK_FIELDS = ['question', 'answer', 'breadcrumbs', 'chunk_index', 'start', 'end', 'size', 'unit']
+
+
+class QAFileWriter(ABC):
+    """
+    问答对文件写入器基类
+
+    问答对逐个写入同目录下的临时文件，commit()时原子地替换为目标文件，
+    写入失败时调用abort()删除临时文件，目标文件不会出现写了一半的内容
+    """
+
+    def __init__(self, output_path: str, fieldnames: Iterable[str] = QA_FIELDS):
+        self.output_path = output_path
+        self.fieldnames = list(fieldnames)
+        self.count = 0
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, 'w', encoding='utf-8', newline='')
+        self._begin()
+
+    def _begin(self):
+        pass
+
+    @abstractmethod
+    def _write(self, qa_pair: Dict[str, str]):
+        """将一个问答对写入临时文件"""
+        pass
+
+    def _end(self):
+        pass
+
+    def write(self, qa_pair: Dict[str, str]):
+        """写入一个问答对"""
+        self._write(qa_pair)
+        self.count += 1
+
+    def commit(self) -> str:
+        """完成写入并替换目标文件，返回目标文件路径"""
+        self._end()
+        self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+        return self.output_path
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class JSONArrayWriter(QAFileWriter):
+    """紧凑格式的JSON数组"""
+
+    def _begin(self):
+        self._file.write('[')
+
+    def _write(self, qa_pair):
+        if self.count:
+            self._file.write(',')
+        self._file.write(json.dumps(qa_pair, ensure_ascii=False, separators=(',', ':')))
+
+    def _end(self):
+        self._file.write(']')
+
+
+class JSONLinesWriter(QAFileWriter):
+    """JSON Lines，每行一个问答对"""
+
+    def _write(self, qa_pair):
+        self._file.write(json.dumps(qa_pair, ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+
+
+class CSVWriter(QAFileWriter):
+    """每个字段一列的CSV，换行符和引号按CSV规则转义，列表字段（如标题路径）以JSON数组表示"""
+
+    def _begin(self):
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, lineterminator='\n', extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, qa_pair):
+        self._writer.writerow({
+            key: json.dumps(value, ensure_ascii=False) if isinstance(value, list) else value
+            for key, value in qa_pair.items()
         })
-    
-    return qa_pairs
 
-def save_as_json(qa_pairs: List[Dict[str, str]], output_path: str) -> str:
+
+QA_WRITERS = {'json': JSONArrayWriter, 'jsonl': JSONLinesWriter, 'csv': CSVWriter}
+
+
+def write_qa_files(qa_pairs: Iterable[Dict], outputs: Dict[str, str], fieldnames: Iterable[str] = QA_FIELDS) -> int:
+    """
+    逐个消费问答对，同时写入多个格式的文件
+
+    问答对只遍历一次，可以直接传入iter_qa_pairs()生成器，内存占用与文档大小无关；
+    所有文件都写入成功后才替换目标文件
+
+    Args:
+        qa_pairs: 问答对的可迭代对象
+        outputs: 导出格式 -> 输出文件路径，格式取值见QA_EXPORT_FORMATS
+        fieldnames: CSV的列名
+
+    Returns:
+        写入的问答对数量
+    """
+    writers = []
+    try:
+        for export_format, output_path in outputs.items():
+            writers.append(QA_WRITERS[export_format](output_path, fieldnames))
+
+        count = 0
+        for qa_pair in qa_pairs:
+            for writer in writers:
+                writer.write(qa_pair)
+            count += 1
+
+        for writer in writers:
+            writer.commit()
+        return count
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+
+
+def export_qa_pairs(markdown: Union[str, Iterable[str]], output_dir: str, filename_base: str,
+                    formats: Iterable[str] = ('json', 'csv'), chunker: 'MarkdownChunker' = None) -> Tuple[Dict[str, str], int]:
+    """
+    将Markdown解析为问答对（或分块）并导出为指定格式的文件
+
+    Args:
+        markdown: Markdown文本，或逐行读取的可迭代对象（如打开的文件）
+        output_dir: 输出目录
+        filename_base: 输出文件名基础（不含扩展名）
+        formats: 导出格式列表
+        chunker: 分块器，提供时导出分块而不是按标题切分的问答对
+
+    Returns:
+        元组包含(导出格式 -> 文件路径, 问答对或分块数量)
     """
-    将问答对保存为JSON文件
+    outputs = {
+        export_format: os.path.join(output_dir, filename_base + QA_EXPORT_FORMATS[export_format])
+        for export_format in formats
+    }
+    if chunker is not None:
+        records, fieldnames = chunker.iter_chunks(markdown), CHUNK_FIELDS
+    else:
+        records, fieldnames = iter_qa_pairs(markdown), QA_FIELDS
+    with instrumentation.stage('serialization', converter='md_qa'):
+        count = write_qa_files(records, outputs, fieldnames)
+    return outputs, count
+
+
+def save_as_json(qa_pairs: Iterable[Dict[str, str]], output_path: str) -> str:
+    """
+    将问答对保存为紧凑格式的JSON数组文件
     
     Args:
-        qa_pairs: 包含问答对的字典列表
+        qa_pairs: 问答对的可迭代对象
         output_path: 输出文件路径
         
     Returns:
         保存的文件路径
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(qa_pairs, f, ensure_ascii=False, indent=2)
+    write_qa_files(qa_pairs, {'json': output_path})
+    return output_path
+
+def save_as_jsonl(qa_pairs: Iterable[Dict[str, str]], output_path: str) -> str:
+    """
+    将问答对保存为JSON Lines文件
     
+    Args:
+        qa_pairs: 问答对的可迭代对象
+        output_path: 输出文件路径
+        
+    Returns:
+        保存的文件路径
+    """
+    write_qa_files(qa_pairs, {'jsonl': output_path})
     return output_path
 
-def save_as_csv(qa_pairs: List[Dict[str, str]], output_path: str) -> str:
+def save_as_csv(qa_pairs: Iterable[Dict[str, str]], output_path: str) -> str:
     """
     将问答对保存为CSV文件
     
     Args:
-        qa_pairs: 包含问答对的字典列表
+        qa_pairs: 问答对的可迭代对象
         output_path: 输出文件路径
         
     Returns:
         保存的文件路径
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # 使用pandas保存为CSV，确保正确处理特殊字符和换行符
-    df = pd.DataFrame(qa_pairs)
-    df.to_csv(output_path, index=False, encoding='utf-8')
-    
+    write_qa_files(qa_pairs, {'csv': output_path})
     return output_path
 
 def process_markdown_file(file_path: str, output_dir: str, filename_base: str = None) -> Tuple[str, str]:
@@ -135,29 +558,15 @@ def process_markdown_file(file_path: str, output_dir: str, filename_base: str =
     Returns:
         元组包含(json文件路径, csv文件路径)
     """
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    
     # 如果没有提供文件名基础，则使用原始文件名（不含扩展名）
     if not filename_base:
         filename_base = os.path.splitext(os.path.basename(file_path))[0]
     
-    # 读取Markdown文件
+    # 逐行读取Markdown文件，边解析边写入
     with open(file_path, 'r', encoding='utf-8') as f:
-        markdown_text = f.read()
-    
-    # 解析Markdown为问答对
-    qa_pairs = parse_markdown_to_qa(markdown_text)
-    
-    # 生成输出文件路径
-    json_path = os.path.join(output_dir, f"{filename_base}.json")
-    csv_path = os.path.join(output_dir, f"{filename_base}.csv")
-    
-    # 保存为JSON和CSV
-    save_as_json(qa_pairs, json_path)
-    save_as_csv(qa_pairs, csv_path)
+        outputs, _ = export_qa_pairs(f, output_dir, filename_base, ('json', 'csv'))
     
-    return json_path, csv_path
+    return outputs['json'], outputs['csv']
 
 def process_markdown_text(markdown_text: str, output_dir: str, filename_base: str) -> Tuple[str, str]:
     """
@@ -171,18 +580,5 @@ def process_markdown_text(markdown_text: str, output_dir: str, filename_base: st
     Returns:
         元组包含(json文件路径, csv文件路径)
     """
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 解析Markdown为问答对
-    qa_pairs = parse_markdown_to_qa(markdown_text)
-    
-    # 生成输出文件路径
-    json_path = os.path.join(output_dir, f"{filename_base}.json")
-    csv_path = os.path.join(output_dir, f"{filename_base}.csv")
-    
-    # 保存为JSON和CSV
-    save_as_json(qa_pairs, json_path)
-    save_as_csv(qa_pairs, csv_path)
-    
-    return json_path, csv_path 
\ No newline at end of file
+    outputs, _ = export_qa_pairs(markdown_text, output_dir, filename_base, ('json', 'csv'))
+    return outputs['json'], outputs['csv']
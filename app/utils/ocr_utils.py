@@ -1,125 +1,461 @@
 import os
 import logging
-import tempfile
 import traceback
-from PIL import Image
-import pytesseract
 import sys
 import io
-from pdf2image import convert_from_path
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils import conversion_context, instrumentation
+from app.utils.engine_registry import engine_registry
+from app.utils.result_cache import DiskLRUCache
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
-# 检查是否安装了Tesseract OCR
-HAS_TESSERACT = False
-try:
-    # 尝试获取Tesseract版本
-    tesseract_version = pytesseract.get_tesseract_version()
-    HAS_TESSERACT = True
-    logger.info(f"成功检测到Tesseract OCR，版本: {tesseract_version}")
-except Exception as e:
-    logger.warning(f"未检测到Tesseract OCR: {str(e)}")
-    logger.warning("OCR功能将不可用，请安装Tesseract OCR: https://github.com/tesseract-ocr/tesseract")
-
-def extract_text_from_image(image_path, lang='chi_sim+eng'):
-    """从图片中提取文本"""
-    if not HAS_TESSERACT:
-        logger.warning("Tesseract OCR未安装，无法提取图片文本")
-        return "[图片文本提取失败: Tesseract OCR未安装]"
-    
+# PDF页面和文档嵌入图片并行OCR的线程数量
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+# PDF栅格化时每批处理的页数
+PDF_RASTER_BATCH_PAGES = int(os.environ.get('PDF_RASTER_BATCH_PAGES', '4'))
+# 每批栅格化时pdftoppm使用的线程数量
+PDF_RASTER_THREADS = int(os.environ.get('PDF_RASTER_THREADS', '2'))
+# PDF栅格化分辨率
+PDF_RASTER_DPI = 200
+# 文档嵌入图片的像素数（宽×高）低于该值时视为图标或装饰图片，跳过OCR
+OCR_MIN_IMAGE_PIXELS = int(os.environ.get('OCR_MIN_IMAGE_PIXELS', '4096'))
+# 文档嵌入图片的长边超过该值时先缩小再识别
+OCR_MAX_IMAGE_SIDE = int(os.environ.get('OCR_MAX_IMAGE_SIDE', '2500'))
+# 是否启用图片OCR结果缓存
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 图片OCR结果缓存目录
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join('cache', 'ocr'))
+# 图片OCR结果缓存的容量上限（字节），默认64MB
+OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# 缓存格式版本，预处理方式变化时递增以废弃旧缓存
+OCR_CACHE_FORMAT_VERSION = 1
+# 是否按感知哈希对同一文档中尺寸相同、内容近似的图片去重
+OCR_PERCEPTUAL_DEDUP = os.environ.get('OCR_PERCEPTUAL_DEDUP', 'false').lower() in ['true', '1', 't', 'y', 'yes']
+
+# OCR引擎：auto优先使用tesserocr（进程内常驻的Tesseract API，语言模型只加载一次），
+# 不可用时回退到pytesseract（每次识别都启动一个tesseract进程并重新加载语言模型）
+OCR_ENGINES = ['auto', 'tesserocr', 'pytesseract']
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto').lower()
+# tesserocr在每个进程内最多同时存在的API实例数量（所有语言组合合计，含正在使用和空闲的实例）
+OCR_ENGINE_POOL_SIZE = int(os.environ.get('OCR_ENGINE_POOL_SIZE', str(OCR_WORKERS)))
+
+
+class PytesseractEngine:
+    """通过pytesseract调用tesseract命令行的OCR引擎，每次识别启动一个tesseract进程"""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        # pytesseract会连带导入pandas，且版本检测需要启动tesseract进程，只在第一次需要OCR时执行
+        import pytesseract
+        try:
+            # 尝试获取Tesseract版本
+            self.version = str(pytesseract.get_tesseract_version())
+        except Exception as e:
+            raise ImportError(f"未检测到Tesseract OCR: {str(e)}")
+        self._pytesseract = pytesseract
+
+    def image_to_string(self, image, lang):
+        return self._pytesseract.image_to_string(image, lang=lang)
+
+
+class TesserocrEngine:
+    """
+    通过tesserocr在进程内调用Tesseract API的OCR引擎
+
+    每种语言组合的API实例在第一次使用时创建（加载语言模型），识别完成后放回空闲池供后续调用复用；
+    API实例不是线程安全的，并发识别时每个线程各取一个实例，识别过程中释放GIL。
+    每个实例都持有较大的语言模型内存，实例总数不超过pool_size：名额用尽时回收其他语言的空闲实例，
+    没有空闲实例可回收时等待其他线程识别完成
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, pool_size=OCR_ENGINE_POOL_SIZE):
+        import tesserocr
+        tessdata_path, languages = tesserocr.get_languages()
+        if not languages:
+            raise ImportError(f"tesserocr未找到任何语言模型，tessdata路径: {tessdata_path}")
+        self._tesserocr = tesserocr
+        self.version = tesserocr.tesseract_version().splitlines()[0]
+        self.pool_size = max(1, pool_size)
+        self._reset_after_fork()
+        # fork出的子进程（如批量转换进程池）不能复用父进程的API实例和锁
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # 实例数量的信号量：_live为已创建（正在使用和空闲）的实例数，实例结束或被回收时通知等待的线程
+        self._cond = threading.Condition()
+        self._live = 0
+        self._idle = {}  # 语言 -> 空闲的API实例列表
+
+    def _acquire(self, lang):
+        evicted = None
+        with self._cond:
+            while True:
+                idle = self._idle.get(lang)
+                if idle:
+                    return idle.pop()
+                if self._live < self.pool_size:
+                    self._live += 1
+                    break
+                # 名额已满：回收一个其他语言的空闲实例，由本线程接管其名额
+                evicted = next((apis.pop() for apis in self._idle.values() if apis), None)
+                if evicted is not None:
+                    break
+                self._cond.wait()
+
+        try:
+            if evicted is not None:
+                evicted.End()
+            # 创建实例时加载语言模型，耗时较长，不持有锁
+            logger.info(f"创建Tesseract API实例，语言: {lang} (pid={os.getpid()})")
+            return self._tesserocr.PyTessBaseAPI(lang=lang)
+        except Exception:
+            self._discarded()
+            raise
+
+    def _release(self, lang, api):
+        with self._cond:
+            self._idle.setdefault(lang, []).append(api)
+            self._cond.notify()
+
+    def _discarded(self):
+        """实例已结束，释放其名额"""
+        with self._cond:
+            self._live -= 1
+            self._cond.notify()
+
+    def image_to_string(self, image, lang):
+        api = self._acquire(lang)
+        try:
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+        except Exception:
+            # 识别失败的实例状态不确定，不放回空闲池
+            api.End()
+            self._discarded()
+            raise
+        api.Clear()
+        self._release(lang, api)
+        return text
+
+
+def _create_ocr_engine():
+    """按OCR_ENGINE配置创建OCR引擎，依赖缺失时抛出ImportError"""
+    engine_name = OCR_ENGINE
+    if engine_name not in OCR_ENGINES:
+        logger.warning(f"未知的OCR引擎: {engine_name}，使用auto")
+        engine_name = 'auto'
+
+    if engine_name in ('auto', 'tesserocr'):
+        try:
+            engine = TesserocrEngine()
+            logger.info(f"使用tesserocr进行OCR，Tesseract版本: {engine.version}")
+            return engine
+        except ImportError as e:
+            if engine_name == 'tesserocr':
+                raise
+            logger.info(f"tesserocr不可用（{str(e)}），使用pytesseract进行OCR")
+
     try:
-        logger.info(f"开始从图片提取文本: {image_path}")
-        
-        # 检查文件是否存在
-        if not os.path.exists(image_path):
-            logger.error(f"图片文件不存在: {image_path}")
-            return "[图片不存在]"
-        
-        # 打开图片
-        image = Image.open(image_path)
-        
-        # 记录图片信息
-        logger.info(f"图片尺寸: {image.size}, 格式: {image.format}, 模式: {image.mode}")
-        
-        # 使用pytesseract提取文本
-        text = pytesseract.image_to_string(image, lang=lang)
-        
-        # 检查提取结果
-        if text.strip():
-            # 确保OCR识别的文本使用UTF-8编码
-            if any(ord(c) > 127 for c in text):
-                logger.debug("OCR识别的文本包含非ASCII字符，确保UTF-8编码")
-                
-                # 尝试检测编码并转换为UTF-8
-                try:
-                    # 将文本编码为bytes，然后解码为UTF-8
-                    text_bytes = text.encode('utf-8', errors='replace')
-                    text = text_bytes.decode('utf-8')
-                    logger.debug("成功将OCR文本转换为UTF-8编码")
-                except Exception as e:
-                    logger.warning(f"OCR文本编码转换失败: {str(e)}")
-            
-            logger.info(f"成功从图片提取文本，共 {len(text)} 个字符")
-            return text.strip()
-        else:
-            logger.warning("图片中未检测到文本")
-            return "[图片中未检测到文本]"
-    
-    except Exception as e:
-        error_msg = f"图片文本提取失败: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
-        return f"[{error_msg}]"
+        engine = PytesseractEngine()
+    except ImportError:
+        logger.warning("OCR功能将不可用，请安装Tesseract OCR: https://github.com/tesseract-ocr/tesseract")
+        raise
+    logger.info(f"成功检测到Tesseract OCR，版本: {engine.version}")
+    return engine
+
+
+engine_registry.register('ocr', _create_ocr_engine)
+
+
+def get_ocr_engine():
+    """获取进程内共享的OCR引擎，未安装Tesseract OCR时返回None"""
+    return engine_registry.get('ocr')
+
+
+def has_tesseract():
+    """检查Tesseract OCR是否可用，第一次调用时才创建OCR引擎，检测结果在进程内缓存"""
+    return get_ocr_engine() is not None
+
+
+def ocr_engine_name():
+    """当前使用的OCR引擎名称，OCR不可用时返回None"""
+    engine = get_ocr_engine()
+    return engine.name if engine is not None else None
+
+def _ocr_pil_image(image, lang):
+    """对内存中的图片执行OCR，返回去除首尾空白的文本"""
+    text = get_ocr_engine().image_to_string(image, lang)
+    return text.strip()
+
+def _prepare_embedded_image(image_bytes):
+    """
+    解码文档中嵌入的图片并转换为适合OCR的灰度图
+
+    只读取图片头即可得到尺寸，过小的图片不解码直接跳过；JPEG在解码时直接按目标尺寸缩小，
+    透明背景填充为白色（透明区域默认按黑色处理，会干扰识别），二值化由Tesseract自行完成
+
+    Returns:
+        PIL灰度图片，图片过小时返回None
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if width * height < OCR_MIN_IMAGE_PIXELS:
+        logger.debug(f"图片尺寸 {width}x{height} 过小，跳过OCR")
+        return None
+
+    if image.format == 'JPEG':
+        image.draft('L', (OCR_MAX_IMAGE_SIDE, OCR_MAX_IMAGE_SIDE))
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, 'white')
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L')
+    if max(image.size) > OCR_MAX_IMAGE_SIDE:
+        image.thumbnail((OCR_MAX_IMAGE_SIDE, OCR_MAX_IMAGE_SIDE), Image.LANCZOS)
+    return image
+
+def _perceptual_key(image):
+    """
+    计算图片的尺寸和差异哈希（dHash），重新压缩过的同一图片结果相同
+
+    只在尺寸完全相同时才视为同一图片；纯色图片的哈希为0，不参与去重
+
+    Returns:
+        str: 去重键，无法可靠去重时返回None
+    """
+    from PIL import Image
+
+    pixels = list(image.resize((9, 8), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    if value == 0:
+        return None
+    return f"{image.size[0]}x{image.size[1]}:{value:016x}"
+
 
-def extract_text_from_image_bytes(image_bytes, lang='chi_sim+eng'):
-    """从图片字节数据中提取文本"""
-    if not HAS_TESSERACT:
+class OCRResultCache:
+    """
+    图片OCR结果缓存，以图片内容的SHA-256、OCR引擎、语言和预处理参数为键，
+    保存在有大小上限的磁盘目录中，多个worker进程共享
+    """
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES, enabled=OCR_CACHE_ENABLED):
+        self.enabled = enabled
+        self._store = DiskLRUCache(cache_dir, max_bytes, suffix='.txt')
+
+    @staticmethod
+    def make_key(image_hash, lang):
+        """根据图片内容哈希、OCR引擎、语言和预处理参数生成缓存键"""
+        key_source = json.dumps({
+            'version': OCR_CACHE_FORMAT_VERSION,
+            'image': image_hash,
+            'engine': ocr_engine_name(),
+            'lang': lang,
+            'max_side': OCR_MAX_IMAGE_SIDE
+        }, sort_keys=True)
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """读取识别文本，未命中时返回None"""
+        if not self.enabled:
+            return None
+        try:
+            data = self._store.get(key)
+        except Exception as e:
+            logger.warning(f"读取OCR结果缓存失败: {str(e)}")
+            return None
+        instrumentation.record_cache('ocr', 'text', 'miss' if data is None else 'hit')
+        return None if data is None else data.decode('utf-8')
+
+    def put(self, key, text):
+        """写入识别文本"""
+        if not self.enabled:
+            return
+        try:
+            self._store.put(key, text.encode('utf-8'))
+        except Exception as e:
+            logger.warning(f"写入OCR结果缓存失败: {str(e)}")
+
+
+# 创建全局OCR结果缓存实例
+ocr_cache = OCRResultCache()
+
+
+class EmbeddedImageOCR:
+    """
+    识别一份文档中嵌入的图片，图片在内存中解码，在线程池中并行识别
+
+    Logo、页眉图片和水印在文档中反复出现：内容相同（SHA-256相同）的图片只提交识别一次，
+    识别结果保存在跨请求的OCR结果缓存中；启用OCR_PERCEPTUAL_DEDUP时，
+    尺寸和感知哈希相同的图片（如重新压缩过的同一个Logo）也复用已完成的识别结果
+    """
+
+    def __init__(self, executor, lang='chi_sim+eng'):
+        self.executor = executor
+        self.lang = lang
+        self._lock = threading.Lock()
+        self._futures = {}     # 图片SHA-256 -> 识别任务
+        self._perceptual = {}  # 尺寸和感知哈希 -> 识别文本
+        self._stats = dict.fromkeys([
+            'images', 'unique', 'duplicates', 'cache_hits', 'perceptual_hits', 'skipped', 'recognized', 'failed'
+        ], 0)
+
+    def submit(self, image_bytes):
+        """
+        提交一张图片
+
+        Returns:
+            Future: 结果为识别出的文本，图片过小、无法解码或未识别出文本时为空字符串
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            self._stats['images'] += 1
+            future = self._futures.get(digest)
+            if future is not None:
+                self._stats['duplicates'] += 1
+                return future
+            self._stats['unique'] += 1
+            future = self.executor.submit(self._recognize, image_bytes, digest)
+            self._futures[digest] = future
+            return future
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _recognize(self, image_bytes, digest):
+        cache_key = ocr_cache.make_key(digest, self.lang)
+        text = ocr_cache.get(cache_key)
+        if text is not None:
+            self._count('cache_hits')
+            return text
+
+        perceptual_key = None
+        try:
+            image = _prepare_embedded_image(image_bytes)
+            if image is None:
+                self._count('skipped')
+                return ''
+            if OCR_PERCEPTUAL_DEDUP:
+                perceptual_key = _perceptual_key(image)
+                with self._lock:
+                    text = self._perceptual.get(perceptual_key) if perceptual_key else None
+                if text is not None:
+                    self._count('perceptual_hits')
+                    return text
+            text = _ocr_pil_image(image, self.lang)
+        except Exception as e:
+            logger.warning(f"嵌入图片OCR失败: {str(e)}")
+            self._count('failed')
+            return ''
+
+        self._count('recognized')
+        if perceptual_key:
+            with self._lock:
+                self._perceptual[perceptual_key] = text
+        ocr_cache.put(cache_key, text)
+        return text
+
+    def stats(self):
+        """图片去重和识别统计"""
+        with self._lock:
+            return dict(self._stats)
+
+def embedded_image_executor(max_workers=None):
+    """创建识别文档嵌入图片的线程池"""
+    return ThreadPoolExecutor(max_workers=max(1, max_workers or OCR_WORKERS), thread_name_prefix='image-ocr')
+
+@instrumentation.timed('ocr')
+def ocr_embedded_images(blobs, lang='chi_sim+eng', max_workers=None):
+    """
+    并行识别文档中嵌入的多张图片，相同的图片只识别一次，统计信息记录在转换元数据的image_ocr中
+
+    Args:
+        blobs: 图片字节数据列表
+        lang: Tesseract语言
+        max_workers: 并行OCR的线程数量，默认使用OCR_WORKERS
+
+    Returns:
+        list: 与blobs一一对应的识别文本，未识别出文本的图片为空字符串
+    """
+    if not blobs:
+        return []
+    if not has_tesseract():
         logger.warning("Tesseract OCR未安装，无法提取图片文本")
-        return "[图片文本提取失败: Tesseract OCR未安装]"
-    
-    try:
-        logger.info("开始从图片字节数据提取文本")
-        
-        # 从字节数据创建图片对象
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # 记录图片信息
-        logger.info(f"图片尺寸: {image.size}, 格式: {image.format}, 模式: {image.mode}")
-        
-        # 使用pytesseract提取文本
-        text = pytesseract.image_to_string(image, lang=lang)
-        
-        # 检查提取结果
-        if text.strip():
-            # 确保OCR识别的文本使用UTF-8编码
-            if any(ord(c) > 127 for c in text):
-                logger.debug("OCR识别的文本包含非ASCII字符，确保UTF-8编码")
-                
-                # 尝试检测编码并转换为UTF-8
-                try:
-                    # 将文本编码为bytes，然后解码为UTF-8
-                    text_bytes = text.encode('utf-8', errors='replace')
-                    text = text_bytes.decode('utf-8')
-                    logger.debug("成功将OCR文本转换为UTF-8编码")
-                except Exception as e:
-                    logger.warning(f"OCR文本编码转换失败: {str(e)}")
-            
-            logger.info(f"成功从图片提取文本，共 {len(text)} 个字符")
-            return text.strip()
+        return [''] * len(blobs)
+    with embedded_image_executor(max_workers) as executor:
+        recognizer = EmbeddedImageOCR(executor, lang)
+        futures = [recognizer.submit(blob) for blob in blobs]
+        texts = [future.result() for future in futures]
+    conversion_context.record('image_ocr', recognizer.stats())
+    return texts
+
+def _page_batches(page_numbers, batch_size):
+    """将页码列表切分为连续的(起始页, 结束页)区间，每个区间不超过batch_size页"""
+    batches = []
+    for page_no in sorted(set(page_numbers)):
+        if batches and page_no == batches[-1][1] + 1 and batches[-1][1] - batches[-1][0] + 1 < batch_size:
+            batches[-1][1] = page_no
         else:
-            logger.warning("图片中未检测到文本")
-            return "[图片中未检测到文本]"
+            batches.append([page_no, page_no])
+    return [tuple(batch) for batch in batches]
+
+def iter_pdf_page_images(pdf_path, page_numbers, batch_size=PDF_RASTER_BATCH_PAGES, dpi=PDF_RASTER_DPI):
+    """
+    按页码区间逐批将PDF栅格化为图片，避免一次性将整份PDF加载到内存
     
-    except Exception as e:
-        error_msg = f"图片文本提取失败: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
-        return f"[{error_msg}]"
+    Args:
+        pdf_path: PDF文件路径
+        page_numbers: 需要栅格化的页码列表（从1开始）
+        batch_size: 每批栅格化的页数
+        dpi: 栅格化分辨率
+        
+    Yields:
+        (页码, PIL图片)
+    """
+    from pdf2image import convert_from_path
 
-def extract_text_from_pdf_images(pdf_path, lang='chi_sim+eng'):
-    """从PDF文件中提取图片并识别文本"""
-    if not HAS_TESSERACT:
+    for first_page, last_page in _page_batches(page_numbers, batch_size):
+        images = convert_from_path(
+            pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+            thread_count=min(PDF_RASTER_THREADS, last_page - first_page + 1)
+        )
+        for offset, image in enumerate(images):
+            yield first_page + offset, image
+
+@instrumentation.timed('ocr')
+def extract_text_from_pdf_images(pdf_path, lang='chi_sim+eng', max_workers=None, page_numbers=None):
+    """
+    将PDF逐页栅格化并识别文本
+    
+    页面按批次流式栅格化，OCR在线程池中并行执行（tesserocr识别时释放GIL，pytesseract在独立的tesseract进程中运行），
+    同时进行中的页面数量有上限，结果按页码顺序返回
+    
+    Args:
+        pdf_path: PDF文件路径
+        lang: Tesseract语言
+        max_workers: 并行OCR的线程数量，默认使用OCR_WORKERS
+        page_numbers: 需要识别的页码列表（从1开始），默认识别全部页面
+        
+    Returns:
+        list: 识别出文本的页面列表，每项包含page和text
+    """
+    if not has_tesseract():
         logger.warning("Tesseract OCR未安装，无法提取PDF图片文本")
         return []
     
@@ -131,42 +467,59 @@ def extract_text_from_pdf_images(pdf_path, lang='chi_sim+eng'):
             logger.error(f"PDF文件不存在: {pdf_path}")
             return []
         
-        # 创建临时目录存储图片
-        with tempfile.TemporaryDirectory() as temp_dir:
-            logger.info(f"创建临时目录: {temp_dir}")
-            
-            # 将PDF转换为图片
+        if page_numbers is None:
             try:
-                logger.info("将PDF转换为图片")
-                images = convert_from_path(pdf_path)
-                logger.info(f"成功将PDF转换为 {len(images)} 张图片")
+                from pdf2image import pdfinfo_from_path
+                page_count = pdfinfo_from_path(pdf_path)['Pages']
             except Exception as e:
-                logger.error(f"PDF转图片失败: {str(e)}")
+                logger.error(f"读取PDF页数失败: {str(e)}")
                 return []
+            page_numbers = range(1, page_count + 1)
+        
+        page_numbers = sorted(set(page_numbers))
+        if not page_numbers:
+            return []
+        
+        max_workers = max(1, max_workers or OCR_WORKERS)
+        max_pending = max_workers * 2
+        start_time = time.time()
+        logger.info(f"PDF待识别 {len(page_numbers)} 页，使用 {max_workers} 个线程并行OCR")
+        
+        results = []
+        pending = deque()
+        
+        def collect_oldest():
+            page_no, future = pending.popleft()
+            try:
+                text = future.result()
+            except Exception as e:
+                logger.warning(f"第 {page_no} 页OCR失败: {str(e)}")
+                return
+            if text:
+                results.append({
+                    'page': page_no,
+                    'text': text
+                })
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdf-ocr') as executor:
+            try:
+                for page_no, image in iter_pdf_page_images(pdf_path, page_numbers):
+                    logger.debug(f"提交第 {page_no} 页OCR")
+                    pending.append((page_no, executor.submit(_ocr_pil_image, image, lang)))
+                    # 限制同时在内存中的页面图片数量
+                    while len(pending) >= max_pending:
+                        collect_oldest()
+            except Exception as e:
+                logger.error(f"PDF转图片失败: {str(e)}")
             
-            # 处理每张图片
-            results = []
-            for i, image in enumerate(images):
-                # 保存图片到临时文件
-                image_path = os.path.join(temp_dir, f"page_{i+1}.png")
-                image.save(image_path, "PNG")
-                
-                # 提取文本
-                logger.info(f"处理第 {i+1} 页图片")
-                text = extract_text_from_image(image_path, lang)
-                
-                # 添加结果
-                if text and text != "[图片中未检测到文本]":
-                    results.append({
-                        'page': i+1,
-                        'text': text
-                    })
-            
-            logger.info(f"从PDF中提取了 {len(results)} 页图片文本")
-            return results
+            while pending:
+                collect_oldest()
+        
+        logger.info(f"从PDF中提取了 {len(results)} 页图片文本，耗时: {time.time() - start_time:.2f}秒")
+        return results
     
     except Exception as e:
         error_msg = f"PDF图片文本提取失败: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
-        return [] 
\ No newline at end of file
+        return []
@@ -0,0 +1,359 @@
+"""
+转换结果缓存模块
+以上传文件内容的SHA-256、转换器名称、输出格式和转换选项为键，
+将转换结果保存在有大小上限的磁盘目录中，按最近使用时间淘汰
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import functools
+import threading
+import contextvars
+import traceback
+from contextlib import contextmanager
+
+from app.utils import conversion_context, instrumentation
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用转换结果缓存
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() in ['true', '1', 't', 'y', 'yes']
+# 缓存目录
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join('cache', 'results'))
+# 缓存目录的容量上限（字节），默认1GB
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# 缓存格式版本，结果结构变化时递增以废弃旧缓存
+CACHE_FORMAT_VERSION = 2
+
+# 读取文件计算哈希时的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 旧版转换器出错时返回的错误文本前缀，这类结果可能由临时故障引起，不写入缓存
+ERROR_RESULT_MARKERS = ('[无法读取文档内容:', '[无法提取.doc文件内容', '[.doc文件转换失败:', '# 音频处理错误')
+
+# 多个worker进程共享的缓存目录占用大小记录文件及其锁文件
+SIZE_FILENAME = 'size'
+SIZE_LOCK_FILENAME = 'size.lock'
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def file_sha256(file_path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 已知内容哈希的文件：路径 -> (文件大小, 修改时间, SHA-256)，由上传暂存时登记
+_known_hashes = {}
+_known_hashes_lock = threading.Lock()
+
+
+def register_content_hash(file_path, content_hash):
+    """登记写入时已计算出的文件内容哈希，避免转换前再次读取整个文件"""
+    stat = os.stat(file_path)
+    with _known_hashes_lock:
+        _known_hashes[os.path.abspath(file_path)] = (stat.st_size, stat.st_mtime_ns, content_hash)
+
+
+def forget_content_hash(file_path):
+    """删除文件前取消登记"""
+    with _known_hashes_lock:
+        _known_hashes.pop(os.path.abspath(file_path), None)
+
+
+def is_error_result(value):
+    """
+    检查转换结果是否为旧版转换器返回的错误文本
+
+    convert_to_markdown会在文本前加上文件名标题，因此同时检查第一段和第二段
+    """
+    if not isinstance(value, str):
+        return False
+    return any(part.startswith(ERROR_RESULT_MARKERS) for part in value.split('\n\n', 2)[:2])
+
+
+def content_hash(file_path):
+    """获取文件内容的SHA-256，文件登记后未被修改时直接使用登记的哈希"""
+    with _known_hashes_lock:
+        known = _known_hashes.get(os.path.abspath(file_path))
+    if known is not None:
+        stat = os.stat(file_path)
+        if (stat.st_size, stat.st_mtime_ns) == known[:2]:
+            return known[2]
+    return file_sha256(file_path)
+
+
+class DiskLRUCache:
+    """
+    有容量上限的磁盘缓存，每个条目一个文件，以文件修改时间作为最近使用时间，
+    超出上限时删除最久未使用的条目。多个worker进程可以共享同一目录，
+    目录的总占用记录在共享的size文件中，由文件锁保护，任何进程写入后超出上限都会触发淘汰
+    """
+
+    def __init__(self, cache_dir, max_bytes, suffix='.json'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """读取缓存条目，命中时刷新其最近使用时间"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        """原子地写入缓存条目，必要时淘汰旧条目"""
+        if len(data) > self.max_bytes:
+            logger.info(f"缓存条目过大，跳过写入: {len(data)} 字节")
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._size_lock():
+            total = self._read_size()
+            total = self._scan_size() if total is None else total + len(data) - previous_size
+            if total > self.max_bytes:
+                total = self._evict()
+            self._write_size(total)
+
+    @contextmanager
+    def _size_lock(self):
+        """跨进程（flock）和进程内线程之间互斥地更新size文件"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, SIZE_LOCK_FILENAME), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_size(self):
+        """读取共享的目录占用大小，记录不存在或无法解析时返回None"""
+        try:
+            with open(os.path.join(self.cache_dir, SIZE_FILENAME), 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _write_size(self, total):
+        path = os.path.join(self.cache_dir, SIZE_FILENAME)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(max(0, total)))
+        os.replace(tmp_path, path)
+
+    def open(self, key):
+        """以二进制方式打开缓存条目用于读取部分内容，不刷新最近使用时间，条目不存在时返回None"""
+        try:
+            return open(self._path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        """删除缓存条目并从共享的占用大小中扣除，返回是否存在"""
+        try:
+            size = os.path.getsize(self._path(key))
+        except OSError:
+            return False
+        if not self._delete_file(key):
+            return False
+        with self._size_lock():
+            total = self._read_size()
+            if total is not None:
+                self._write_size(total - size)
+        return True
+
+    def _delete_file(self, key):
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def entries(self):
+        """列出所有缓存条目：(键, 大小, 最近使用时间)"""
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(self.suffix):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_dir, name))
+                except FileNotFoundError:
+                    continue
+                result.append((name[:-len(self.suffix)], stat.st_size, stat.st_mtime))
+        return result
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def _evict(self):
+        """按最近使用时间从旧到新删除条目，直到容量降到上限的90%以下"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= target:
+                break
+            if self._delete_file(key):
+                total -= size
+                removed += 1
+        logger.info(f"缓存淘汰完成，删除 {removed} 个条目，当前占用: {total / 1024 / 1024:.2f} MB")
+        return total
+
+
+class ResultCache:
+    """转换结果缓存，结果和转换过程中记录的元数据一起以JSON格式保存"""
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, enabled=RESULT_CACHE_ENABLED):
+        self.enabled = enabled
+        self._store = DiskLRUCache(cache_dir, max_bytes)
+
+    @staticmethod
+    def make_key(content_hash, converter_name, output_format, options=None):
+        """根据内容哈希、转换器、输出格式和选项生成缓存键"""
+        key_source = json.dumps({
+            'version': CACHE_FORMAT_VERSION,
+            'content': content_hash,
+            'converter': converter_name,
+            'format': output_format,
+            'options': options or {}
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """读取缓存结果，返回(结果, 元数据)，未命中时返回None"""
+        if not self.enabled:
+            return None
+        try:
+            data = self._store.get(key)
+            if data is None:
+                return None
+            entry = json.loads(data.decode('utf-8'))
+            return entry['value'], entry.get('metadata') or {}
+        except Exception as e:
+            logger.warning(f"读取转换结果缓存失败: {str(e)}")
+            return None
+
+    def put(self, key, value, metadata=None):
+        """写入缓存结果"""
+        if not self.enabled:
+            return
+        try:
+            data = json.dumps({
+                'value': value,
+                'metadata': metadata or {},
+                'created_at': time.time()
+            }, ensure_ascii=False).encode('utf-8')
+            self._store.put(key, data)
+        except Exception as e:
+            logger.warning(f"写入转换结果缓存失败: {str(e)}")
+            logger.debug(traceback.format_exc())
+
+# 创建全局转换结果缓存实例
+result_cache = ResultCache()
+
+# 当前是否处于缓存包装的转换调用内部，嵌套调用只在最外层缓存
+_cache_depth = contextvars.ContextVar('result_cache_depth', default=0)
+
+
+def cached_conversion(converter_name, output_format, method=False, key_includes_name=False, extra_key=None):
+    """
+    为转换函数添加结果缓存的装饰器
+
+    Args:
+        converter_name: 转换器名称，参与缓存键计算
+        output_format: 输出格式，参与缓存键计算
+        method: 被装饰的是否为实例方法（第一个参数为self）
+        key_includes_name: 结果是否依赖文件名，是则将文件名计入缓存键
+        extra_key: 返回额外缓存键字段的函数，用于区分OCR可用性等运行环境差异
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            file_path = args[1] if method else args[0]
+            if not result_cache.enabled or _cache_depth.get() > 0:
+                return func(*args, **kwargs)
+
+            try:
+                options = {
+                    'ext': os.path.splitext(file_path)[1].lower(),
+                    'args': list(args[2:] if method else args[1:]),
+                    'kwargs': kwargs
+                }
+                if key_includes_name:
+                    options['name'] = os.path.basename(file_path)
+                if extra_key is not None:
+                    options.update(extra_key())
+                key = result_cache.make_key(content_hash(file_path), converter_name, output_format, options)
+            except OSError:
+                # 文件无法读取时交给转换函数自行报错
+                return func(*args, **kwargs)
+
+            cached = result_cache.get(key)
+            if cached is not None:
+                value, metadata = cached
+                conversion_context.update(metadata)
+                conversion_context.record('cache', 'hit')
+                instrumentation.record_cache(converter_name, output_format, 'hit')
+                logger.info(f"转换结果缓存命中: {converter_name}/{output_format} {file_path}")
+                return value
+
+            token = _cache_depth.set(_cache_depth.get() + 1)
+            try:
+                value = func(*args, **kwargs)
+            finally:
+                _cache_depth.reset(token)
+
+            if is_error_result(value):
+                logger.warning(f"转换结果为错误信息，不写入缓存: {converter_name}/{output_format} {file_path}")
+                return value
+
+            metadata = conversion_context.snapshot()
+            metadata.pop('cache', None)
+            metadata.pop('document_cache', None)
+            result_cache.put(key, value, metadata)
+            conversion_context.record('cache', 'miss')
+            instrumentation.record_cache(converter_name, output_format, 'miss')
+            return value
+        return wrapper
+    return decorator
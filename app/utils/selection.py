@@ -0,0 +1,163 @@
+"""
+文档范围选择模块
+解析转换接口的pages、slides、sheets参数，转换时只解析和识别选中的PDF页面、幻灯片和工作表
+"""
+import os
+
+# 选择参数 -> 适用的文件扩展名
+SELECTOR_FORMATS = {
+    'pages': ['.pdf'],
+    'slides': ['.ppt', '.pptx'],
+    'sheets': ['.xls', '.xlsx']
+}
+
+
+class SelectionError(ValueError):
+    """选择参数无效，或所选范围在文档中不存在"""
+
+
+class PageSelector:
+    """
+    从1开始的页码（或幻灯片序号）选择器
+
+    格式为逗号分隔的页码和范围，例如 "1-3,5,8-" 表示第1至3页、第5页和第8页至最后一页，
+    "-3" 表示前3页
+    """
+
+    def __init__(self, spec):
+        ranges = []
+        for item in str(spec).split(','):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                if '-' in item:
+                    start_text, _, end_text = item.partition('-')
+                    start = int(start_text) if start_text.strip() else 1
+                    end = int(end_text) if end_text.strip() else None
+                else:
+                    start = end = int(item)
+            except ValueError:
+                raise SelectionError(f"无效的范围: {item}，示例：1-3,5,8-")
+            if start < 1 or (end is not None and end < start):
+                raise SelectionError(f"无效的范围: {item}，页码从1开始且结束页不能小于起始页")
+            ranges.append((start, end))
+        if not ranges:
+            raise SelectionError("范围不能为空，示例：1-3,5,8-")
+
+        # 合并重叠和相邻的范围
+        ranges.sort(key=lambda r: r[0])
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            last_start, last_end = merged[-1]
+            if last_end is None or start <= last_end + 1:
+                merged[-1] = (last_start, None if last_end is None or end is None else max(last_end, end))
+            else:
+                merged.append((start, end))
+        self.ranges = merged
+
+    def __contains__(self, number):
+        return any(start <= number and (end is None or number <= end) for start, end in self.ranges)
+
+    def __str__(self):
+        parts = []
+        for start, end in self.ranges:
+            if end is None:
+                parts.append(f"{start}-")
+            elif start == end:
+                parts.append(str(start))
+            else:
+                parts.append(f"{start}-{end}")
+        return ','.join(parts)
+
+    @property
+    def first(self):
+        """选中的第一页"""
+        return self.ranges[0][0]
+
+    @property
+    def last(self):
+        """选中的最后一页，范围不封闭时为None"""
+        return self.ranges[-1][1]
+
+    @property
+    def is_contiguous(self):
+        """是否为单个连续范围"""
+        return len(self.ranges) == 1
+
+    def numbers(self, total):
+        """
+        在共total页的文档中选中的页码
+
+        Raises:
+            SelectionError: 没有任何页码落在文档范围内
+        """
+        numbers = [n for start, end in self.ranges for n in range(start, min(end or total, total) + 1)]
+        if not numbers:
+            raise SelectionError(f"所选范围 {self} 超出文档范围，文档共 {total} 页")
+        return numbers
+
+
+class SheetSelector:
+    """工作表选择器，逗号分隔的工作表名称或从1开始的序号，例如 "汇总,3" """
+
+    def __init__(self, spec):
+        self.items = [item.strip() for item in str(spec).split(',') if item.strip()]
+        if not self.items:
+            raise SelectionError("工作表不能为空，示例：Sheet1,3")
+
+    def __str__(self):
+        return ','.join(self.items)
+
+    def select(self, sheet_names):
+        """
+        按工作簿中的顺序返回选中的工作表名称，名称优先于序号匹配
+
+        Raises:
+            SelectionError: 指定的工作表不存在
+        """
+        selected = set()
+        for item in self.items:
+            if item in sheet_names:
+                selected.add(item)
+            elif item.isdigit() and 1 <= int(item) <= len(sheet_names):
+                selected.add(sheet_names[int(item) - 1])
+            else:
+                raise SelectionError(f"工作表不存在: {item}，文档包含的工作表为：{'、'.join(sheet_names)}")
+        return [name for name in sheet_names if name in selected]
+
+
+def parse_selection(values, file_ext, allowed=None):
+    """
+    从请求参数中解析适用于该文件类型的选择参数
+
+    Args:
+        values: 请求参数（如request.form）
+        file_ext: 上传文件的扩展名
+        allowed: 接口支持的选择参数，默认全部支持
+
+    Returns:
+        dict: 选择参数名 -> 规范化后的范围字符串，只包含请求中指定的参数，
+            可直接作为关键字参数传给转换函数（规范化后等价的范围共用结果缓存）
+
+    Raises:
+        SelectionError: 参数格式无效、不适用于该文件类型或接口不支持
+    """
+    selection = {}
+    for name, formats in SELECTOR_FORMATS.items():
+        spec = (values.get(name) or '').strip()
+        if not spec:
+            continue
+        if allowed is not None and name not in allowed:
+            raise SelectionError(f"此接口不支持{name}参数")
+        if file_ext not in formats:
+            raise SelectionError(f"{name}参数只适用于{'、'.join(formats)}文件")
+        selector = SheetSelector(spec) if name == 'sheets' else PageSelector(spec)
+        selection[name] = str(selector)
+    return selection
+
+
+def selection_for(file_path, **selection):
+    """只保留已指定且适用于该文件类型的选择参数"""
+    file_ext = os.path.splitext(file_path)[1].lower()
+    return {name: spec for name, spec in selection.items() if spec and file_ext in SELECTOR_FORMATS.get(name, [])}
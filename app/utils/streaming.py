@@ -0,0 +1,119 @@
+"""
+流式响应模块
+将转换器生成的文本片段以分块传输的方式发送给客户端，
+支持NDJSON（每行一个JSON对象）和原始文本两种模式
+"""
+import os
+import json
+import time
+import logging
+import traceback
+
+from flask import Response, stream_with_context
+
+from app.utils import conversion_context
+from app.utils.upload_storage import take_request_uploads
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个响应分块累积的最小字符数，避免为很短的页面或行单独发送分块
+STREAM_CHUNK_CHARS = int(os.environ.get('STREAM_CHUNK_CHARS', '16384'))
+
+# 支持的流式模式
+STREAM_MODES = ['ndjson', 'raw']
+
+
+def iter_chunks(parts, chunk_chars=STREAM_CHUNK_CHARS):
+    """
+    将按换行符连接的文本片段合并为大小适中的分块
+
+    Args:
+        parts: 文本片段迭代器，所有片段按换行符连接即为完整文本
+        chunk_chars: 每个分块累积的最小字符数
+
+    Yields:
+        str: 文本分块，直接拼接即为完整文本
+    """
+    buffer = []
+    buffered_chars = 0
+    first = True
+    for part in parts:
+        if not first:
+            buffer.append('\n')
+            buffered_chars += 1
+        first = False
+        buffer.append(part)
+        buffered_chars += len(part)
+        if buffered_chars >= chunk_chars:
+            yield ''.join(buffer)
+            buffer = []
+            buffered_chars = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_conversion(parts, mode, filename, file_size, start_time, raw_mimetype='text/plain'):
+    """
+    以流式响应返回转换结果
+
+    NDJSON模式下每个分块为一行 {"type": "chunk", "index": ..., "text": ...}，
+    最后一行为 {"type": "end", ...} 汇总信息；转换失败时最后一行为 {"type": "error", ...}。
+    原始文本模式下直接发送文本，转换失败时中断连接。
+    本次请求暂存的上传文件在响应发送完毕（或客户端断开）后删除
+
+    Args:
+        parts: 文本片段迭代器
+        mode: 流式模式，取值见STREAM_MODES
+        filename: 原始文件名
+        file_size: 文件大小
+        start_time: 请求开始时间
+        raw_mimetype: 原始文本模式的Content-Type
+
+    Returns:
+        Response: 分块传输的Flask响应
+    """
+    def generate():
+        chars = 0
+        chunk_count = 0
+        try:
+            for chunk in iter_chunks(parts):
+                chars += len(chunk)
+                if mode == 'ndjson':
+                    yield json.dumps({'type': 'chunk', 'index': chunk_count, 'text': chunk}, ensure_ascii=False) + '\n'
+                else:
+                    yield chunk
+                chunk_count += 1
+
+            processing_time = time.time() - start_time
+            logger.info(f"流式转换完成: {filename}，发送 {chunk_count} 个分块，共 {chars} 个字符，耗时: {processing_time:.2f}秒")
+            if mode == 'ndjson':
+                yield json.dumps({
+                    'type': 'end',
+                    'filename': filename,
+                    'file_size': file_size,
+                    'chars': chars,
+                    'chunks': chunk_count,
+                    'processing_time': round(processing_time, 2),
+                    'metadata': conversion_context.snapshot()
+                }, ensure_ascii=False, default=str) + '\n'
+        except Exception as e:
+            logger.error(f"流式转换失败: {filename}，原因: {str(e)}")
+            logger.error(traceback.format_exc())
+            if mode != 'ndjson':
+                # 原始文本模式无法在响应中表示错误，中断连接让客户端感知传输不完整
+                raise
+            yield json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False) + '\n'
+        finally:
+            close = getattr(parts, 'close', None)
+            if close is not None:
+                close()
+
+    mimetype = 'application/x-ndjson' if mode == 'ndjson' else raw_mimetype
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    # 禁止反向代理缓冲，保证分块能及时到达客户端
+    response.headers['X-Accel-Buffering'] = 'no'
+    # 请求结束时响应尚未生成，暂存文件改为在响应关闭时删除
+    for upload in take_request_uploads():
+        response.call_on_close(upload.cleanup)
+    return response
@@ -0,0 +1,98 @@
+"""
+上传文件暂存模块
+每个上传文件写入独立的临时目录（保留原始文件名，供按文件名和扩展名分派的转换器使用），
+写入时同步计算SHA-256，供转换结果缓存直接使用；
+请求结束时统一删除本次请求暂存的所有文件
+"""
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from flask import g, has_request_context
+
+from app.utils import instrumentation
+from app.utils.result_cache import register_content_hash, forget_content_hash
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 写入上传文件时的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class StagedUpload:
+    """已暂存的上传文件"""
+
+    def __init__(self, path, filename, size, sha256):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.dir = os.path.dirname(path)
+
+    def cleanup(self):
+        """删除暂存文件及其临时目录，可重复调用"""
+        if not os.path.isdir(self.dir):
+            return
+        forget_content_hash(self.path)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        logger.info(f"临时文件已删除: {self.path}")
+
+
+def stage_upload(file_storage, upload_folder, filename=None):
+    """
+    将上传文件流式写入独立的临时目录，同时计算SHA-256
+
+    在请求上下文中调用时，文件会在请求结束时自动删除
+
+    Args:
+        file_storage: 上传的文件对象
+        upload_folder: 暂存根目录
+        filename: 保存使用的文件名，默认使用上传文件名
+
+    Returns:
+        StagedUpload: 暂存文件信息
+    """
+    filename = os.path.basename((filename or file_storage.filename).replace('\\', '/')) or 'upload'
+    os.makedirs(upload_folder, exist_ok=True)
+    upload_dir = tempfile.mkdtemp(prefix='upload_', dir=upload_folder)
+    path = os.path.join(upload_dir, filename)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with instrumentation.stage('upload_save'), open(path, 'wb') as f:
+            for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+
+    upload = StagedUpload(path, filename, size, digest.hexdigest())
+    register_content_hash(path, upload.sha256)
+
+    if has_request_context():
+        if 'staged_uploads' not in g:
+            g.staged_uploads = []
+        g.staged_uploads.append(upload)
+
+    logger.info(f"文件保存成功: {path}，大小: {size / 1024:.2f} KB")
+    return upload
+
+
+def take_request_uploads():
+    """取出本次请求暂存的上传文件，之后由调用方负责删除（用于流式响应）"""
+    return g.pop('staged_uploads', [])
+
+
+def cleanup_request_uploads(exc=None):
+    """请求结束时删除本次请求暂存的所有上传文件（注册为teardown_request回调）"""
+    for upload in g.pop('staged_uploads', []):
+        try:
+            upload.cleanup()
+        except Exception as e:
+            logger.warning(f"无法删除临时文件: {upload.path}, 原因: {str(e)}")
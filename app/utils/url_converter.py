@@ -3,9 +3,6 @@ import logging
 import traceback
 import time
 import re
-import requests
-from bs4 import BeautifulSoup
-import html2text
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -15,6 +12,9 @@ class URLConverter:
     
     def __init__(self):
         """初始化URL转换器"""
+        # requests、bs4和html2text在第一次转换URL时才导入，不计入工作进程启动耗时
+        import html2text
+
         self.html2text_converter = html2text.HTML2Text()
         self.html2text_converter.ignore_links = False
         self.html2text_converter.ignore_images = False
@@ -48,6 +48,7 @@ class URLConverter:
             }
             
             # 发送请求获取网页内容
+            import requests
             response = requests.get(url, headers=headers, timeout=30)
             
             # 检查响应状态
@@ -81,6 +82,7 @@ class URLConverter:
             logger.info("开始移除页眉和页脚")
             
             # 解析HTML
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(html_content, 'html.parser')
             
             # 移除常见的页眉、页脚、导航、侧边栏等元素
@@ -118,6 +120,7 @@ class URLConverter:
             logger.info(f"开始使用选择器提取内容: {selector}")
             
             # 解析HTML
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(html_content, 'html.parser')
             
             # 使用选择器查找元素
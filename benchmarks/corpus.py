@@ -0,0 +1,272 @@
+"""
+基准测试语料生成模块
+按规模生成确定性的合成文档：多段落DOCX、宽表/长表XLSX、多图片PPTX、
+数百页PDF（文本页与扫描页混合）、大型HTML和深层嵌套的Markdown
+"""
+import io
+import os
+import json
+import random
+
+# 各规模下的语料参数
+SCALES = {
+    'small': {
+        'docx_paragraphs': 500,
+        'xlsx_tall_rows': 20000, 'xlsx_tall_cols': 8,
+        'xlsx_wide_rows': 500, 'xlsx_wide_cols': 200,
+        'pptx_slides': 20, 'pptx_images_per_slide': 2,
+        'pdf_text_pages': 50, 'pdf_scanned_pages': 5,
+        'html_sections': 200,
+        'md_sections': 200, 'md_depth': 6
+    },
+    'medium': {
+        'docx_paragraphs': 5000,
+        'xlsx_tall_rows': 200000, 'xlsx_tall_cols': 8,
+        'xlsx_wide_rows': 2000, 'xlsx_wide_cols': 500,
+        'pptx_slides': 100, 'pptx_images_per_slide': 3,
+        'pdf_text_pages': 300, 'pdf_scanned_pages': 20,
+        'html_sections': 2000,
+        'md_sections': 2000, 'md_depth': 6
+    },
+    'large': {
+        'docx_paragraphs': 20000,
+        'xlsx_tall_rows': 500000, 'xlsx_tall_cols': 10,
+        'xlsx_wide_rows': 5000, 'xlsx_wide_cols': 1000,
+        'pptx_slides': 300, 'pptx_images_per_slide': 4,
+        'pdf_text_pages': 800, 'pdf_scanned_pages': 50,
+        'html_sections': 10000,
+        'md_sections': 10000, 'md_depth': 6
+    }
+}
+
+# 生成文本使用的词表（中英文混合，与实际业务文档接近）
+WORDS = [
+    '文档', '转换', '知识库', '表格', '图片', '段落', '标题', '内容', '数据', '分析',
+    'document', 'convert', 'knowledge', 'table', 'image', 'paragraph', 'section',
+    'performance', 'benchmark', 'markdown', 'worker', 'pipeline', 'layout', 'model'
+]
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_docx(path, paragraphs):
+    """生成包含多级标题和大量段落的Word文档"""
+    import docx
+
+    rng = random.Random(1)
+    document = docx.Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            document.add_heading(f'第 {i // 50 + 1} 章 {_sentence(rng, 3)}', level=1)
+        elif i % 10 == 0:
+            document.add_heading(f'{i // 10 + 1}. {_sentence(rng, 4)}', level=2)
+        else:
+            document.add_paragraph(_sentence(rng, 30))
+    document.save(path)
+    return {'paragraphs': paragraphs}
+
+
+def generate_xlsx(path, rows, cols):
+    """生成指定行列数的Excel文件（使用write_only模式，生成过程本身不占用大量内存）"""
+    import openpyxl
+
+    rng = random.Random(2)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('数据')
+    sheet.append([f'列{c + 1}' for c in range(cols)])
+    for r in range(rows):
+        sheet.append([
+            r if c == 0 else (rng.random() * 1000 if c % 3 == 1 else rng.choice(WORDS))
+            for c in range(cols)
+        ])
+    workbook.save(path)
+    return {'rows': rows + 1, 'cols': cols}
+
+
+def _png_bytes(rng, width=640, height=360, lines=8):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(lines):
+        draw.text((20, 20 + line * 40), _sentence(rng, 6), fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def small_images(count, width=360, height=60):
+    """生成包含一两行文字的小图片（PNG字节），模拟文档中嵌入的截图、图标和标签"""
+    rng = random.Random(7)
+    return [_png_bytes(rng, width, height, lines=1) for _ in range(count)]
+
+
+def generate_pptx(path, slides, images_per_slide):
+    """生成每张幻灯片包含标题、正文和多张图片的PowerPoint文件"""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    rng = random.Random(3)
+    # 预先生成少量图片并重复使用，与实际演示文稿中图片重复出现的情况一致
+    images = [_png_bytes(rng) for _ in range(max(1, images_per_slide * 2))]
+
+    presentation = Presentation()
+    layout = presentation.slide_layouts[1]
+    for i in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f'幻灯片 {i + 1}: {_sentence(rng, 4)}'
+        slide.placeholders[1].text = '\n'.join(_sentence(rng, 10) for _ in range(4))
+        for j in range(images_per_slide):
+            image = images[(i + j) % len(images)]
+            slide.shapes.add_picture(io.BytesIO(image), Inches(0.5 + j * 2), Inches(5), width=Inches(1.8))
+    presentation.save(path)
+    return {'slides': slides, 'images': slides * images_per_slide}
+
+
+def _text_pdf_page(writer, rng, lines=45):
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer.add_blank_page(612, 792)
+    page = writer.pages[-1]
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica')
+    })
+    page[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})
+    })
+    # PDF标准字体只能直接输出ASCII文本
+    ascii_words = [w for w in WORDS if w.isascii()]
+    operations = ['BT /F1 10 Tf 14 TL 50 750 Td']
+    for _ in range(lines):
+        text = ' '.join(rng.choice(ascii_words) for _ in range(12))
+        operations.append(f'({text}) Tj T*')
+    operations.append('ET')
+    content = DecodedStreamObject()
+    content.set_data('\n'.join(operations).encode('latin-1'))
+    page[NameObject('/Contents')] = writer._add_object(content)
+
+
+def generate_pdf(path, text_pages, scanned_pages):
+    """生成带文本层的页面和整页图片（模拟扫描件）混合的PDF"""
+    from PIL import Image, ImageDraw
+    from PyPDF2 import PdfReader, PdfWriter
+
+    rng = random.Random(4)
+    writer = PdfWriter()
+    for _ in range(text_pages):
+        _text_pdf_page(writer, rng)
+
+    if scanned_pages:
+        scans = []
+        for i in range(scanned_pages):
+            image = Image.new('L', (1240, 1754), 255)
+            draw = ImageDraw.Draw(image)
+            for line in range(40):
+                draw.text((80, 80 + line * 40), ' '.join(rng.choice(WORDS) for _ in range(10)), fill=0)
+            scans.append(image)
+        buffer = io.BytesIO()
+        scans[0].save(buffer, format='PDF', save_all=True, append_images=scans[1:], resolution=150)
+        buffer.seek(0)
+        for page in PdfReader(buffer).pages:
+            writer.add_page(page)
+
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return {'pages': text_pages + scanned_pages, 'scanned_pages': scanned_pages}
+
+
+def generate_html(path, sections):
+    """生成包含导航、页眉页脚、表格和列表的大型HTML页面"""
+    rng = random.Random(5)
+    parts = [
+        '<html><head><title>benchmark</title><style>body{font-family:sans-serif}</style>',
+        '<script>var x = 1;</script></head><body>',
+        '<header><nav><a href="/">首页</a><a href="/about">关于</a></nav></header><main>'
+    ]
+    for i in range(sections):
+        parts.append(f'<h2>{i + 1}. {_sentence(rng, 4)}</h2>')
+        parts.append(f'<p>{_sentence(rng, 40)} <a href="/doc/{i}">{_sentence(rng, 2)}</a></p>')
+        if i % 5 == 0:
+            parts.append('<table><tr><th>名称</th><th>数值</th><th>说明</th></tr>')
+            for r in range(5):
+                parts.append(f'<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(0, 9999)}</td><td>{_sentence(rng, 5)}</td></tr>')
+            parts.append('</table>')
+        if i % 7 == 0:
+            parts.append('<ul>' + ''.join(f'<li>{_sentence(rng, 6)}</li>' for _ in range(5)) + '</ul>')
+    parts.append('</main><aside class="sidebar">相关链接</aside><footer>版权所有</footer></body></html>')
+
+    html = '\n'.join(parts)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    return {'chars': len(html)}
+
+
+def markdown_text(sections, depth, seed=6):
+    """生成多级标题深层嵌套、包含代码块和表格的Markdown文本"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(sections):
+        level = 1 + (i % depth)
+        lines.append(f"{'#' * level} {i + 1} {_sentence(rng, 4)}")
+        lines.append('')
+        lines.append(_sentence(rng, 40))
+        lines.append('')
+        if i % 10 == 0:
+            lines.append('```python')
+            lines.append('# 代码块中的注释不是标题')
+            lines.append('print("hello")')
+            lines.append('```')
+            lines.append('')
+        if i % 15 == 0:
+            lines.append('| 名称 | 数值 |')
+            lines.append('| --- | --- |')
+            lines.append(f'| {rng.choice(WORDS)} | {rng.randint(0, 999)} |')
+            lines.append('')
+    return '\n'.join(lines)
+
+
+def generate_markdown(path, sections, depth):
+    """生成深层嵌套的Markdown文档"""
+    text = markdown_text(sections, depth)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return {'chars': len(text), 'sections': sections}
+
+
+def build_corpus(corpus_dir, scale='small'):
+    """
+    在指定目录生成完整语料，已存在的文件直接复用
+
+    Returns:
+        dict: 语料名称 -> {'path': 文件路径, 其他统计信息}
+    """
+    params = SCALES[scale]
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    specs = {
+        'docx_paragraphs': ('paragraphs.docx', generate_docx, (params['docx_paragraphs'],)),
+        'xlsx_tall': ('tall.xlsx', generate_xlsx, (params['xlsx_tall_rows'], params['xlsx_tall_cols'])),
+        'xlsx_wide': ('wide.xlsx', generate_xlsx, (params['xlsx_wide_rows'], params['xlsx_wide_cols'])),
+        'pptx_images': ('images.pptx', generate_pptx, (params['pptx_slides'], params['pptx_images_per_slide'])),
+        'pdf_mixed': ('mixed.pdf', generate_pdf, (params['pdf_text_pages'], params['pdf_scanned_pages'])),
+        'html_large': ('large.html', generate_html, (params['html_sections'],)),
+        'md_nested': ('nested.md', generate_markdown, (params['md_sections'], params['md_depth']))
+    }
+
+    corpus = {}
+    for name, (filename, generator, args) in specs.items():
+        path = os.path.join(corpus_dir, f'{scale}_{filename}')
+        info_path = path + '.json'
+        if os.path.exists(path) and os.path.exists(info_path):
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        else:
+            info = generator(path, *args)
+            with open(info_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+        corpus[name] = dict(info, path=path, bytes=os.path.getsize(path))
+    return corpus
@@ -0,0 +1,218 @@
+"""
+Docling线程配置调优基准测试
+
+在给定的CPU核数下，枚举"每个转换的线程数 × 同时进行的转换数"的组合，
+每个组合同时启动多个工作进程（模拟多个gunicorn worker），每个进程以指定线程数转换若干个PDF，
+测量总吞吐量（页/秒）和单个文档的耗时，找出吞吐量最高的线程划分方式。
+得到的结果用于设置 DOCLING_NUM_THREADS 和 DOCLING_MAX_CONCURRENT
+
+用法：
+    python -m benchmarks.docling_threads
+    python -m benchmarks.docling_threads --cores 8 --docs-per-job 3 --file sample.pdf
+    python -m benchmarks.docling_threads --splits 1x8,2x4,4x2,8x1 --output threads.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from importlib.util import find_spec
+
+from benchmarks.corpus import build_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 工作进程执行的代码：预热转换器（不计时）后输出ready，收到开始信号后依次转换文档并输出每个文档的耗时
+CHILD_CODE = '''
+import json, sys, time
+from app.utils.converter_factory import converter_factory
+from app.utils.docling_pool import docling_pool
+converter = converter_factory.get_converter('docling')
+converter.convert_document({path!r})
+print(json.dumps({{'ready': True, 'accelerator': docling_pool.accelerator}}), flush=True)
+sys.stdin.readline()
+seconds = []
+for _ in range({docs}):
+    start = time.perf_counter()
+    converter.convert_document({path!r})
+    seconds.append(time.perf_counter() - start)
+print(json.dumps({{'seconds': seconds}}), flush=True)
+'''
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_splits(cores):
+    """枚举线程数与并发数之积等于核数的全部组合，例如8核为1x8、2x4、4x2、8x1"""
+    return [(threads, cores // threads) for threads in range(1, cores + 1) if cores % threads == 0]
+
+
+def parse_splits(value):
+    """解析 "线程数x并发数" 列表，例如 "1x8,2x4" """
+    splits = []
+    for item in value.split(','):
+        threads, _, jobs = item.strip().lower().partition('x')
+        if not threads.isdigit() or not jobs.isdigit() or int(threads) < 1 or int(jobs) < 1:
+            raise ValueError(f"无效的线程划分: {item}，格式应为 线程数x并发数，例如 2x4")
+        splits.append((int(threads), int(jobs)))
+    return splits
+
+
+def pdf_page_count(path):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def read_message(process, stage):
+    """读取工作进程输出的JSON消息，跳过第三方库输出到标准输出的其他内容"""
+    for line in process.stdout:
+        if line.startswith('{'):
+            return json.loads(line)
+    raise RuntimeError(f"工作进程{stage}失败，退出码: {process.wait()}")
+
+
+def run_split(threads, jobs, path, docs, workdir, timeout):
+    """
+    以指定的线程划分运行一次测量
+
+    Returns:
+        dict: 吞吐量、单文档耗时等测量结果
+    """
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        DOCLING_NUM_THREADS=str(threads),
+        DOCLING_MAX_CONCURRENT=str(jobs),
+        OMP_NUM_THREADS=str(threads),
+        MKL_NUM_THREADS=str(threads),
+        # 关闭缓存、准入控制和预热，保证每次测量的都是实际推理
+        DOCLING_WARMUP='false',
+        DOCLING_ADMISSION_ENABLED='false',
+        RESULT_CACHE_ENABLED='false',
+        DOCUMENT_CACHE_ENABLED='false',
+        ARTIFACT_STORE_ENABLED='false'
+    )
+    code = CHILD_CODE.format(path=path, docs=docs)
+    processes = [
+        subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env, text=True,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        for _ in range(jobs)
+    ]
+    try:
+        # 所有进程完成预热后同时开始，模型加载耗时不计入结果
+        accelerator = None
+        for process in processes:
+            accelerator = read_message(process, '预热')['accelerator']
+
+        start = time.perf_counter()
+        for process in processes:
+            process.stdin.write('\n')
+            process.stdin.flush()
+        seconds = []
+        for process in processes:
+            seconds.extend(read_message(process, '转换')['seconds'])
+        wall_seconds = time.perf_counter() - start
+
+        for process in processes:
+            process.wait(timeout)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    return {
+        'threads_per_job': threads,
+        'jobs': jobs,
+        'accelerator': accelerator,
+        'documents': len(seconds),
+        'wall_seconds': round(wall_seconds, 3),
+        'document_seconds_median': round(statistics.median(seconds), 3),
+        'document_seconds_max': round(max(seconds), 3),
+        'documents_per_second': round(len(seconds) / wall_seconds, 4)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Docling线程配置调优基准测试')
+    parser.add_argument('--cores', type=int, default=available_cpus(), help='用于Docling转换的CPU核数，默认为本机可用核数')
+    parser.add_argument('--splits', help='要测量的线程划分，格式为 线程数x并发数，多个用逗号分隔，默认枚举乘积等于核数的全部组合')
+    parser.add_argument('--docs-per-job', type=int, default=2, help='每个工作进程转换的文档数')
+    parser.add_argument('--file', help='测试使用的PDF文件，默认使用合成语料中的混合PDF')
+    parser.add_argument('--scale', default='small', help='未指定--file时使用的语料规模')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'file2md_bench_corpus'),
+                        help='语料目录，已生成的语料会被复用')
+    parser.add_argument('--timeout', type=int, default=3600, help='单个组合的超时时间（秒）')
+    parser.add_argument('--output', help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    if find_spec('docling') is None:
+        print('未安装Docling，无法运行线程配置调优', file=sys.stderr)
+        return 1
+
+    try:
+        splits = parse_splits(args.splits) if args.splits else default_splits(max(1, args.cores))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.file:
+        path = os.path.abspath(args.file)
+    else:
+        print(f"生成语料（规模: {args.scale}）: {args.corpus_dir}", file=sys.stderr)
+        path = build_corpus(os.path.abspath(args.corpus_dir), args.scale)['pdf_mixed']['path']
+    pages = pdf_page_count(path)
+
+    # 应用会在当前目录创建日志和缓存目录，在临时工作目录中运行避免污染仓库
+    workdir = tempfile.mkdtemp(prefix='file2md_threads_')
+    results = []
+    print(f"\n{'线程x并发':<12}{'总耗时(s)':>12}{'文档/秒':>10}{'页/秒':>10}{'单文档中位数(s)':>18}{'单文档最大(s)':>16}")
+    for threads, jobs in splits:
+        print(f"测量 {threads}x{jobs} ...", file=sys.stderr)
+        try:
+            result = run_split(threads, jobs, path, max(1, args.docs_per_job), workdir, args.timeout)
+        except Exception as e:
+            print(f"{threads}x{jobs:<10}失败: {str(e)}")
+            results.append({'threads_per_job': threads, 'jobs': jobs, 'error': str(e)})
+            continue
+        result['pages_per_second'] = round(result['documents_per_second'] * pages, 2)
+        results.append(result)
+        print(f"{f'{threads}x{jobs}':<12}{result['wall_seconds']:>12.2f}{result['documents_per_second']:>10.3f}"
+              f"{result['pages_per_second']:>10.2f}{result['document_seconds_median']:>18.2f}{result['document_seconds_max']:>16.2f}")
+
+    measured = [result for result in results if 'error' not in result]
+    best = max(measured, key=lambda result: result['documents_per_second']) if measured else None
+    if best:
+        print(f"\n吞吐量最高的配置: DOCLING_NUM_THREADS={best['threads_per_job']} DOCLING_MAX_CONCURRENT={best['jobs']}"
+              f"（{best['pages_per_second']} 页/秒）")
+
+    if args.output:
+        with open(os.path.abspath(args.output), 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'docling_threads',
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'environment': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpu_count': available_cpus()
+                },
+                'cores': args.cores,
+                'file': path,
+                'pages': pages,
+                'docs_per_job': args.docs_per_job,
+                'results': results,
+                'best': best
+            }, f, ensure_ascii=False, indent=2)
+    return 0 if best else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
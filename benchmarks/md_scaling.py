@@ -0,0 +1,77 @@
+"""
+Markdown问答对解析的规模扩展测试
+
+按倍增的标题数量生成Markdown，测量 parse_markdown_to_qa 的耗时，
+并通过相邻规模耗时比值的对数估算复杂度指数（线性约为1，平方约为2）
+
+用法：
+    python -m benchmarks.md_scaling --start 1000 --steps 6
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+from benchmarks.corpus import markdown_text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(parse, text, repeat):
+    """返回多次解析中最短的耗时和生成的问答对数量"""
+    best = None
+    qa_count = 0
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        qa_count = len(parse(text))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, qa_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Markdown问答对解析的规模扩展测试')
+    parser.add_argument('--start', type=int, default=1000, help='起始标题数量')
+    parser.add_argument('--steps', type=int, default=6, help='倍增次数')
+    parser.add_argument('--depth', type=int, default=6, help='标题最大层级')
+    parser.add_argument('--repeat', type=int, default=3, help='每个规模的运行次数，取最短耗时')
+    parser.add_argument('--output', help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from app.utils.md_processor import parse_markdown_to_qa
+
+    results = []
+    previous = None
+    print(f"{'标题数':>10}{'字符数':>14}{'问答对':>10}{'耗时(s)':>12}{'字符/秒':>16}{'复杂度指数':>12}")
+    for step in range(args.steps):
+        sections = args.start * 2 ** step
+        text = markdown_text(sections, args.depth)
+        seconds, qa_count = measure(parse_markdown_to_qa, text, args.repeat)
+        exponent = None
+        if previous is not None and previous['seconds'] > 0 and seconds > 0:
+            exponent = math.log(seconds / previous['seconds'], sections / previous['sections'])
+        entry = {
+            'sections': sections,
+            'chars': len(text),
+            'qa_pairs': qa_count,
+            'seconds': round(seconds, 5),
+            'chars_per_second': round(len(text) / seconds, 1) if seconds > 0 else None,
+            'exponent': round(exponent, 3) if exponent is not None else None
+        }
+        results.append(entry)
+        previous = entry
+        exponent_text = f"{exponent:.2f}" if exponent is not None else '-'
+        print(f"{sections:>10}{len(text):>14,}{qa_count:>10}{seconds:>12.4f}{entry['chars_per_second'] or 0:>16,.0f}{exponent_text:>12}")
+
+    if args.output:
+        with open(os.path.abspath(args.output), 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'md_scaling', 'results': results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
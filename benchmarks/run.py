@@ -0,0 +1,403 @@
+"""
+转换器性能基准测试
+
+对每条转换路径分别在独立的子进程中运行，记录耗时、峰值内存以及每秒处理的页数/行数/字符数，
+结果输出为JSON，并可与保存的基线结果比较以发现性能回退
+
+用法：
+    python -m benchmarks.run --scale small --output results.json
+    python -m benchmarks.run --baseline baseline.json --fail-on-regression
+    python -m benchmarks.run --only convert_pdf,convert_xlsx_tall --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+import traceback
+import multiprocessing
+
+from benchmarks.corpus import SCALES, build_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_FORMAT_VERSION = 1
+
+# 比较基线时检查的指标
+COMPARED_METRICS = ['wall_seconds', 'peak_rss_mb']
+
+# 小图片OCR用例识别的图片数量（模拟Office文档中嵌入的小图片）
+OCR_SMALL_IMAGES = 30
+
+
+class SkipCase(Exception):
+    """当前环境无法运行该测试用例（例如依赖库未安装）"""
+
+
+def _run_convert_docx(corpus):
+    from app.utils.converters import convert_docx
+    text = convert_docx(corpus['docx_paragraphs']['path'])
+    return {'paragraphs': corpus['docx_paragraphs']['paragraphs'], 'chars': len(text)}
+
+
+def _run_convert_xlsx(corpus_key):
+    def run(corpus):
+        from app.utils import conversion_context
+        from app.utils.converters import convert_xlsx
+        text = convert_xlsx(corpus[corpus_key]['path'])
+        stats = conversion_context.get('xlsx') or {}
+        return {'rows': stats.get('rows', corpus[corpus_key]['rows']), 'chars': len(text)}
+    return run
+
+
+def _run_convert_pptx(corpus):
+    from app.utils import conversion_context
+    from app.utils.converters import convert_pptx
+    text = convert_pptx(corpus['pptx_images']['path'])
+    return {'slides': corpus['pptx_images']['slides'], 'chars': len(text), 'image_ocr': conversion_context.get('image_ocr')}
+
+
+def _run_convert_pdf(corpus):
+    from app.utils import conversion_context
+    from app.utils.converters import convert_pdf
+    text = convert_pdf(corpus['pdf_mixed']['path'])
+    pages = conversion_context.get('pdf_pages') or []
+    return {
+        'pages': corpus['pdf_mixed']['pages'],
+        'ocr_pages': sum(1 for page in pages if page.get('path') == 'ocr'),
+        'chars': len(text)
+    }
+
+
+def _run_convert_to_markdown(corpus):
+    from app.utils.converters import convert_to_markdown
+    text = convert_to_markdown(corpus['docx_paragraphs']['path'])
+    return {'paragraphs': corpus['docx_paragraphs']['paragraphs'], 'chars': len(text)}
+
+
+def _run_docling_markdown(corpus):
+    from app.utils.converter_factory import converter_factory
+    if 'docling' not in converter_factory.get_converter_names():
+        raise SkipCase('Docling不可用')
+    converter = converter_factory.get_converter(converter_name='docling')
+    text = converter.convert_to_markdown(corpus['pdf_mixed']['path'])
+    return {'pages': corpus['pdf_mixed']['pages'], 'chars': len(text)}
+
+
+def _run_ocr_small_images(corpus):
+    from benchmarks.corpus import small_images
+    from app.utils.ocr_utils import ocr_embedded_images, ocr_engine_name
+    engine = ocr_engine_name()
+    if engine is None:
+        raise SkipCase('Tesseract OCR不可用')
+    images = small_images(OCR_SMALL_IMAGES)
+    chars = sum(len(text) for text in ocr_embedded_images(images))
+    return {'images': len(images), 'chars': chars, 'engine': engine}
+
+
+def _serve_directory(directory):
+    """在本地随机端口启动静态文件服务，URL转换测试不依赖外部网络"""
+    import functools
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _run_url_to_markdown(corpus):
+    from app.utils.url_converter import URLConverter
+    path = corpus['html_large']['path']
+    server = _serve_directory(os.path.dirname(path))
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}'
+        text = URLConverter().convert_url_to_markdown(url)
+    finally:
+        server.shutdown()
+    return {'chars': corpus['html_large']['chars'], 'output_chars': len(text)}
+
+
+def _run_parse_markdown_to_qa(corpus):
+    from app.utils.md_processor import parse_markdown_to_qa
+    path = corpus['md_nested']['path']
+    with open(path, 'r', encoding='utf-8') as f:
+        markdown_text = f.read()
+    qa_pairs = parse_markdown_to_qa(markdown_text)
+    return {'chars': len(markdown_text), 'sections': corpus['md_nested']['sections'], 'qa_pairs': len(qa_pairs)}
+
+
+# 测试用例：名称 -> (执行函数, 计算吞吐量使用的单位)
+CASES = {
+    'convert_docx': (_run_convert_docx, 'paragraphs'),
+    'convert_xlsx_tall': (_run_convert_xlsx('xlsx_tall'), 'rows'),
+    'convert_xlsx_wide': (_run_convert_xlsx('xlsx_wide'), 'rows'),
+    'convert_pptx': (_run_convert_pptx, 'slides'),
+    'convert_pdf': (_run_convert_pdf, 'pages'),
+    'convert_to_markdown': (_run_convert_to_markdown, 'paragraphs'),
+    'docling_markdown': (_run_docling_markdown, 'pages'),
+    'ocr_small_images': (_run_ocr_small_images, 'images'),
+    'url_to_markdown': (_run_url_to_markdown, 'chars'),
+    'parse_markdown_to_qa': (_run_parse_markdown_to_qa, 'chars')
+}
+
+
+def _read_status_kb(field):
+    """读取/proc/self/status中的内存字段（KB），非Linux系统返回None"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """重置进程的峰值内存记录（Linux 4.0+），使峰值只反映被测代码"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _case_worker(name, corpus, conn):
+    """子进程：执行单个测试用例并通过管道返回测量结果"""
+    try:
+        run, _ = CASES[name]
+        from app.utils import conversion_context
+        # 预先导入应用模块，导入耗时不计入测试结果
+        import app.utils.converters  # noqa: F401
+        conversion_context.reset()
+
+        peak_reset = _reset_peak_rss()
+        rss_before = _read_status_kb('VmRSS')
+        start = time.perf_counter()
+        units = run(corpus)
+        wall_seconds = time.perf_counter() - start
+
+        peak_kb = _read_status_kb('VmHWM') if peak_reset else None
+        if peak_kb is None:
+            # 无法重置峰值时退回ru_maxrss（包含导入阶段的内存）
+            peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send({
+            'status': 'ok',
+            'wall_seconds': wall_seconds,
+            'peak_rss_mb': peak_kb / 1024,
+            'rss_growth_mb': (peak_kb - rss_before) / 1024 if rss_before is not None else None,
+            'units': units
+        })
+    except SkipCase as e:
+        conn.send({'status': 'skipped', 'reason': str(e)})
+    except Exception as e:
+        conn.send({'status': 'error', 'error': str(e), 'details': traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+def run_case(name, corpus, timeout):
+    """在新的子进程中运行一次测试用例，避免前一个用例的缓存和内存占用影响测量"""
+    mp_context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = mp_context.Pipe(duplex=False)
+    process = mp_context.Process(target=_case_worker, args=(name, corpus, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            process.kill()
+            return {'status': 'error', 'error': f'超时（{timeout}秒）'}
+        return parent_conn.recv()
+    except EOFError:
+        return {'status': 'error', 'error': f'子进程异常退出，退出码: {process.exitcode}'}
+    finally:
+        process.join()
+
+
+def summarize(name, runs):
+    """汇总多次运行的结果：耗时取中位数，内存取最大值"""
+    _, unit = CASES[name]
+    failed = [run for run in runs if run['status'] != 'ok']
+    if failed:
+        return dict(failed[0], runs=len(runs))
+
+    wall_seconds = statistics.median(run['wall_seconds'] for run in runs)
+    units = runs[0]['units']
+    growth = [run['rss_growth_mb'] for run in runs if run['rss_growth_mb'] is not None]
+    result = {
+        'status': 'ok',
+        'runs': len(runs),
+        'wall_seconds': round(wall_seconds, 4),
+        'wall_seconds_min': round(min(run['wall_seconds'] for run in runs), 4),
+        'peak_rss_mb': round(max(run['peak_rss_mb'] for run in runs), 1),
+        'rss_growth_mb': round(max(growth), 1) if growth else None,
+        'unit': unit,
+        'units': units
+    }
+    if units.get(unit) and wall_seconds > 0:
+        result[f'{unit}_per_second'] = round(units[unit] / wall_seconds, 1)
+    if unit != 'chars' and units.get('chars') and wall_seconds > 0:
+        result['chars_per_second'] = round(units['chars'] / wall_seconds, 1)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线结果比较
+
+    Returns:
+        list: 比较记录，regression为True表示该指标超过基线的(1 + threshold)倍
+    """
+    comparisons = []
+    if baseline.get('scale') != results['scale']:
+        print(f"警告：基线规模为 {baseline.get('scale')}，本次规模为 {results['scale']}，比较结果仅供参考", file=sys.stderr)
+
+    for name, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous or current.get('status') != 'ok' or previous.get('status') != 'ok':
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            comparisons.append({
+                'case': name,
+                'metric': metric,
+                'baseline': before,
+                'current': after,
+                'change': round(change, 4),
+                'regression': change > threshold
+            })
+    return comparisons
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(results, comparisons):
+    changes = {(entry['case'], entry['metric']): entry for entry in comparisons}
+    print(f"\n{'用例':<24}{'耗时(s)':>12}{'峰值内存(MB)':>16}{'吞吐量':>24}  基线对比")
+    for name, result in results['cases'].items():
+        if result['status'] != 'ok':
+            print(f"{name:<24}{result['status']}: {result.get('reason') or result.get('error')}")
+            continue
+        unit = result['unit']
+        throughput = f"{result.get(f'{unit}_per_second', 0):,.1f} {unit}/s"
+        notes = []
+        for metric in COMPARED_METRICS:
+            entry = changes.get((name, metric))
+            if entry:
+                flag = ' 回退!' if entry['regression'] else ''
+                notes.append(f"{metric} {entry['change'] * 100:+.1f}%{flag}")
+        print(f"{name:<24}{result['wall_seconds']:>12.3f}{result['peak_rss_mb']:>16.1f}{throughput:>24}  {', '.join(notes)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='转换器性能基准测试')
+    parser.add_argument('--scale', choices=list(SCALES), default='small', help='语料规模')
+    parser.add_argument('--only', help='只运行指定用例，多个用例用逗号分隔')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例的运行次数')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'file2md_bench_corpus'),
+                        help='语料目录，已生成的语料会被复用')
+    parser.add_argument('--output', help='结果JSON输出路径，默认输出到标准输出')
+    parser.add_argument('--baseline', help='用于比较的基线结果JSON')
+    parser.add_argument('--save-baseline', help='将本次结果另存为基线')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回退的相对变化阈值，默认0.2（20%%）')
+    parser.add_argument('--fail-on-regression', action='store_true', help='发现回退时以非零状态码退出')
+    parser.add_argument('--timeout', type=int, default=1800, help='单次运行的超时时间（秒）')
+    args = parser.parse_args(argv)
+    # 运行时会切换工作目录，先将命令行中的路径转换为绝对路径
+    for option in ('corpus_dir', 'output', 'baseline', 'save_baseline'):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    names = list(CASES)
+    if args.only:
+        names = [name.strip() for name in args.only.split(',') if name.strip()]
+        unknown = [name for name in names if name not in CASES]
+        if unknown:
+            parser.error(f"未知的用例: {', '.join(unknown)}，可用用例: {', '.join(CASES)}")
+
+    print(f"生成语料（规模: {args.scale}）: {args.corpus_dir}", file=sys.stderr)
+    corpus = build_corpus(args.corpus_dir, args.scale)
+
+    # 关闭结果缓存、OCR结果缓存和Docling预热，保证每次测量的都是实际转换；
+    # 应用会在当前目录创建日志和缓存目录，切换到临时工作目录避免污染仓库
+    os.environ['RESULT_CACHE_ENABLED'] = 'false'
+    os.environ['OCR_CACHE_ENABLED'] = 'false'
+    os.environ['DOCLING_WARMUP'] = 'false'
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    work_dir = tempfile.mkdtemp(prefix='file2md_bench_')
+    os.chdir(work_dir)
+
+    results = {
+        'format_version': RESULT_FORMAT_VERSION,
+        'scale': args.scale,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': _git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'corpus': {key: {k: v for k, v in info.items() if k != 'path'} for key, info in corpus.items()},
+        'cases': {}
+    }
+
+    for name in names:
+        print(f"运行 {name} ...", file=sys.stderr)
+        runs = []
+        for _ in range(max(1, args.repeat)):
+            run = run_case(name, corpus, args.timeout)
+            runs.append(run)
+            if run['status'] != 'ok':
+                break
+        results['cases'][name] = summarize(name, runs)
+
+    comparisons = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            comparisons = compare(results, json.load(f), args.threshold)
+        results['comparison'] = {
+            'baseline': args.baseline,
+            'threshold': args.threshold,
+            'metrics': comparisons,
+            'regressions': sum(1 for entry in comparisons if entry['regression'])
+        }
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+    _print_table(results, comparisons)
+    if args.fail_on_regression and any(entry['regression'] for entry in comparisons):
+        print('\n检测到性能回退', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
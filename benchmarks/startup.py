@@ -0,0 +1,152 @@
+"""
+工作进程启动耗时基准测试
+
+在新的解释器中执行 `python -X importtime -c "import app"`，记录导入应用的耗时和内存占用，
+按顶层包汇总导入耗时生成导入剖析报告，并检查启动时是否加载了应当延迟导入的文档处理库
+
+用法：
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --top 30 --output startup.json
+    python -m benchmarks.startup --fail-on-heavy
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 应当在第一次使用时才导入的重量级库
+HEAVY_MODULES = [
+    'docx', 'openpyxl', 'pptx', 'PyPDF2', 'markdown', 'PIL', 'pytesseract', 'pdf2image',
+    'pandas', 'numpy', 'markitdown', 'bs4', 'html2text', 'requests', 'docling', 'torch', 'tiktoken'
+]
+
+# 子进程中执行的代码：导入模块后输出耗时、内存和已加载的重量级库
+CHILD_CODE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+status = {{}}
+with open('/proc/self/status') as f:
+    for line in f:
+        key, _, value = line.partition(':')
+        if key in ('VmRSS', 'VmHWM'):
+            status[key] = int(value.split()[0]) / 1024
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': seconds, 'rss_mb': status.get('VmRSS'), 'peak_rss_mb': status.get('VmHWM'),
+                  'modules': len(sys.modules), 'heavy_modules': heavy}}))
+'''
+
+
+def parse_importtime(stderr):
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        list: 每项为 (模块名, 自身耗时微秒, 累计耗时微秒)
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头行
+        entries.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def run_once(module, workdir):
+    """在新的解释器中导入模块一次"""
+    env = dict(os.environ, DOCLING_WARMUP='false', PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE='1')
+    code = CHILD_CODE.format(module=module, heavy=HEAVY_MODULES)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=300
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr[-4000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(completed.stderr)
+    return result
+
+
+def profile_report(imports, top):
+    """按顶层包汇总自身耗时，并列出累计耗时最长的模块"""
+    packages = {}
+    for name, self_us, _ in imports:
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0) + self_us
+    by_package = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    by_module = sorted(imports, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        'packages': [{'package': name, 'self_ms': round(us / 1000, 2)} for name, us in by_package],
+        'modules': [{'module': name, 'cumulative_ms': round(cum / 1000, 2)} for name, _, cum in by_module]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='工作进程启动耗时基准测试')
+    parser.add_argument('--module', default='app', help='导入的模块，默认app（与gunicorn工作进程启动时一致）')
+    parser.add_argument('--repeat', type=int, default=5, help='运行次数，耗时取中位数')
+    parser.add_argument('--top', type=int, default=20, help='导入剖析报告中列出的包和模块数量')
+    parser.add_argument('--output', help='结果JSON输出路径')
+    parser.add_argument('--fail-on-heavy', action='store_true', help='启动时加载了重量级库时以非零状态码退出')
+    args = parser.parse_args(argv)
+
+    # 应用导入时会在当前目录创建缓存等目录，在临时目录中运行
+    workdir = tempfile.mkdtemp(prefix='file2md_startup_')
+    try:
+        # 第一次运行用于生成字节码缓存，不计入结果
+        run_once(args.module, workdir)
+        runs = [run_once(args.module, workdir) for _ in range(args.repeat)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 导入剖析报告使用耗时为中位数的那次运行
+    runs.sort(key=lambda run: run['seconds'])
+    median_run = runs[len(runs) // 2]
+    result = {
+        'benchmark': 'startup',
+        'module': args.module,
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'import_seconds': round(statistics.median(run['seconds'] for run in runs), 4),
+        'import_seconds_min': round(runs[0]['seconds'], 4),
+        'rss_mb': round(max(run['rss_mb'] for run in runs), 1),
+        'peak_rss_mb': round(max(run['peak_rss_mb'] for run in runs), 1),
+        'modules_loaded': median_run['modules'],
+        'heavy_modules': median_run['heavy_modules'],
+        'profile': profile_report(median_run['imports'], args.top)
+    }
+
+    print(f"导入 {args.module}: 中位数 {result['import_seconds'] * 1000:.1f}ms，"
+          f"RSS {result['rss_mb']:.1f}MB，已加载模块 {result['modules_loaded']} 个")
+    print(f"\n{'包':<32}{'自身耗时(ms)':>14}")
+    for entry in result['profile']['packages']:
+        print(f"{entry['package']:<32}{entry['self_ms']:>14.2f}")
+    print(f"\n{'模块':<48}{'累计耗时(ms)':>14}")
+    for entry in result['profile']['modules']:
+        print(f"{entry['module']:<48}{entry['cumulative_ms']:>14.2f}")
+    if result['heavy_modules']:
+        print(f"\n启动时加载的重量级库: {', '.join(result['heavy_modules'])}")
+    else:
+        print("\n启动时未加载任何重量级库")
+
+    if args.output:
+        with open(os.path.abspath(args.output), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.fail_on_heavy and result['heavy_modules']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import io
+
+from app.utils.md_processor import MarkdownChunker
+
+
+def test_overlap_alone_is_not_emitted_as_chunk():
+    markdown = "# A\nintro\n## B\n```\n# not heading\n```\nbody " + "word " * 500
+    chunks = list(MarkdownChunker(max_size=300, overlap=50).iter_chunks(markdown))
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk['end'] > previous['end']
+    for chunk in chunks:
+        assert chunk['answer'].count('```') % 2 == 0
+
+
+def test_split_long_line_keeps_overlap():
+    markdown = "# A\n" + "word " * 500
+    chunker = MarkdownChunker(max_size=300, overlap=50)
+    chunks = list(chunker.iter_chunks(markdown))
+
+    assert len(chunks) > 2
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk['start'] < previous['end']
+    for chunk in chunks:
+        assert chunk['size'] <= chunker.max_size
+        assert chunk['answer'] == markdown[chunk['start']:chunk['end']]
+
+
+def test_crlf_offsets_refer_to_source():
+    markdown = "# A\r\nfirst line\r\nsecond line\r\n\r\n## B\r\nthird line\r\n"
+    stream = io.TextIOWrapper(io.BytesIO(markdown.encode('utf-8')), encoding='utf-8', newline='')
+    chunks = list(MarkdownChunker(max_size=300, overlap=0).iter_chunks(stream))
+
+    assert len(chunks) == 2
+    for chunk in chunks:
+        assert chunk['answer'].replace('\n', '\r\n') == markdown[chunk['start']:chunk['end']]